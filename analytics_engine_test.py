@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Equivalence test for the vectorized consumption analytics engine.
+
+Builds random monthly series and compares serialize_analytics (NumPy engine)
+with build_consumption_analytics (pure-Python reference) on every field the
+reference produces. The cases include missing months, a whole empty year on
+either side, months and years with zero or (legacy) negative accommodation,
+and clients that share a series with others.
+
+    python analytics_engine_test.py [--series 200] [--seed 0]
+"""
+import argparse
+import math
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+from services.analytics import CONSUMPTION_FIELDS, CONSUMPTION_METRICS, build_consumption_analytics  # noqa: E402
+from services.consumption_engine import ConsumptionSeries, serialize_analytics  # noqa: E402
+
+YEAR = 2024
+CLIENTS = ["otel-a", "otel-b", "otel-c"]
+
+
+def random_accommodation(shape):
+    if shape == "zero_accommodation":
+        return 0
+    if shape == "negative_accommodation":
+        return random.randint(-50, -1)
+    return random.randint(0, 2500)
+
+
+def random_row(client_id, year, month, shape="full"):
+    return {
+        "client_id": client_id,
+        "year": year,
+        "month": month,
+        "electricity": round(random.uniform(0, 90000), 2),
+        "water": round(random.uniform(0, 3000), 2),
+        "natural_gas": round(random.uniform(0, 2000), 2),
+        "coal": random.choice([0.0, round(random.uniform(0, 600), 2)]),
+        "accommodation_count": random_accommodation(shape)
+    }
+
+
+def random_year(client_id, year, shape):
+    """Rows of one year: 'empty', 'full', 'zero_accommodation', 'negative_accommodation' or 'sparse' (random months missing)"""
+    if shape == "empty":
+        return []
+    months = range(1, 13) if shape != "sparse" else sorted(random.sample(range(1, 13), random.randint(1, 11)))
+    return [random_row(client_id, year, month, shape) for month in months]
+
+
+def close(a, b) -> bool:
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+
+
+def compare(expected, actual, path=""):
+    """Every value of the reference must match; extra engine fields are ignored"""
+    if isinstance(expected, dict):
+        for key, value in expected.items():
+            assert key in actual, f"{path}.{key} missing"
+            compare(value, actual[key], f"{path}.{key}")
+    elif isinstance(expected, list):
+        assert len(expected) == len(actual), f"{path}: {len(actual)} items, expected {len(expected)}"
+        for i, (e, a) in enumerate(zip(expected, actual)):
+            compare(e, a, f"{path}[{i}]")
+    elif isinstance(expected, (int, float)) and not isinstance(expected, bool):
+        assert close(expected, actual), f"{path}: {actual} != {expected}"
+    else:
+        assert expected == actual, f"{path}: {actual!r} != {expected!r}"
+
+
+class AnalyticsEngineTester:
+    SHAPES = ["full", "sparse", "empty", "zero_accommodation", "negative_accommodation"]
+
+    def __init__(self, series_count, seed):
+        self.series_count = series_count
+        self.seed = seed
+        self.checked = 0
+
+    def check_case(self, current_shape, previous_shape):
+        rows = {
+            client_id: (random_year(client_id, YEAR, current_shape), random_year(client_id, YEAR - 1, previous_shape))
+            for client_id in CLIENTS
+        }
+        series = ConsumptionSeries.from_rows(
+            [row for current, previous in rows.values() for row in current + previous], [YEAR - 1, YEAR], CLIENTS
+        )
+        for client_id, (current, previous) in rows.items():
+            expected = build_consumption_analytics(YEAR, current, previous)
+            actual = serialize_analytics(series, client_id, YEAR)
+            compare(expected, actual, f"{client_id} {current_shape}/{previous_shape}")
+            self.checked += 1
+
+    def check_random_series(self):
+        for i in range(self.series_count):
+            self.check_case(random.choice(self.SHAPES), random.choice(self.SHAPES))
+        print(f"✅ {self.series_count} random series match the reference")
+
+    def check_edge_cases(self):
+        for current_shape in self.SHAPES:
+            for previous_shape in self.SHAPES:
+                self.check_case(current_shape, previous_shape)
+        print(f"✅ Every combination of {', '.join(self.SHAPES)} years matches the reference")
+
+    def check_zero_accommodation(self):
+        for shape in ("zero_accommodation", "negative_accommodation"):
+            rows = random_year("otel-a", YEAR, shape)
+            actual = serialize_analytics(ConsumptionSeries.from_rows(rows, [YEAR - 1, YEAR], ["otel-a"]), "otel-a", YEAR)
+            per_person = [actual["yearly_per_person"]["current_year"]] + [month["current_year_per_person"] for month in actual["monthly_comparison"]]
+            assert all(values[metric] == 0 for values in per_person for metric in CONSUMPTION_METRICS), f"Per-person values with {shape} must be 0"
+            assert actual["yearly_energy"]["current_year"]["per_person_kwh"] == 0, f"Energy per person with {shape} must be 0"
+            assert set(actual["yearly_totals"]["current_year"]) == set(CONSUMPTION_FIELDS)
+        print("✅ Zero or negative accommodation gives 0 per person instead of a division")
+
+    def run_all_tests(self):
+        random.seed(self.seed)
+        try:
+            self.check_edge_cases()
+            self.check_random_series()
+            self.check_zero_accommodation()
+            print(f"\n=== TEST SUMMARY ===\n✅ Analytics engine: Success ({self.checked} client comparisons)")
+            return True
+        except AssertionError as e:
+            print(f"❌ {e}\n\n=== TEST SUMMARY ===\n❌ Analytics engine: Failed (seed {self.seed})")
+            return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the vectorized analytics engine with the reference implementation")
+    parser.add_argument("--series", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sys.exit(0 if AnalyticsEngineTester(args.series, args.seed).run_all_tests() else 1)
@@ -1,22 +1,28 @@
 import os
 import uuid
+import asyncio
 import logging
 from datetime import datetime, timedelta
-from typing import List, Optional
-from fastapi import FastAPI, APIRouter, HTTPException, status, Depends, UploadFile, File, Form
+from typing import Dict, List, Optional
+from fastapi import FastAPI, APIRouter, HTTPException, status, Depends, UploadFile, File, Form, Query, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware import Middleware
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from pathlib import Path
 from dotenv import load_dotenv
 import json
 from enum import Enum
 import re
+import csv
+import io
+import hashlib
+import shutil
 import jwt
-from jwt import PyJWKClient
 import httpx
 import requests
 
@@ -25,12 +31,37 @@ try:
     import sys
     import os
     sys.path.append(os.path.dirname(__file__))
-    from services.gcs import gcs_service
+    from services.gcs import gcs_executor, gcs_service
     logging.info("✅ GCS service imported successfully")
 except Exception as e:
     logging.error(f"❌ Failed to import GCS service: {e}")
     gcs_service = None
 
+from services.jwks import JWKSKeyStore
+from services.cache import TTLCache
+from services.cache_versions import (
+    ALL_CLIENTS, ALL_CONSUMPTIONS, bump_versions, client_version, client_year_version, read_versions
+)
+from services.metrics import collect_metrics, register_metrics_hook
+from services.indexes import ensure_indexes, missing_required_indexes, require_indexes
+from services.consumption_repair import repair_consumptions
+from services.pagination import paginate
+from services.export import ndjson_stream, gzip_stream
+from services.consumption_engine import DEFAULT_ENERGY_FACTORS, serialize_analytics
+from services.rollups import (
+    SERIES_FIELDS, load_rollup_series, refresh_rollups, ensure_rollups, series_from_rollups, drop_duplicate_rollups
+)
+from services.portfolio import PORTFOLIO_SORT_KEYS, portfolio_pipeline, compute_portfolio, serialize_portfolio
+from services.carbon import (
+    get_active_factors, recompute_footprints, ensure_footprints, summarize_footprints, portfolio_footprint_pipeline
+)
+from services.carbon_jobs import create_factor_version, create_recompute_job, run_recompute_job, resume_recompute_jobs
+from services.analytics import CONSUMPTION_METRICS, MAX_CONSUMPTION_YEAR, MIN_CONSUMPTION_YEAR
+from services.anomalies import ANOMALY_BASES, nightly_anomaly_scan
+from services.forecast import MAX_HORIZON, forecast_series, forecast_years, latest_origin, serialize_forecast
+from services.trends import GRANULARITIES, serialize_trends
+from services.gaps import MAX_GAP_MONTHS, build_gap_report, gap_pipeline, month_index, month_key, parse_month
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -42,6 +73,18 @@ db = client[os.environ['DB_NAME']]
 # Clerk configuration
 CLERK_SECRET_KEY = os.environ.get('CLERK_SECRET_KEY')
 CLERK_JWKS_URL = os.environ.get('CLERK_JWKS_URL')
+JWKS_REFRESH_SECONDS = int(os.environ.get('JWKS_REFRESH_SECONDS', 3600))
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+STATS_CACHE_TTL = float(os.environ.get('STATS_CACHE_TTL', 5))
+ANALYTICS_CACHE_TTL = float(os.environ.get('ANALYTICS_CACHE_TTL', 300))
+# Calorific values for kWh-equivalent energy in the analytics
+NATURAL_GAS_KWH_PER_M3 = float(os.environ.get('NATURAL_GAS_KWH_PER_M3', 10.64))
+COAL_KWH_PER_KG = float(os.environ.get('COAL_KWH_PER_KG', 6.98))
+ANOMALY_SCAN_HOUR = int(os.environ.get('ANOMALY_SCAN_HOUR', 2))  # UTC
+# Background retries of a rollup/footprint refresh that failed after a consumption write
+REFRESH_RETRIES = int(os.environ.get('REFRESH_RETRIES', 5))
+REFRESH_RETRY_DELAY = float(os.environ.get('REFRESH_RETRY_DELAY', 2))  # seconds, doubled per attempt
 
 # Configure FastAPI for large file uploads
 app = FastAPI(
@@ -82,7 +125,109 @@ api_router = APIRouter(prefix="/api")
 
 # Security
 security = HTTPBearer()
-jwks_client = PyJWKClient(CLERK_JWKS_URL)
+jwks_key_store = JWKSKeyStore(CLERK_JWKS_URL, refresh_interval=JWKS_REFRESH_SECONDS)
+
+# Already-verified tokens keyed by SHA-256 of the token, each kept until its own exp
+verified_token_cache = TTLCache("verified_tokens", maxsize=TOKEN_CACHE_SIZE)
+
+# User records keyed by clerk_user_id; every write to a user invalidates or refreshes its entry
+user_cache = TTLCache("users", maxsize=10000, ttl=USER_CACHE_TTL)
+register_metrics_hook("user_lookups", lambda: {
+    "hit_ratio": user_cache.stats()["hit_ratio"],
+    "saved_round_trips": user_cache.hits
+})
+
+# Admin dashboard statistics, held briefly so refresh storms share one set of queries
+stats_cache = TTLCache("stats", maxsize=1, ttl=STATS_CACHE_TTL)
+
+ENERGY_FACTORS = {**DEFAULT_ENERGY_FACTORS, "natural_gas": NATURAL_GAS_KWH_PER_M3, "coal": COAL_KWH_PER_KG}
+
+# Cached consumption results carry the cache_versions they were computed under in their key, so a write on
+# any worker retires them everywhere (see invalidate_analytics); superseded entries age out with the TTL.
+# /consumptions/analytics results keyed by (client_id, year, columnar, versions)
+analytics_cache = TTLCache("consumption_analytics", maxsize=5000, ttl=ANALYTICS_CACHE_TTL)
+# Admin portfolio measures keyed by (year, versions); sorting and top-k are applied per request
+portfolio_cache = TTLCache("portfolio_analytics", maxsize=50, ttl=ANALYTICS_CACHE_TTL)
+# Fitted forecasts (MAX_HORIZON months) keyed by (client_id or PORTFOLIO_FORECAST for every client, versions)
+forecast_cache = TTLCache("consumption_forecasts", maxsize=5000, ttl=ANALYTICS_CACHE_TTL)
+PORTFOLIO_FORECAST = "*"
+# Gap reports keyed by (start, end month index, versions)
+gap_cache = TTLCache("consumption_gaps", maxsize=50, ttl=ANALYTICS_CACHE_TTL)
+
+def check_consumption_years(*years: int):
+    """400 for years outside the accepted range; reads would otherwise materialize rollups for them"""
+    for year in years:
+        if not MIN_CONSUMPTION_YEAR <= year <= MAX_CONSUMPTION_YEAR:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Year must be between {MIN_CONSUMPTION_YEAR} and {MAX_CONSUMPTION_YEAR}"
+            )
+
+async def invalidate_analytics(client_id: str, years):
+    """
+    Make every worker stop using cached results that read the given years (analytics of year + 1 reads year too).
+    Cache keys carry the versions read in cached_versions, so bumping them here reaches all processes.
+    """
+    keys = [ALL_CONSUMPTIONS, client_version(client_id)] + [client_year_version(client_id, year) for year in years]
+    try:
+        await bump_versions(db, keys)
+    except Exception as e:
+        logging.error(f"❌ Invalidating cached analytics of {client_id} {sorted(years)} failed, "
+                      f"they may be served for up to {ANALYTICS_CACHE_TTL:.0f}s: {e}")
+
+async def clients_changed():
+    """Retire cached reports that list clients (portfolio, gaps) on every worker"""
+    try:
+        await bump_versions(db, [ALL_CLIENTS])
+    except Exception as e:
+        logging.error(f"❌ Invalidating cached client reports failed, they may be served for up to {ANALYTICS_CACHE_TTL:.0f}s: {e}")
+
+async def cached_versions(*keys: str) -> tuple:
+    return await read_versions(db, keys)
+
+# Refreshes retrying in the background; referenced here so they are not garbage-collected
+refresh_retries = set()
+
+async def refresh_derived(written: Dict[str, set]):
+    """Rollups and footprints of every written client over the written years, in one pass"""
+    years = set().union(*written.values())
+    await refresh_rollups(db, list(written), years)
+    await recompute_footprints(db, list(written), years)
+
+def describe_written(written: Dict[str, set]) -> str:
+    return ", ".join(f"{client_id} {sorted(years)}" for client_id, years in written.items())
+
+async def retry_refresh(written: Dict[str, set]):
+    for attempt in range(REFRESH_RETRIES):
+        await asyncio.sleep(REFRESH_RETRY_DELAY * 2 ** attempt)
+        try:
+            await refresh_derived(written)
+            for client_id, years in written.items():
+                await invalidate_analytics(client_id, years)
+            logging.info(f"✅ Refreshed rollups and footprints of {describe_written(written)} on retry {attempt + 1}")
+            return
+        except Exception as e:
+            logging.warning(f"Refresh retry {attempt + 1} for {describe_written(written)} failed: {e}")
+    logging.error(f"❌ Rollups and footprints of {describe_written(written)} are stale; "
+                  f"run python -m services.rollups rebuild")
+
+async def consumptions_changed(written: Dict[str, set]):
+    """
+    Refresh the rollups and carbon footprints of the written client-years, then drop cached results that read them.
+    The writes are already committed, so a failed refresh is retried in the background instead of failing the request.
+    """
+    try:
+        await refresh_derived(written)
+    except Exception as e:
+        logging.error(f"❌ Refreshing rollups and footprints of {describe_written(written)} failed, retrying: {e}")
+        task = asyncio.create_task(retry_refresh(written))
+        refresh_retries.add(task)
+        task.add_done_callback(refresh_retries.discard)
+    for client_id, years in written.items():
+        await invalidate_analytics(client_id, years)
+
+async def consumption_changed(client_id: str, years):
+    await consumptions_changed({client_id: set(years)})
 
 # Enums
 class ProjectStage(str, Enum):
@@ -147,6 +292,9 @@ class Client(BaseModel):
     current_stage: ProjectStage = ProjectStage.STAGE_1
     services_completed: List[ServiceType] = []
     carbon_footprint: Optional[float] = None
+    # kg CO2e of the latest year with consumption data, maintained by the carbon engine
+    calculated_carbon_footprint: Optional[float] = None
+    calculated_carbon_footprint_year: Optional[int] = None
     sustainability_score: Optional[int] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -165,15 +313,19 @@ class Consumption(BaseModel):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 class ConsumptionInput(BaseModel):
-    year: int
+    year: int = Field(ge=MIN_CONSUMPTION_YEAR, le=MAX_CONSUMPTION_YEAR)
     month: int
     electricity: float = 0.0
     water: float = 0.0  
     natural_gas: float = 0.0
     coal: float = 0.0
-    accommodation_count: int = 0
+    accommodation_count: int = Field(0, ge=0)
     client_id: Optional[str] = None  # Optional for admin users
 
+class EmissionFactorsInput(BaseModel):
+    factors: Dict[str, float]  # kg CO2e per unit of each consumption metric
+    note: Optional[str] = None
+
 class ClientCreate(BaseModel):
     name: str
     hotel_name: str
@@ -236,8 +388,14 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
         token = credentials.credentials
         logging.info(f"🔍 Received token: {token[:50]}...")
         
-        # Get the signing key from Clerk
-        signing_key = jwks_client.get_signing_key_from_jwt(token)
+        # Skip signature verification for tokens we already verified
+        token_hash = hashlib.sha256(token.encode()).hexdigest()
+        cached_user_id = verified_token_cache.get(token_hash)
+        if cached_user_id:
+            return cached_user_id
+        
+        # Get the signing key from the cached Clerk key set
+        signing_key = await jwks_key_store.get_signing_key(token)
         logging.info("✅ Got signing key from Clerk")
         
         # Decode and verify the token
@@ -253,6 +411,9 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
         if not clerk_user_id:
             raise HTTPException(status_code=401, detail="Invalid token: missing user ID")
         
+        if payload.get("exp"):
+            verified_token_cache.set(token_hash, clerk_user_id, expires_at=payload["exp"])
+        
         logging.info(f"✅ Token verified successfully for user: {clerk_user_id}")
         return clerk_user_id
         
@@ -264,13 +425,19 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
         raise HTTPException(status_code=401, detail=f"Token verification failed: {str(e)}")
 
 async def get_current_user(clerk_user_id: str = Depends(verify_token)):
+    cached_user = user_cache.get(clerk_user_id)
+    if cached_user:
+        return cached_user
+    
     user = await db.users.find_one({"clerk_user_id": clerk_user_id})
     if not user:
         logging.error(f"❌ User not found in database for clerk_user_id: {clerk_user_id}")
         raise HTTPException(status_code=404, detail="User not found in database")
     
     logging.info(f"✅ User found: {user.get('role')} - {user.get('name', 'Unknown')}")
-    return User(**user)
+    current_user = User(**user)
+    user_cache.set(clerk_user_id, current_user)
+    return current_user
 
 async def get_admin_user(current_user: User = Depends(get_current_user)):
     if current_user.role != UserRole.ADMIN:
@@ -281,6 +448,21 @@ async def get_client_access(current_user: User = Depends(get_current_user)):
     # Both admin and client can access, but with different permissions
     return current_user
 
+# Pagination
+# Listings are keyset-paginated; the next page's cursor is returned in the X-Next-Cursor header
+CREATED_ORDER = [("created_at", ASCENDING), ("id", ASCENDING)]
+CONSUMPTION_ORDER = [("year", DESCENDING), ("month", DESCENDING), ("id", DESCENDING)]
+
+async def fetch_page(collection, query: dict, sort, limit: int, cursor: Optional[str], response: Response):
+    try:
+        rows, next_cursor = await paginate(collection, query, sort, limit, cursor, projection={"_id": 0})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
 # Routes
 @api_router.get("/")
 async def root():
@@ -297,6 +479,7 @@ async def register_user(user_data: UserCreate):
     user_dict = user_data.dict()
     user = User(**user_dict)
     await db.users.insert_one(user.dict())
+    user_cache.set(user.clerk_user_id, user)
     return user
 
 @api_router.get("/auth/me", response_model=User)
@@ -319,8 +502,9 @@ async def update_current_user(
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
-    updated_user = await db.users.find_one({"clerk_user_id": current_user.clerk_user_id})
-    return User(**updated_user)
+    updated_user = User(**await db.users.find_one({"clerk_user_id": current_user.clerk_user_id}))
+    user_cache.set(updated_user.clerk_user_id, updated_user)
+    return updated_user
 
 # Client Management (Enhanced for self-registration)
 @api_router.post("/clients", response_model=Client)
@@ -340,10 +524,12 @@ async def create_client(
                 {"clerk_user_id": current_user.clerk_user_id},
                 {"$unset": {"client_id": ""}, "$set": {"updated_at": datetime.utcnow()}}
             )
+            user_cache.invalidate(current_user.clerk_user_id)
     
     client_dict = client_data.dict()
     client = Client(**client_dict)
     await db.clients.insert_one(client.dict())
+    await clients_changed()
     
     # If client user is creating their own record, update their user record
     if current_user.role == UserRole.CLIENT:
@@ -351,16 +537,22 @@ async def create_client(
             {"clerk_user_id": current_user.clerk_user_id},
             {"$set": {"client_id": client.id, "updated_at": datetime.utcnow()}}
         )
+        user_cache.invalidate(current_user.clerk_user_id)
     
     return client
 
 @api_router.get("/clients", response_model=List[Client])
-async def get_clients(current_user: User = Depends(get_current_user)):
+async def get_clients(
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
     logging.info(f"🔍 GET /clients called by user: {current_user.role} - {current_user.name} - client_id: {current_user.client_id}")
     
     if current_user.role == UserRole.ADMIN:
         # Admin can see all clients
-        clients = await db.clients.find().to_list(1000)
+        clients = await fetch_page(db.clients, {}, CREATED_ORDER, limit, cursor, response)
         logging.info(f"✅ Admin user - returning {len(clients)} clients")
         return [Client(**client) for client in clients]
     else:
@@ -400,6 +592,7 @@ async def update_client(
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Client not found")
+    await clients_changed()
     
     updated_client = await db.clients.find_one({"id": client_id})
     return Client(**updated_client)
@@ -409,6 +602,7 @@ async def delete_client(client_id: str, current_user: User = Depends(get_admin_u
     result = await db.clients.delete_one({"id": client_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Client not found")
+    await clients_changed()
     return {"message": "Client deleted successfully"}
 
 # Document Management
@@ -440,22 +634,33 @@ async def create_document(
     return document
 
 @api_router.get("/documents", response_model=List[Document])
-async def get_all_documents(current_user: User = Depends(get_current_user)):
+async def get_all_documents(
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
     """Get all documents (Admin only) or user's documents (Client)"""
     if current_user.role == UserRole.ADMIN:
         # Admin can see all documents
-        documents = await db.documents.find().to_list(1000)
+        documents = await fetch_page(db.documents, {}, CREATED_ORDER, limit, cursor, response)
         return [Document(**doc) for doc in documents]
     else:
         # Client can only see their own documents
         if not current_user.client_id:
             return []
         
-        documents = await db.documents.find({"client_id": current_user.client_id}).to_list(1000)
+        documents = await fetch_page(db.documents, {"client_id": current_user.client_id}, CREATED_ORDER, limit, cursor, response)
         return [Document(**doc) for doc in documents]
 
 @api_router.get("/documents/{client_id}", response_model=List[Document])
-async def get_client_documents(client_id: str, current_user: User = Depends(get_current_user)):
+async def get_client_documents(
+    client_id: str,
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
     """Get documents for a specific client"""
     # Check permissions
     if current_user.role == UserRole.ADMIN:
@@ -466,7 +671,7 @@ async def get_client_documents(client_id: str, current_user: User = Depends(get_
         if current_user.client_id != client_id:
             raise HTTPException(status_code=403, detail="Access denied: Cannot view other clients' documents")
     
-    documents = await db.documents.find({"client_id": client_id}).to_list(1000)
+    documents = await fetch_page(db.documents, {"client_id": client_id}, CREATED_ORDER, limit, cursor, response)
     return [Document(**doc) for doc in documents]
 
 @api_router.delete("/documents/{document_id}")
@@ -531,12 +736,18 @@ async def create_training(
     return training
 
 @api_router.get("/trainings/{client_id}", response_model=List[Training])
-async def get_client_trainings(client_id: str, current_user: User = Depends(get_client_access)):
+async def get_client_trainings(
+    client_id: str,
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_client_access)
+):
     # Check permissions
     if current_user.role != UserRole.ADMIN and current_user.client_id != client_id:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    trainings = await db.trainings.find({"client_id": client_id}).to_list(1000)
+    trainings = await fetch_page(db.trainings, {"client_id": client_id}, CREATED_ORDER, limit, cursor, response)
     return [Training(**training) for training in trainings]
 
 @api_router.put("/trainings/{training_id}")
@@ -558,23 +769,32 @@ async def update_training_status(
 async def get_statistics(current_user: User = Depends(get_current_user)):
     if current_user.role == UserRole.ADMIN:
         # Admin sees all statistics
-        total_clients = await db.clients.count_documents({})
-        stage_1_clients = await db.clients.count_documents({"current_stage": "I.Aşama"})
-        stage_2_clients = await db.clients.count_documents({"current_stage": "II.Aşama"})
-        stage_3_clients = await db.clients.count_documents({"current_stage": "III.Aşama"})
-        total_documents = await db.documents.count_documents({})
-        total_trainings = await db.trainings.count_documents({})
+        cached_stats = stats_cache.get("admin")
+        if cached_stats:
+            return cached_stats
         
-        return {
-            "total_clients": total_clients,
+        # One grouped aggregation over clients plus the two counts, all in parallel
+        stage_counts, total_documents, total_trainings = await asyncio.gather(
+            db.clients.aggregate([
+                {"$group": {"_id": "$current_stage", "count": {"$sum": 1}}}
+            ]).to_list(None),
+            db.documents.count_documents({}),
+            db.trainings.count_documents({})
+        )
+        stages = {stage["_id"]: stage["count"] for stage in stage_counts}
+        
+        statistics = {
+            "total_clients": sum(stages.values()),
             "stage_distribution": {
-                "stage_1": stage_1_clients,
-                "stage_2": stage_2_clients,
-                "stage_3": stage_3_clients
+                "stage_1": stages.get("I.Aşama", 0),
+                "stage_2": stages.get("II.Aşama", 0),
+                "stage_3": stages.get("III.Aşama", 0)
             },
             "total_documents": total_documents,
             "total_trainings": total_trainings
         }
+        stats_cache.set("admin", statistics)
+        return statistics
     else:
         # Client sees only their own statistics
         if not current_user.client_id:
@@ -585,9 +805,11 @@ async def get_statistics(current_user: User = Depends(get_current_user)):
                 "total_trainings": 0
             }
         
-        client = await db.clients.find_one({"id": current_user.client_id})
-        client_documents = await db.documents.count_documents({"client_id": current_user.client_id})
-        client_trainings = await db.trainings.count_documents({"client_id": current_user.client_id})
+        client, client_documents, client_trainings = await asyncio.gather(
+            db.clients.find_one({"id": current_user.client_id}),
+            db.documents.count_documents({"client_id": current_user.client_id}),
+            db.trainings.count_documents({"client_id": current_user.client_id})
+        )
         
         current_stage = client.get("current_stage", "I.Aşama") if client else "I.Aşama"
         stage_distribution = {"stage_1": 0, "stage_2": 0, "stage_3": 0}
@@ -606,6 +828,59 @@ async def get_statistics(current_user: User = Depends(get_current_user)):
             "total_trainings": client_trainings
         }
 
+# Bulk Export (NDJSON streamed straight from the cursor)
+EXPORT_COLLECTIONS = {"clients", "documents", "trainings", "consumptions"}
+EXPORT_BATCH_SIZE = 1000
+
+@api_router.get("/export/{collection}")
+async def export_collection(
+    collection: str,
+    gzip: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """Stream every row the user may see as NDJSON, optionally gzipped"""
+    if collection not in EXPORT_COLLECTIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown export collection: {collection}")
+    
+    # Same role filters as the list endpoints
+    if current_user.role == UserRole.ADMIN:
+        query = {}
+    elif not current_user.client_id:
+        query = None
+    elif collection == "clients":
+        query = {"id": current_user.client_id}
+    else:
+        query = {"client_id": current_user.client_id}
+    
+    logging.info(f"📤 Export {collection} requested by {current_user.role} - gzip: {gzip}")
+    
+    async def rows():
+        if query is None:
+            return
+        cursor = db[collection].find(query, {"_id": 0}).batch_size(EXPORT_BATCH_SIZE)
+        async for chunk in ndjson_stream(cursor):
+            yield chunk
+    
+    filename = f"{collection}.ndjson"
+    body = rows()
+    media_type = "application/x-ndjson"
+    if gzip:
+        filename += ".gz"
+        body = gzip_stream(body)
+        media_type = "application/gzip"
+    
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# Runtime Metrics (Admin only)
+@api_router.get("/metrics")
+async def get_metrics(current_user: User = Depends(get_admin_user)):
+    """Cache hit/miss counters and other in-process metrics"""
+    return collect_metrics()
+
 # File Upload Endpoints with Google Cloud Storage
 @api_router.post("/upload-document")
 async def upload_document(
@@ -643,14 +918,13 @@ async def upload_document(
             raise HTTPException(status_code=404, detail="Client not found")
     
     try:
-        # Read file content
-        file_content = await file.read()
-        
-        # Upload to Google Cloud Storage
-        upload_result = await gcs_service.upload_file(
-            file_content=file_content,
+        # Stream the spooled upload to Google Cloud Storage without reading it into memory
+        await file.seek(0)
+        upload_result = await gcs_service.upload_stream(
+            file.file,
             filename=file.filename,
-            content_type=file.content_type or "application/octet-stream"
+            content_type=file.content_type or "application/octet-stream",
+            size=file.size
         )
         
         # Create document record in database
@@ -836,7 +1110,6 @@ async def finalize_upload(
         upload_id = upload_data.get("upload_id")
         total_chunks = upload_data.get("total_chunks")
         filename = upload_data.get("filename")
-        file_size = upload_data.get("file_size")
         
         logging.info(f"🔗 Finalizing upload: {upload_id} with {total_chunks} chunks")
         
@@ -859,24 +1132,14 @@ async def finalize_upload(
             for chunk in chunks:
                 chunk_path = chunk["chunk_path"]
                 with open(chunk_path, "rb") as chunk_file:
-                    final_file.write(chunk_file.read())
+                    shutil.copyfileobj(chunk_file, final_file)
         
-        # Upload final file to GCS
+        # Stream the combined file to GCS
         with open(final_file_path, "rb") as final_file:
-            file_content = final_file.read()
-            
-        # Generate file path and upload
-        file_extension = filename.split('.')[-1] if '.' in filename else ''
-        gcs_filename = f"documents/{filename}_{int(datetime.now().timestamp() * 1000)}.{file_extension}"
-        
-        upload_result = await gcs_service.upload_file(
-            file_content=file_content,
-            file_name=gcs_filename,
-            content_type=f"application/{file_extension}"
-        )
+            upload_result = await gcs_service.upload_stream(final_file, filename=filename)
+        gcs_filename = upload_result["file_path"]
         
         # Cleanup temp files
-        import shutil
         shutil.rmtree(temp_dir, ignore_errors=True)
         os.remove(final_file_path)
         
@@ -888,7 +1151,8 @@ async def finalize_upload(
         return {
             "message": "File upload completed successfully",
             "file_path": gcs_filename,
-            "file_size": file_size,
+            "file_size": upload_result["file_size"],
+            "file_url": upload_result["url"],
             "upload_id": upload_id
         }
         
@@ -900,9 +1164,10 @@ async def finalize_upload(
 @api_router.post("/consumptions")
 async def create_consumption(
     consumption_data: ConsumptionInput,
+    upsert: bool = False,
     current_user: User = Depends(get_current_user)
 ):
-    """Create monthly consumption record"""
+    """Create monthly consumption record (or overwrite the month's record with ?upsert=true)"""
     
     logging.info(f"🔍 POST /consumptions called by user: {current_user.role} - {current_user.name} - client_id: {current_user.client_id}")
     
@@ -922,16 +1187,6 @@ async def create_consumption(
             raise HTTPException(status_code=400, detail="Client not assigned to user")
         client_id = current_user.client_id
     
-    # Check if consumption already exists for this month/year
-    existing = await db.consumptions.find_one({
-        "client_id": client_id,
-        "year": consumption_data.year,
-        "month": consumption_data.month
-    })
-    
-    if existing:
-        raise HTTPException(status_code=400, detail="Bu ay için tüketim verisi zaten mevcut. Güncelleme yapın.")
-    
     # Create consumption record
     consumption = Consumption(
         client_id=client_id,
@@ -944,14 +1199,160 @@ async def create_consumption(
         accommodation_count=consumption_data.accommodation_count
     )
     
-    await db.consumptions.insert_one(consumption.dict())
+    # A single write; the unique (client_id, year, month) index rules out duplicate months
+    if upsert:
+        saved = await db.consumptions.find_one_and_update(
+            {"client_id": client_id, "year": consumption.year, "month": consumption.month},
+            {
+                "$set": consumption.dict(exclude={"id", "client_id", "year", "month", "created_at"}),
+                "$setOnInsert": {"id": consumption.id, "created_at": consumption.created_at}
+            },
+            upsert=True,
+            projection={"_id": 0, "id": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        consumption_id = saved["id"]
+    else:
+        try:
+            await db.consumptions.insert_one(consumption.dict())
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail="Bu ay için tüketim verisi zaten mevcut. Güncelleme yapın.")
+        consumption_id = consumption.id
+    
+    await consumption_changed(client_id, [consumption.year])
     
-    return {"message": "Tüketim verisi başarıyla kaydedildi", "consumption_id": consumption.id}
+    return {"message": "Tüketim verisi başarıyla kaydedildi", "consumption_id": consumption_id}
+
+MAX_IMPORT_ROWS = 50000
+
+def parse_import_rows(body: bytes, content_type: str) -> list:
+    """Rows of a CSV body (header line required) or a JSON array / {"rows": [...]} body"""
+    if "csv" in content_type:
+        reader = csv.DictReader(io.StringIO(body.decode("utf-8-sig")))
+        # Empty cells fall back to the model defaults
+        return [{k.strip(): v.strip() for k, v in row.items() if k and v is not None and v.strip() != ""} for row in reader]
+    
+    data = json.loads(body)
+    if isinstance(data, dict):
+        data = data.get("rows")
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array of consumption rows")
+    return data
+
+@api_router.post("/consumptions/import")
+async def import_consumptions(
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """Bulk import monthly consumption rows (JSON array or CSV) as upserts keyed on client/year/month"""
+    
+    try:
+        raw_rows = parse_import_rows(await request.body(), request.headers.get("content-type", ""))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid import body: {str(e)}")
+    
+    if len(raw_rows) > MAX_IMPORT_ROWS:
+        raise HTTPException(status_code=413, detail=f"Too many rows. Maximum is {MAX_IMPORT_ROWS} per import.")
+    
+    logging.info(f"📥 Consumption import: {len(raw_rows)} rows by {current_user.role} - {current_user.name}")
+    
+    results = [{"row": i, "status": "error"} for i in range(len(raw_rows))]
+    valid = []  # (row index, client_id, ConsumptionInput)
+    seen = set()
+    
+    # Validate the whole batch before writing anything
+    for i, raw_row in enumerate(raw_rows):
+        try:
+            if not isinstance(raw_row, dict):
+                raise ValueError("Row must be an object")
+            row = ConsumptionInput(**raw_row)
+        except (ValidationError, ValueError, TypeError) as e:
+            results[i]["error"] = str(e)
+            continue
+        
+        if current_user.role == UserRole.ADMIN:
+            client_id = row.client_id or current_user.client_id
+            if not client_id:
+                results[i]["error"] = "Admin must specify client_id"
+                continue
+        else:
+            if not current_user.client_id:
+                results[i]["error"] = "Client not assigned to user"
+                continue
+            if row.client_id and row.client_id != current_user.client_id:
+                results[i]["error"] = "Access denied: Cannot import consumption for other clients"
+                continue
+            client_id = current_user.client_id
+        
+        results[i].update({"client_id": client_id, "year": row.year, "month": row.month})
+        if not 1 <= row.month <= 12:
+            results[i]["error"] = "month must be between 1 and 12"
+            continue
+        if (client_id, row.year, row.month) in seen:
+            results[i]["error"] = "Duplicate client/year/month in this import"
+            continue
+        seen.add((client_id, row.year, row.month))
+        valid.append((i, client_id, row))
+    
+    # Reject rows for clients that do not exist, with one lookup
+    client_ids = {client_id for _, client_id, _ in valid}
+    existing_clients = {
+        client["id"] for client in
+        await db.clients.find({"id": {"$in": list(client_ids)}}, {"_id": 0, "id": 1}).to_list(None)
+    }
+    for i, client_id, _ in valid:
+        if client_id not in existing_clients:
+            results[i]["error"] = "Client not found"
+    valid = [entry for entry in valid if entry[1] in existing_clients]
+    
+    if valid:
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"client_id": client_id, "year": row.year, "month": row.month},
+                {
+                    "$set": {**row.dict(exclude={"client_id"}), "updated_at": now},
+                    "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now}
+                },
+                upsert=True
+            )
+            for _, client_id, row in valid
+        ]
+        
+        try:
+            bulk_result = (await db.consumptions.bulk_write(operations, ordered=False)).bulk_api_result
+        except BulkWriteError as e:
+            bulk_result = e.details
+        
+        upserted = {entry["index"] for entry in bulk_result.get("upserted", [])}
+        failed = {entry["index"]: entry.get("errmsg", "Write failed") for entry in bulk_result.get("writeErrors", [])}
+        for op_index, (i, _, _) in enumerate(valid):
+            if op_index in failed:
+                results[i]["error"] = failed[op_index]
+            else:
+                results[i]["status"] = "created" if op_index in upserted else "updated"
+        
+        # Refresh every affected rollup and footprint in one pass, then drop the cached analytics
+        written = {}
+        for op_index, (_, client_id, row) in enumerate(valid):
+            if op_index not in failed:
+                written.setdefault(client_id, set()).add(row.year)
+        if written:
+            await consumptions_changed(written)
+    
+    summary = {"total": len(results), "created": 0, "updated": 0, "error": 0}
+    for result in results:
+        summary[result["status"]] += 1
+    
+    return {"summary": summary, "results": results}
 
 @api_router.get("/consumptions")
 async def get_consumptions(
+    response: Response,
     year: Optional[int] = None,
     client_id: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
     """Get consumption records for client"""
@@ -982,10 +1383,45 @@ async def get_consumptions(
         filter_query["year"] = year
     
     # Get consumptions sorted by year and month (newest first)
-    consumptions = await db.consumptions.find(filter_query).sort([("year", -1), ("month", -1)]).to_list(length=100)
+    consumptions = await fetch_page(db.consumptions, filter_query, CONSUMPTION_ORDER, limit, cursor, response)
     
     return consumptions
 
+@api_router.get("/consumptions/anomalies")
+async def get_consumption_anomalies(
+    response: Response,
+    year: Optional[int] = None,
+    client_id: Optional[str] = None,
+    field: Optional[str] = None,
+    basis: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Outlier months flagged by the nightly anomaly scan, newest first"""
+    
+    if basis and basis not in ANOMALY_BASES:
+        raise HTTPException(status_code=400, detail=f"basis must be one of: {', '.join(ANOMALY_BASES)}")
+    
+    if current_user.role == UserRole.ADMIN:
+        target_client_id = client_id
+    else:
+        if not current_user.client_id:
+            raise HTTPException(status_code=400, detail="Client not assigned to user")
+        target_client_id = current_user.client_id
+    
+    filter_query = {}
+    if target_client_id:
+        filter_query["client_id"] = target_client_id
+    if year:
+        filter_query["year"] = year
+    if field:
+        filter_query["field"] = field
+    if basis:
+        filter_query["basis"] = basis
+    
+    return await fetch_page(db.consumption_anomalies, filter_query, CONSUMPTION_ORDER, limit, cursor, response)
+
 @api_router.put("/consumptions/{consumption_id}")
 async def update_consumption(
     consumption_id: str,
@@ -1003,14 +1439,26 @@ async def update_consumption(
     if current_user.role == UserRole.CLIENT and current_user.client_id != consumption["client_id"]:
         raise HTTPException(status_code=403, detail="Bu tüketim verisini güncelleme yetkiniz yok")
     
-    # Update consumption
-    update_data = consumption_data.dict()
+    # Update consumption; an omitted client_id keeps the stored one, and client users cannot change it
+    update_data = consumption_data.dict(
+        exclude={"client_id"} if current_user.role == UserRole.CLIENT else set(),
+        exclude_none=True
+    )
     update_data["updated_at"] = datetime.utcnow()
     
-    await db.consumptions.update_one(
-        {"id": consumption_id},
-        {"$set": update_data}
-    )
+    try:
+        await db.consumptions.update_one(
+            {"id": consumption_id},
+            {"$set": update_data}
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Bu ay için tüketim verisi zaten mevcut. Güncelleme yapın.")
+    
+    # The record may have moved to another month or year
+    await consumption_changed(consumption["client_id"], {consumption["year"], consumption_data.year})
+    new_client_id = update_data.get("client_id")
+    if new_client_id and new_client_id != consumption["client_id"]:
+        await consumption_changed(new_client_id, [consumption_data.year])
     
     return {"message": "Tüketim verisi başarıyla güncellendi"}
 
@@ -1021,16 +1469,135 @@ async def delete_consumption(
 ):
     """Delete consumption record"""
     
-    result = await db.consumptions.delete_one({"id": consumption_id})
-    if result.deleted_count == 0:
+    deleted = await db.consumptions.find_one_and_delete(
+        {"id": consumption_id},
+        projection={"_id": 0, "client_id": 1, "year": 1}
+    )
+    if not deleted:
         raise HTTPException(status_code=404, detail="Tüketim verisi bulunamadı")
     
+    await consumption_changed(deleted["client_id"], [deleted["year"]])
+    
     return {"message": "Tüketim verisi başarıyla silindi"}
 
+@api_router.get("/consumptions/portfolio-analytics")
+async def get_portfolio_analytics(
+    year: Optional[int] = None,
+    sort_by: str = "per_guest.electricity",
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    top_k: Optional[int] = Query(None, ge=1),
+    current_user: User = Depends(get_admin_user)
+):
+    """Yearly totals, per-guest intensity, YoY change and peer percentile of every client (Admin only)"""
+    
+    if sort_by not in PORTFOLIO_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort_by must be one of: {', '.join(PORTFOLIO_SORT_KEYS)}")
+    
+    if not year:
+        year = datetime.now().year
+    
+    logging.info(f"📊 Portfolio analytics for {year} - sort: {sort_by} {order} - top_k: {top_k}")
+    
+    async def compute():
+        rollups = await db.consumption_rollups.aggregate(portfolio_pipeline(year)).to_list(None)
+        return compute_portfolio(rollups, year)
+    
+    versions = await cached_versions(ALL_CONSUMPTIONS, ALL_CLIENTS)
+    portfolio = await portfolio_cache.get_or_load((year, versions), compute)
+    return serialize_portfolio(portfolio, year, sort_by, order, top_k)
+
+@api_router.get("/consumptions/gaps")
+async def get_consumption_gaps(
+    start: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    end: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    only_incomplete: bool = False,
+    current_user: User = Depends(get_admin_user)
+):
+    """Which clients are missing which months of consumption data in a period, as one bitmap per client (Admin only)"""
+    
+    # Default: the twelve months up to and including last month
+    now = datetime.now()
+    try:
+        end_index = parse_month(end) if end else month_index(now.year, now.month) - 1
+        start_index = parse_month(start) if start else end_index - 11
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if start_index > end_index or end_index - start_index + 1 > MAX_GAP_MONTHS:
+        raise HTTPException(status_code=400, detail=f"Period must be ascending and at most {MAX_GAP_MONTHS} months")
+    
+    async def compute():
+        clients = await db.clients.find({}, {"_id": 0, "id": 1, "name": 1, "hotel_name": 1}).to_list(None)
+        groups = await db.consumptions.aggregate(gap_pipeline(start_index, end_index)).to_list(None)
+        reported = {group["_id"]: group["reported"] for group in groups}
+        return build_gap_report(clients, reported, start_index, end_index)[1]
+    
+    versions = await cached_versions(ALL_CONSUMPTIONS, ALL_CLIENTS)
+    report = await gap_cache.get_or_load((start_index, end_index, versions), compute)
+    incomplete = [client for client in report if client["missing_count"]]
+    
+    return {
+        "start": month_key(start_index),
+        "end": month_key(end_index),
+        "months": [month_key(index) for index in range(start_index, end_index + 1)],
+        "client_count": len(report),
+        "incomplete_count": len(incomplete),
+        "clients": incomplete if only_incomplete else report
+    }
+
+@api_router.get("/consumptions/forecast")
+async def get_consumption_forecast(
+    client_id: Optional[str] = None,
+    horizon: int = Query(12, ge=1, le=MAX_HORIZON),
+    portfolio: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """Expected monthly consumption for the coming months; portfolio=true forecasts every client (Admin only)"""
+    
+    if portfolio:
+        if current_user.role != UserRole.ADMIN:
+            raise HTTPException(status_code=403, detail="Admin access required")
+        target_client_id = None
+    elif current_user.role == UserRole.ADMIN:
+        if not client_id:
+            raise HTTPException(status_code=400, detail="Admin must specify client_id or portfolio=true for forecasts")
+        target_client_id = client_id
+    else:
+        if not current_user.client_id:
+            raise HTTPException(status_code=400, detail="Client not assigned to user")
+        target_client_id = current_user.client_id
+    
+    # Fitted once for the longest horizon from the rollups; every client of the portfolio in one vectorized run
+    async def fit():
+        query = {"year": {"$gte": MIN_CONSUMPTION_YEAR, "$lte": MAX_CONSUMPTION_YEAR}}
+        if target_client_id:
+            query["client_id"] = target_client_id
+        rollups = await db.consumption_rollups.find(query, SERIES_FIELDS).to_list(None)
+        years = forecast_years(r["year"] for r in rollups)
+        if not years:
+            return None
+        client_ids = sorted({r["client_id"] for r in rollups})
+        return await asyncio.to_thread(forecast_series, series_from_rollups(rollups, years, client_ids), MAX_HORIZON)
+    
+    versions = await cached_versions(client_version(target_client_id) if target_client_id else ALL_CONSUMPTIONS)
+    result = await forecast_cache.get_or_load((target_client_id or PORTFOLIO_FORECAST, versions), fit)
+    if result is None or latest_origin(result) is None:
+        if portfolio:
+            return {"horizon": horizon, "origin": None, "clients": []}
+        raise HTTPException(status_code=404, detail="Tahmin için tüketim verisi bulunamadı")
+    
+    if portfolio:
+        return {
+            "horizon": horizon,
+            "origin": latest_origin(result),
+            "clients": [serialize_forecast(result, c, horizon) for c in range(len(result["client_ids"]))]
+        }
+    return {"horizon": horizon, **serialize_forecast(result, 0, horizon)}
+
 @api_router.get("/consumptions/analytics")
 async def get_consumption_analytics(
     year: Optional[int] = None,
     client_id: Optional[str] = None,
+    response_format: Optional[str] = Query(None, alias="format", pattern="^columnar$"),
     current_user: User = Depends(get_current_user)
 ):
     """Get consumption analytics and comparisons"""
@@ -1056,106 +1623,144 @@ async def get_consumption_analytics(
     # Default to current year if not specified
     if not year:
         year = datetime.now().year
+    check_consumption_years(year)
     
-    # Get current year and previous year data
-    current_year_data = await db.consumptions.find({
-        "client_id": target_client_id,
-        "year": year
-    }).sort("month", 1).to_list(length=12)
-    
-    previous_year_data = await db.consumptions.find({
-        "client_id": target_client_id,
-        "year": year - 1
-    }).sort("month", 1).to_list(length=12)
-    
-    # Calculate monthly comparisons
-    monthly_comparison = []
-    for month in range(1, 13):
-        current_month = next((c for c in current_year_data if c["month"] == month), None)
-        previous_month = next((c for c in previous_year_data if c["month"] == month), None)
-        
-        month_data = {
-            "month": month,
-            "month_name": ["", "Ocak", "Şubat", "Mart", "Nisan", "Mayıs", "Haziran", 
-                          "Temmuz", "Ağustos", "Eylül", "Ekim", "Kasım", "Aralık"][month],
-            "current_year": {
-                "electricity": current_month["electricity"] if current_month else 0,
-                "water": current_month["water"] if current_month else 0,
-                "natural_gas": current_month["natural_gas"] if current_month else 0,
-                "coal": current_month["coal"] if current_month else 0,
-                "accommodation_count": current_month["accommodation_count"] if current_month else 0
-            },
-            "previous_year": {
-                "electricity": previous_month["electricity"] if previous_month else 0,
-                "water": previous_month["water"] if previous_month else 0,
-                "natural_gas": previous_month["natural_gas"] if previous_month else 0,
-                "coal": previous_month["coal"] if previous_month else 0,
-                "accommodation_count": previous_month["accommodation_count"] if previous_month else 0
-            }
-        }
-        
-        # Calculate per-person consumption
-        if month_data["current_year"]["accommodation_count"] > 0:
-            month_data["current_year_per_person"] = {
-                "electricity": month_data["current_year"]["electricity"] / month_data["current_year"]["accommodation_count"],
-                "water": month_data["current_year"]["water"] / month_data["current_year"]["accommodation_count"],
-                "natural_gas": month_data["current_year"]["natural_gas"] / month_data["current_year"]["accommodation_count"],
-                "coal": month_data["current_year"]["coal"] / month_data["current_year"]["accommodation_count"]
-            }
-        else:
-            month_data["current_year_per_person"] = {"electricity": 0, "water": 0, "natural_gas": 0, "coal": 0}
-        
-        if month_data["previous_year"]["accommodation_count"] > 0:
-            month_data["previous_year_per_person"] = {
-                "electricity": month_data["previous_year"]["electricity"] / month_data["previous_year"]["accommodation_count"],
-                "water": month_data["previous_year"]["water"] / month_data["previous_year"]["accommodation_count"],
-                "natural_gas": month_data["previous_year"]["natural_gas"] / month_data["previous_year"]["accommodation_count"],
-                "coal": month_data["previous_year"]["coal"] / month_data["previous_year"]["accommodation_count"]
-            }
-        else:
-            month_data["previous_year_per_person"] = {"electricity": 0, "water": 0, "natural_gas": 0, "coal": 0}
-        
-        monthly_comparison.append(month_data)
-    
-    # Calculate year totals
-    current_year_totals = {
-        "electricity": sum(c["electricity"] for c in current_year_data),
-        "water": sum(c["water"] for c in current_year_data),
-        "natural_gas": sum(c["natural_gas"] for c in current_year_data),
-        "coal": sum(c["coal"] for c in current_year_data),
-        "accommodation_count": sum(c["accommodation_count"] for c in current_year_data)
-    }
+    # Both years' rollups in one query, computed by the vectorized engine; concurrent misses share one computation
+    columnar = response_format == "columnar"
+    async def compute_analytics():
+        series = await load_rollup_series(db, [target_client_id], [year - 1, year])
+        return serialize_analytics(series, target_client_id, year, ENERGY_FACTORS, columnar=columnar)
     
-    previous_year_totals = {
-        "electricity": sum(c["electricity"] for c in previous_year_data),
-        "water": sum(c["water"] for c in previous_year_data),
-        "natural_gas": sum(c["natural_gas"] for c in previous_year_data),
-        "coal": sum(c["coal"] for c in previous_year_data),
-        "accommodation_count": sum(c["accommodation_count"] for c in previous_year_data)
-    }
+    versions = await cached_versions(
+        client_year_version(target_client_id, year - 1), client_year_version(target_client_id, year)
+    )
+    return await analytics_cache.get_or_load((target_client_id, year, columnar, versions), compute_analytics)
+
+@api_router.get("/carbon/footprint")
+async def get_carbon_footprint(
+    year: Optional[int] = None,
+    client_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Monthly and yearly CO2e of one client, read from the precomputed footprints"""
     
-    return {
-        "year": year,
-        "monthly_comparison": monthly_comparison,
-        "yearly_totals": {
-            "current_year": current_year_totals,
-            "previous_year": previous_year_totals
-        },
-        "yearly_per_person": {
-            "current_year": {
-                "electricity": current_year_totals["electricity"] / current_year_totals["accommodation_count"] if current_year_totals["accommodation_count"] > 0 else 0,
-                "water": current_year_totals["water"] / current_year_totals["accommodation_count"] if current_year_totals["accommodation_count"] > 0 else 0,
-                "natural_gas": current_year_totals["natural_gas"] / current_year_totals["accommodation_count"] if current_year_totals["accommodation_count"] > 0 else 0,
-                "coal": current_year_totals["coal"] / current_year_totals["accommodation_count"] if current_year_totals["accommodation_count"] > 0 else 0
-            },
-            "previous_year": {
-                "electricity": previous_year_totals["electricity"] / previous_year_totals["accommodation_count"] if previous_year_totals["accommodation_count"] > 0 else 0,
-                "water": previous_year_totals["water"] / previous_year_totals["accommodation_count"] if previous_year_totals["accommodation_count"] > 0 else 0,
-                "natural_gas": previous_year_totals["natural_gas"] / previous_year_totals["accommodation_count"] if previous_year_totals["accommodation_count"] > 0 else 0,
-                "coal": previous_year_totals["coal"] / previous_year_totals["accommodation_count"] if previous_year_totals["accommodation_count"] > 0 else 0
-            }
-        }
-    }
+    if current_user.role == UserRole.ADMIN:
+        if not client_id:
+            raise HTTPException(status_code=400, detail="Admin must specify client_id for carbon footprint")
+        target_client_id = client_id
+    else:
+        if not current_user.client_id:
+            raise HTTPException(status_code=400, detail="Client not assigned to user")
+        target_client_id = current_user.client_id
+    
+    if not year:
+        year = datetime.now().year
+    
+    footprints = await db.carbon_footprints.find(
+        {"client_id": target_client_id, "year": year},
+        {"_id": 0}
+    ).sort("month", ASCENDING).to_list(12)
+    
+    return {"client_id": target_client_id, "year": year, **summarize_footprints(footprints)}
+
+@api_router.get("/carbon/portfolio")
+async def get_carbon_portfolio(year: Optional[int] = None, current_user: User = Depends(get_admin_user)):
+    """Yearly CO2e and CO2e per guest of every client, highest emitters first (Admin only)"""
+    
+    if not year:
+        year = datetime.now().year
+    
+    clients = await db.carbon_footprints.aggregate(portfolio_footprint_pipeline(year)).to_list(None)
+    return {"year": year, "clients": clients}
+
+@api_router.get("/carbon/emission-factors")
+async def get_emission_factors(current_user: User = Depends(get_admin_user)):
+    """Active emission factors and every stored version (Admin only)"""
+    
+    active = await get_active_factors(db)
+    versions = await db.emission_factors.find({}, {"_id": 0}).sort("version", DESCENDING).to_list(None)
+    return {"active": active, "versions": versions}
+
+@api_router.post("/carbon/emission-factors")
+async def create_emission_factors(factors_input: EmissionFactorsInput, current_user: User = Depends(get_admin_user)):
+    """Store a new emission factor version and recompute every footprint with it in the background (Admin only)"""
+    
+    unknown = set(factors_input.factors) - set(CONSUMPTION_METRICS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown metrics: {', '.join(sorted(unknown))}")
+    if any(value < 0 for value in factors_input.factors.values()):
+        raise HTTPException(status_code=400, detail="Emission factors must not be negative")
+    
+    # Metrics left out keep their current factor
+    active = await get_active_factors(db)
+    factors_doc = await create_factor_version(db, {**active["factors"], **factors_input.factors}, factors_input.note)
+    logging.info(f"🌱 Emission factors v{factors_doc['version']} created by {current_user.email}")
+    
+    job = await create_recompute_job(db, factors_doc["version"], f"Emission factors v{factors_doc['version']}")
+    app.state.carbon_job = asyncio.create_task(run_recompute_job(db, job["id"]))
+    return {"emission_factors": factors_doc, "job": job}
+
+@api_router.post("/carbon/recompute")
+async def recompute_carbon_footprints(current_user: User = Depends(get_admin_user)):
+    """Recompute every footprint with the active emission factors in the background (Admin only)"""
+    
+    active = await get_active_factors(db)
+    job = await create_recompute_job(db, active["version"], "Manual recompute")
+    app.state.carbon_job = asyncio.create_task(run_recompute_job(db, job["id"]))
+    return job
+
+@api_router.get("/carbon/jobs")
+async def get_carbon_jobs(limit: int = Query(20, ge=1, le=100), current_user: User = Depends(get_admin_user)):
+    """Most recent footprint recomputation jobs (Admin only)"""
+    return await db.carbon_jobs.find({}, {"_id": 0}).sort("created_at", DESCENDING).to_list(limit)
+
+@api_router.get("/carbon/jobs/{job_id}")
+async def get_carbon_job(job_id: str, current_user: User = Depends(get_admin_user)):
+    """Status and progress of one recomputation job (Admin only)"""
+    
+    job = await db.carbon_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job["progress"] = job["processed_clients"] / job["total_clients"] if job["total_clients"] else 1.0
+    return job
+
+MAX_TREND_YEARS = 10
+
+@api_router.get("/consumptions/analytics/trends")
+async def get_consumption_trends(
+    client_id: Optional[str] = None,
+    start_year: Optional[int] = None,
+    end_year: Optional[int] = None,
+    granularity: str = "month",
+    rolling: bool = False,
+    response_format: Optional[str] = Query(None, alias="format", pattern="^columnar$"),
+    current_user: User = Depends(get_current_user)
+):
+    """Consumption per month, quarter, season or year over a range of years, with optional rolling 12-month windows"""
+    
+    if current_user.role == UserRole.ADMIN:
+        if not client_id:
+            raise HTTPException(status_code=400, detail="Admin must specify client_id for analytics")
+        target_client_id = client_id
+    else:
+        if not current_user.client_id:
+            raise HTTPException(status_code=400, detail="Client not assigned to user")
+        target_client_id = current_user.client_id
+    
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    
+    end_year = end_year or datetime.now().year
+    start_year = start_year or max(end_year - 4, MIN_CONSUMPTION_YEAR)
+    check_consumption_years(start_year, end_year)
+    if start_year > end_year or end_year - start_year + 1 > MAX_TREND_YEARS:
+        raise HTTPException(status_code=400, detail=f"Year range must be ascending and at most {MAX_TREND_YEARS} years")
+    
+    years = list(range(start_year, end_year + 1))
+    # Every year's rollup (plus the year before, for YoY and the first rolling windows) in one query
+    series = await load_rollup_series(db, [target_client_id], [start_year - 1] + years)
+    return serialize_trends(series, target_client_id, years, granularity, rolling, ENERGY_FACTORS,
+                            columnar=response_format == "columnar")
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -1179,6 +1784,55 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_required_indexes():
+    # create_consumption relies on the unique month index instead of a lookup; refuse to start without it.
+    # Rows from older versions (client_id null, duplicate months) and racing rollup upserts would block
+    # the unique indexes, so repair those first.
+    if await missing_required_indexes(db):
+        await repair_consumptions(db, apply=True)
+        await drop_duplicate_rollups(db)
+    await require_indexes(db)
+
+@app.on_event("startup")
+async def startup_index_bootstrap():
+    # Build indexes in the background so startup is not held up by large collections
+    app.state.index_bootstrap = asyncio.create_task(ensure_indexes(db))
+
+@app.on_event("startup")
+async def startup_rollup_bootstrap():
+    # First start against existing data: materialize the consumption rollups in the background
+    app.state.rollup_bootstrap = asyncio.create_task(ensure_rollups(db))
+
+@app.on_event("startup")
+async def startup_carbon_bootstrap():
+    # First start against existing data: compute the carbon footprints in the background
+    app.state.carbon_bootstrap = asyncio.create_task(ensure_footprints(db))
+
+@app.on_event("startup")
+async def startup_carbon_jobs():
+    # Pick up a footprint recomputation interrupted by the last shutdown
+    app.state.carbon_job = asyncio.create_task(resume_recompute_jobs(db))
+
+@app.on_event("startup")
+async def startup_anomaly_scan():
+    # Nightly consumption anomaly scan over the whole portfolio
+    app.state.anomaly_scan = asyncio.create_task(nightly_anomaly_scan(db, ANOMALY_SCAN_HOUR))
+
+@app.on_event("startup")
+async def startup_jwks_key_store():
+    await jwks_key_store.start()
+
+@app.on_event("shutdown")
+async def shutdown_jwks_key_store():
+    await jwks_key_store.stop()
+
+@app.on_event("shutdown")
+async def shutdown_gcs_service():
+    if gcs_service:
+        await gcs_service.close()
+        gcs_executor.shutdown(wait=False)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
\ No newline at end of file
@@ -0,0 +1,63 @@
+"""
+Consumption analytics.
+
+Shared field definitions, plus build_consumption_analytics(): the pure-Python
+reference implementation of the /consumptions/analytics response, kept for
+checking the vectorized engine in consumption_engine.py (see
+analytics_engine_test.py at the repository root).
+"""
+from typing import List
+
+CONSUMPTION_METRICS = ["electricity", "water", "natural_gas", "coal"]
+ACCOMMODATION_FIELD = "accommodation_count"
+CONSUMPTION_FIELDS = CONSUMPTION_METRICS + [ACCOMMODATION_FIELD]
+
+# Accepted consumption years; anything outside is a typo (e.g. 20244) that would blow up year-indexed arrays
+MIN_CONSUMPTION_YEAR = 2000
+MAX_CONSUMPTION_YEAR = 2100
+
+MONTH_NAMES = ["", "Ocak", "Şubat", "Mart", "Nisan", "Mayıs", "Haziran",
+               "Temmuz", "Ağustos", "Eylül", "Ekim", "Kasım", "Aralık"]
+
+
+def _per_person(values: dict) -> dict:
+    count = values[ACCOMMODATION_FIELD]
+    return {metric: values[metric] / count if count > 0 else 0 for metric in CONSUMPTION_METRICS}
+
+
+def build_consumption_analytics(year: int, current_year_data: List[dict], previous_year_data: List[dict]) -> dict:
+    """Reference implementation: analytics for `year` compared with `year - 1` from raw monthly rows"""
+    current_by_month = {row["month"]: row for row in current_year_data}
+    previous_by_month = {row["month"]: row for row in previous_year_data}
+
+    monthly_comparison = []
+    for month in range(1, 13):
+        current_month = current_by_month.get(month)
+        previous_month = previous_by_month.get(month)
+        current_values = {field: current_month[field] if current_month else 0 for field in CONSUMPTION_FIELDS}
+        previous_values = {field: previous_month[field] if previous_month else 0 for field in CONSUMPTION_FIELDS}
+
+        monthly_comparison.append({
+            "month": month,
+            "month_name": MONTH_NAMES[month],
+            "current_year": current_values,
+            "previous_year": previous_values,
+            "current_year_per_person": _per_person(current_values),
+            "previous_year_per_person": _per_person(previous_values)
+        })
+
+    current_year_totals = {field: sum(row[field] for row in current_year_data) for field in CONSUMPTION_FIELDS}
+    previous_year_totals = {field: sum(row[field] for row in previous_year_data) for field in CONSUMPTION_FIELDS}
+
+    return {
+        "year": year,
+        "monthly_comparison": monthly_comparison,
+        "yearly_totals": {
+            "current_year": current_year_totals,
+            "previous_year": previous_year_totals
+        },
+        "yearly_per_person": {
+            "current_year": _per_person(current_year_totals),
+            "previous_year": _per_person(previous_year_totals)
+        }
+    }
@@ -0,0 +1,236 @@
+"""
+Consumption anomaly detection.
+
+Every client's monthly series over the most recent years with data is
+loaded with one query into a single (clients × years × 12) array. Each
+value is compared with a seasonal baseline: the median of the same calendar month in the client's other years,
+or, with too little history, the client's median level scaled by the
+portfolio-wide seasonal profile of that month. The log residuals are
+scored with robust z-scores (median/MAD) per client and field, on absolute
+values and on per-guest intensities alike. Months scoring beyond the
+threshold are written to consumption_anomalies. The scan runs nightly from
+the API, in whichever worker claims the night's run first, and can be run
+by hand:
+
+    python -m services.anomalies [--dry-run]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import warnings
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from .analytics import CONSUMPTION_FIELDS, CONSUMPTION_METRICS, MAX_CONSUMPTION_YEAR, MIN_CONSUMPTION_YEAR
+from .consumption_engine import SERIES_PROJECTION, ConsumptionSeries
+
+logger = logging.getLogger(__name__)
+
+Z_THRESHOLD = 3.5          # Iglewicz-Hoaglin cut-off for modified z-scores
+MIN_SEASONAL_YEARS = 2     # other years of the same month needed for a client's own seasonal baseline
+MIN_OBSERVATIONS = 6       # months a client needs before any of them is scored
+ANOMALY_WINDOW_YEARS = 10  # most recent years with data that are scored
+ANOMALY_BASES = ("absolute", "per_guest")
+
+
+def _nanmedian(values: np.ndarray, axis) -> np.ndarray:
+    # All-NaN slices (no data) are expected and simply yield NaN
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanmedian(values, axis=axis)
+
+
+def _leave_one_out_median(values: np.ndarray) -> tuple:
+    """
+    Median over axis 1 (years) of every other entry, for each entry of a (clients, years, 12, fields)
+    array with NaN for missing values, plus how many values each median covers. The years are sorted
+    once; dropping an entry of rank r shifts every later rank down by one, so the median of the rest is
+    read from the sorted array at shifted positions, without materializing a years × years array.
+    """
+    years = values.shape[1]
+    order = np.argsort(values, axis=1)                              # NaN sorts last
+    ranked = np.take_along_axis(values, order, axis=1)
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order, np.broadcast_to(np.arange(years)[None, :, None, None], order.shape), axis=1)
+
+    observed = ~np.isnan(values)
+    count = observed.sum(axis=1, keepdims=True)                     # observed years per (client, month, field)
+    # A missing entry removes nothing: give it a rank past every observed value
+    rank = np.where(observed, rank, count)
+    others = count - observed                                       # values left once the entry itself is dropped
+
+    def value_at(k):
+        position = np.clip(np.where(k < rank, k, k + 1), 0, years - 1)
+        return np.take_along_axis(ranked, position, axis=1)
+
+    low, high = (others - 1) // 2, others // 2
+    median = np.where(others > 0, (value_at(low) + value_at(high)) / 2, np.nan)
+    return median, others
+
+
+def robust_z_scores(values: np.ndarray) -> tuple:
+    """
+    Modified z-scores of a (clients, years, 12, fields) array with NaN for missing months.
+    Consumption varies multiplicatively, so residuals are taken on log1p values.
+    Returns (z, baseline); z is NaN wherever there is no value or too little history.
+    """
+    clients, years, _, fields = values.shape
+    observed = ~np.isnan(values)
+    logs = np.log1p(np.clip(values, 0, None))
+
+    # Same month of every other year
+    seasonal, seasonal_years = _leave_one_out_median(logs)                     # (clients, years, 12, fields)
+
+    # Fallback: the client's level shifted by the portfolio's typical offset for that month
+    level = _nanmedian(logs.reshape(clients, years * 12, fields), axis=1)      # (clients, fields)
+    profile = _nanmedian((logs - level[:, None, None]).reshape(clients * years, 12, fields), axis=0)  # (12, fields)
+    fallback = level[:, None, None] + np.nan_to_num(profile)
+
+    baseline = np.where(seasonal_years >= MIN_SEASONAL_YEARS, seasonal, fallback)
+    residual = (logs - baseline).reshape(clients, years * 12, fields)
+    center = _nanmedian(residual, axis=1)[:, None]
+    deviation = residual - center
+    mad = _nanmedian(np.abs(deviation), axis=1)[:, None]
+    # MAD is 0 when most months are identical; fall back to the mean absolute deviation
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean_ad = np.nanmean(np.abs(deviation), axis=1)[:, None]
+    scale = np.where(mad > 0, mad / 0.6745, mean_ad * 1.253314)
+
+    z = np.zeros_like(deviation)
+    np.divide(deviation, scale, out=z, where=scale > 0)
+    z[np.isnan(deviation)] = np.nan
+    enough = observed.reshape(clients, years * 12, fields).sum(axis=1) >= MIN_OBSERVATIONS
+    z[~np.broadcast_to(enough[:, None], z.shape)] = np.nan
+    return z.reshape(values.shape), np.expm1(baseline)
+
+
+def detect_anomalies(series: ConsumptionSeries, threshold: float = Z_THRESHOLD) -> List[dict]:
+    """Outlier months of every client in the series, on absolute values and per-guest intensities"""
+    absolute = np.where(series.present[..., None], series.values, np.nan)
+    guests = series.accommodation[..., None]
+    per_guest = np.where(series.present[..., None] & (guests > 0), series.metrics / np.where(guests > 0, guests, 1), np.nan)
+
+    anomalies = []
+    for basis, values, fields in (
+        ("absolute", absolute, CONSUMPTION_FIELDS),
+        ("per_guest", per_guest, CONSUMPTION_METRICS)
+    ):
+        z, baseline = robust_z_scores(values)
+        for c, y, m, f in zip(*np.nonzero(np.abs(np.nan_to_num(z)) > threshold)):
+            client_id, year, month, field = series.client_ids[c], series.years[y], int(m) + 1, fields[f]
+            anomalies.append({
+                "id": f"{client_id}:{year}:{month:02d}:{basis}:{field}",
+                "client_id": client_id,
+                "year": year,
+                "month": month,
+                "field": field,
+                "basis": basis,
+                "value": float(values[c, y, m, f]),
+                "baseline": float(baseline[c, y, m, f]),
+                "z_score": float(z[c, y, m, f]),
+                "direction": "high" if z[c, y, m, f] > 0 else "low"
+            })
+    return anomalies
+
+
+def _series_years(years: List[int]) -> List[int]:
+    """Distinct valid years present, limited to the most recent ANOMALY_WINDOW_YEARS of them"""
+    valid = {year for year in years if isinstance(year, int) and MIN_CONSUMPTION_YEAR <= year <= MAX_CONSUMPTION_YEAR}
+    return sorted(valid)[-ANOMALY_WINDOW_YEARS:]
+
+
+async def scan_anomalies(db, dry_run: bool = False) -> dict:
+    """Score the whole portfolio in one pass and replace the stored anomalies with the result"""
+    started = datetime.utcnow()
+    years = _series_years(await db.consumptions.distinct("year"))
+    rows = await db.consumptions.find({"year": {"$in": years}}, SERIES_PROJECTION).to_list(None)
+    series = ConsumptionSeries.from_rows(rows, years)
+    # Seconds of NumPy for a large portfolio; keep it off the event loop
+    anomalies = await asyncio.to_thread(detect_anomalies, series)
+
+    if not dry_run:
+        if anomalies:
+            await db.consumption_anomalies.bulk_write([
+                UpdateOne(
+                    {"id": anomaly["id"]},
+                    {"$set": {**anomaly, "detected_at": started}, "$setOnInsert": {"first_detected_at": started}},
+                    upsert=True
+                )
+                for anomaly in anomalies
+            ], ordered=False)
+        # Flags not raised again were corrected or deleted since the last scan
+        await db.consumption_anomalies.delete_many({"detected_at": {"$lt": started}})
+
+    summary = {
+        "clients": len(series.client_ids),
+        "rows": len(rows),
+        "anomalies": len(anomalies),
+        "seconds": (datetime.utcnow() - started).total_seconds()
+    }
+    logger.info(f"🔎 Anomaly scan: {summary['anomalies']} anomalies in {summary['rows']} rows of {summary['clients']} clients")
+    return {**summary, "results": anomalies} if dry_run else summary
+
+
+async def claim_scheduled_run(db, name: str, run_key: str) -> bool:
+    """
+    True for exactly one caller per (name, run_key): every API worker schedules the nightly jobs, and
+    the first to record run_key in the shared lock document runs it. The others hit the duplicate _id.
+    """
+    try:
+        await db.scheduled_runs.update_one(
+            {"_id": name, "run_key": {"$ne": run_key}},
+            {"$set": {"run_key": run_key, "claimed_at": datetime.utcnow(), "claimed_by": f"{socket.gethostname()}:{os.getpid()}"}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+async def nightly_anomaly_scan(db, hour: int):
+    """Run scan_anomalies every day at `hour` (UTC), in one worker only"""
+    while True:
+        now = datetime.utcnow()
+        next_run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        await asyncio.sleep((next_run - now).total_seconds())
+        try:
+            if await claim_scheduled_run(db, "anomaly_scan", next_run.date().isoformat()):
+                await scan_anomalies(db)
+        except Exception as e:
+            logger.error(f"❌ Nightly anomaly scan failed: {e}")
+
+
+async def _main(dry_run: bool):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent.parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    result = await scan_anomalies(db, dry_run=dry_run)
+    print(f"Scanned {result['rows']} row(s) of {result['clients']} client(s) in {result['seconds']:.2f}s: "
+          f"{result['anomalies']} anomal{'y' if result['anomalies'] == 1 else 'ies'}")
+    for anomaly in result.get("results", []):
+        print(f"  {anomaly['client_id']} {anomaly['year']}-{anomaly['month']:02d} {anomaly['basis']:<9} "
+              f"{anomaly['field']:<20} value={anomaly['value']:.2f} baseline={anomaly['baseline']:.2f} z={anomaly['z_score']:.1f}")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flag outlier consumption months across all clients")
+    parser.add_argument("--dry-run", action="store_true", help="print the anomalies without storing them")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args.dry_run))
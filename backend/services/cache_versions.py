@@ -0,0 +1,43 @@
+"""
+Shared invalidation for per-process result caches.
+
+Every worker keeps its own TTLCache, so dropping an entry only reaches the
+worker that handled the write. Instead, writes bump counters in the
+cache_versions collection and reads put the current counters into the cache
+key: after a write no worker can hit an entry computed from older data, and
+the orphaned entries age out through the TTL and LRU bound.
+
+Counters exist for the whole consumption data set, for each client and for
+each client-year, and for the client records whose names appear in reports.
+"""
+from typing import Iterable, Tuple
+
+from pymongo import UpdateOne
+
+ALL_CONSUMPTIONS = "consumptions"
+ALL_CLIENTS = "clients"
+
+
+def client_version(client_id: str) -> str:
+    return f"consumptions:{client_id}"
+
+
+def client_year_version(client_id: str, year: int) -> str:
+    return f"consumptions:{client_id}:{year}"
+
+
+async def bump_versions(db, keys: Iterable[str]):
+    """Increment the given counters; cached results keyed by their old values stop being used everywhere"""
+    keys = sorted(set(keys))
+    if keys:
+        await db.cache_versions.bulk_write(
+            [UpdateOne({"_id": key}, {"$inc": {"version": 1}}, upsert=True) for key in keys],
+            ordered=False
+        )
+
+
+async def read_versions(db, keys: Iterable[str]) -> Tuple[int, ...]:
+    """Current counters of `keys` in order (0 for never bumped), to be made part of a cache key"""
+    keys = list(keys)
+    versions = {doc["_id"]: doc["version"] async for doc in db.cache_versions.find({"_id": {"$in": keys}})}
+    return tuple(versions.get(key, 0) for key in keys)
@@ -0,0 +1,218 @@
+"""
+Carbon footprint engine.
+
+CO2e is derived from the stored consumption series and a versioned emission
+factor table (emission_factors collection, newest version active). Monthly
+footprints are computed for any number of clients at once as array
+operations and persisted per client-month in carbon_footprints, so dashboards
+read precomputed values. The first start against existing data computes them
+in client chunks and resumes after a restart (scheduled_runs). Each client's latest yearly total is mirrored to
+clients.calculated_carbon_footprint.
+"""
+import logging
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+import numpy as np
+from pymongo import ReplaceOne, UpdateOne
+
+from .analytics import CONSUMPTION_METRICS
+from .consumption_engine import SERIES_PROJECTION, ConsumptionSeries, per_unit
+
+logger = logging.getLogger(__name__)
+
+# kg CO2e per unit: kWh electricity, m³ water, m³ natural gas, kg coal
+DEFAULT_EMISSION_FACTORS = {
+    "electricity": 0.442,
+    "water": 0.344,
+    "natural_gas": 2.02,
+    "coal": 2.42
+}
+
+FOOTPRINT_CHUNK_SIZE = 200  # clients per recompute batch
+BOOTSTRAP_RUN = "footprint_bootstrap"  # scheduled_runs document tracking the first computation
+
+
+async def get_active_factors(db) -> dict:
+    """Newest emission factor version; version 1 is seeded from the defaults on first use"""
+    factors = await db.emission_factors.find_one({}, {"_id": 0}, sort=[("version", -1)])
+    if factors:
+        return factors
+
+    factors = {"version": 1, "factors": DEFAULT_EMISSION_FACTORS, "note": "Default factors", "created_at": datetime.utcnow()}
+    await db.emission_factors.update_one({"version": 1}, {"$setOnInsert": factors}, upsert=True)
+    return await db.emission_factors.find_one({}, {"_id": 0}, sort=[("version", -1)])
+
+
+def factor_vector(factors: dict) -> np.ndarray:
+    """Emission factors in CONSUMPTION_METRICS order; metrics without a factor count as 0"""
+    return np.array([factors.get(metric, 0.0) for metric in CONSUMPTION_METRICS], dtype=float)
+
+
+def compute_emissions(series: ConsumptionSeries, factors: dict) -> dict:
+    """CO2e arrays (kg) for every client, year and month of the series"""
+    by_metric = series.metrics * factor_vector(factors)   # (clients, years, 12, metrics)
+    monthly = by_metric.sum(axis=-1)                       # (clients, years, 12)
+    yearly = monthly.sum(axis=-1)                          # (clients, years)
+    return {
+        "by_metric": by_metric,
+        "monthly": monthly,
+        "monthly_per_guest": per_unit(monthly, series.accommodation),
+        "yearly": yearly,
+        "yearly_per_guest": per_unit(yearly, series.accommodation.sum(axis=-1))
+    }
+
+
+def build_footprint_docs(series: ConsumptionSeries, factors_doc: dict) -> List[dict]:
+    """One carbon_footprints document per client-month that has a consumption row"""
+    emissions = compute_emissions(series, factors_doc["factors"])
+    now = datetime.utcnow()
+
+    docs = []
+    for c, y, m in zip(*np.nonzero(series.present)):
+        docs.append({
+            "client_id": series.client_ids[c],
+            "year": series.years[y],
+            "month": int(m) + 1,
+            "factor_version": factors_doc["version"],
+            "co2e_kg": dict(zip(CONSUMPTION_METRICS, emissions["by_metric"][c, y, m].tolist())),
+            "total_co2e_kg": float(emissions["monthly"][c, y, m]),
+            "accommodation_count": int(series.accommodation[c, y, m]),
+            "co2e_per_guest_kg": float(emissions["monthly_per_guest"][c, y, m]),
+            "updated_at": now
+        })
+    return docs
+
+
+async def write_footprints(db, series: ConsumptionSeries, factors_doc: dict, scope: dict):
+    """Replace the footprints within `scope` (a carbon_footprints filter) by those computed from `series`"""
+    started = datetime.utcnow()
+    docs = build_footprint_docs(series, factors_doc)
+    if docs:
+        await db.carbon_footprints.bulk_write(
+            [ReplaceOne({"client_id": doc["client_id"], "year": doc["year"], "month": doc["month"]}, doc, upsert=True)
+             for doc in docs],
+            ordered=False
+        )
+    # Months whose consumption row is gone
+    await db.carbon_footprints.delete_many({**scope, "updated_at": {"$lt": started}})
+    await sync_client_totals(db, series.client_ids)
+
+
+async def sync_client_totals(db, client_ids: List[str]):
+    """Mirror each client's latest yearly CO2e total onto the client record"""
+    yearly = await db.carbon_footprints.aggregate([
+        {"$match": {"client_id": {"$in": client_ids}}},
+        {"$group": {"_id": {"client_id": "$client_id", "year": "$year"}, "total": {"$sum": "$total_co2e_kg"}}},
+        {"$sort": {"_id.year": -1}},
+        {"$group": {"_id": "$_id.client_id", "year": {"$first": "$_id.year"}, "total": {"$first": "$total"}}}
+    ]).to_list(None)
+    latest = {row["_id"]: row for row in yearly}
+
+    await db.clients.bulk_write([
+        UpdateOne({"id": client_id}, {"$set": {
+            "calculated_carbon_footprint": latest[client_id]["total"] if client_id in latest else None,
+            "calculated_carbon_footprint_year": latest[client_id]["year"] if client_id in latest else None
+        }})
+        for client_id in client_ids
+    ], ordered=False)
+
+
+async def recompute_footprints(db, client_ids: Iterable[str], years: Optional[Iterable[int]] = None, factors_doc: Optional[dict] = None):
+    """Recompute the footprints of the given clients (restricted to `years` when given) in one batch"""
+    client_ids = sorted(set(client_ids))
+    if not client_ids:
+        return
+    factors_doc = factors_doc or await get_active_factors(db)
+
+    query = {"client_id": {"$in": client_ids}}
+    scope = {"client_id": {"$in": client_ids}}
+    if years is not None:
+        query["year"] = scope["year"] = {"$in": sorted(set(years))}
+
+    rows = await db.consumptions.find(query, SERIES_PROJECTION).to_list(None)
+    series_years = sorted({row["year"] for row in rows})
+    series = ConsumptionSeries.from_rows(rows, series_years, client_ids)
+    await write_footprints(db, series, factors_doc, scope)
+
+
+async def _mark_bootstrap(db, fields: dict):
+    await db.scheduled_runs.update_one({"_id": BOOTSTRAP_RUN}, {"$set": fields}, upsert=True)
+
+
+async def recompute_all_footprints(db, factors_doc: Optional[dict] = None, after: Optional[str] = None) -> int:
+    """
+    Recompute every client's footprints (only clients sorting after `after` when given) in chunks of clients,
+    recording progress in scheduled_runs; returns the number of clients processed
+    """
+    factors_doc = factors_doc or await get_active_factors(db)
+    client_ids = sorted(client_id for client_id in await db.consumptions.distinct("client_id")
+                        if client_id is not None and (after is None or client_id > after))
+    for start in range(0, len(client_ids), FOOTPRINT_CHUNK_SIZE):
+        chunk = client_ids[start:start + FOOTPRINT_CHUNK_SIZE]
+        await recompute_footprints(db, chunk, factors_doc=factors_doc)
+        await _mark_bootstrap(db, {"last_client_id": chunk[-1], "updated_at": datetime.utcnow()})
+    await _mark_bootstrap(db, {"completed_at": datetime.utcnow()})
+    logger.info(f"✅ Recomputed carbon footprints for {len(client_ids)} clients (factors v{factors_doc['version']})")
+    return len(client_ids)
+
+
+async def ensure_footprints(db):
+    """
+    Compute the footprints in the background until the first computation has completed once, resuming
+    after the last finished client chunk. Consumption writes keep them current from then on.
+    """
+    state = await db.scheduled_runs.find_one({"_id": BOOTSTRAP_RUN}) or {}
+    if state.get("completed_at"):
+        return
+    after = state.get("last_client_id")
+    logger.info(f"🔄 Computing carbon footprints{f' after client {after}' if after else ''}")
+    await recompute_all_footprints(db, after=after)
+
+
+def summarize_footprints(footprints: List[dict]) -> dict:
+    """Monthly rows plus yearly totals for one client-year of stored footprints"""
+    by_metric = {metric: sum(row["co2e_kg"].get(metric, 0) for row in footprints) for metric in CONSUMPTION_METRICS}
+    total = sum(row["total_co2e_kg"] for row in footprints)
+    guests = sum(row["accommodation_count"] for row in footprints)
+    return {
+        "monthly": footprints,
+        "yearly": {
+            "co2e_kg": by_metric,
+            "total_co2e_kg": total,
+            "accommodation_count": guests,
+            "co2e_per_guest_kg": total / guests if guests > 0 else 0
+        },
+        "factor_versions": sorted({row["factor_version"] for row in footprints})
+    }
+
+
+def portfolio_footprint_pipeline(year: int) -> list:
+    """Yearly CO2e and per-guest CO2e of every existing client, straight from the stored footprints"""
+    return [
+        {"$match": {"year": year}},
+        {"$group": {
+            "_id": "$client_id",
+            "total_co2e_kg": {"$sum": "$total_co2e_kg"},
+            "accommodation_count": {"$sum": "$accommodation_count"},
+            "months_reported": {"$sum": 1}
+        }},
+        # Footprints left behind by deleted clients are not part of the portfolio
+        {"$lookup": {"from": "clients", "localField": "_id", "foreignField": "id", "as": "client"}},
+        {"$match": {"client": {"$ne": []}}},
+        {"$project": {
+            "_id": 0,
+            "client_id": "$_id",
+            "name": {"$arrayElemAt": ["$client.name", 0]},
+            "hotel_name": {"$arrayElemAt": ["$client.hotel_name", 0]},
+            "total_co2e_kg": 1,
+            "accommodation_count": 1,
+            "months_reported": 1,
+            "co2e_per_guest_kg": {"$cond": [
+                {"$gt": ["$accommodation_count", 0]},
+                {"$divide": ["$total_co2e_kg", "$accommodation_count"]},
+                0
+            ]}
+        }},
+        {"$sort": {"total_co2e_kg": -1}}
+    ]
@@ -0,0 +1,142 @@
+"""
+Background recomputation of carbon footprints after an emission factor change.
+
+A job document in carbon_jobs records the factor version being applied and a
+checkpoint (the last client_id whose footprints were rewritten). Clients are
+processed in sorted chunks, so a job interrupted by a restart continues from
+its checkpoint. A worker holds a job by refreshing its heartbeat; jobs whose
+heartbeat went stale are picked up again on startup. Starting a new job
+supersedes any unfinished one, since its factors are out of date.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from .carbon import FOOTPRINT_CHUNK_SIZE, get_active_factors, recompute_footprints
+
+logger = logging.getLogger(__name__)
+
+JOB_STALE_AFTER = timedelta(minutes=5)  # a running job without a heartbeat for this long is resumed
+ACTIVE_STATUSES = ["pending", "running"]
+JOB_PROJECTION = {"_id": 0}
+
+
+async def create_factor_version(db, factors: dict, note: Optional[str] = None) -> dict:
+    """Store `factors` as the next emission factor version, which becomes the active one"""
+    latest = await get_active_factors(db)
+    factors_doc = {
+        "version": latest["version"] + 1,
+        "factors": factors,
+        "note": note,
+        "created_at": datetime.utcnow()
+    }
+    await db.emission_factors.insert_one(factors_doc)
+    factors_doc.pop("_id", None)
+    return factors_doc
+
+
+async def create_recompute_job(db, factor_version: int, reason: str) -> dict:
+    """Queue a job that rewrites every footprint with `factor_version`; unfinished jobs are superseded"""
+    now = datetime.utcnow()
+    await db.carbon_jobs.update_many(
+        {"status": {"$in": ACTIVE_STATUSES}},
+        {"$set": {"status": "superseded", "finished_at": now, "updated_at": now}}
+    )
+    job = {
+        "id": str(uuid.uuid4()),
+        "status": "pending",
+        "reason": reason,
+        "factor_version": factor_version,
+        "total_clients": len(await db.consumptions.distinct("client_id")),
+        "processed_clients": 0,
+        "last_client_id": None,
+        "error": None,
+        "created_at": now,
+        "started_at": None,
+        "finished_at": None,
+        "updated_at": now
+    }
+    await db.carbon_jobs.insert_one(job)
+    job.pop("_id", None)
+    return job
+
+
+async def _claim(db, job_id: str) -> Optional[dict]:
+    """Take over a pending job, or a running one whose worker stopped sending heartbeats"""
+    now = datetime.utcnow()
+    job = await db.carbon_jobs.find_one_and_update(
+        {"id": job_id, "$or": [
+            {"status": "pending"},
+            {"status": "running", "updated_at": {"$lt": now - JOB_STALE_AFTER}}
+        ]},
+        {"$set": {"status": "running", "updated_at": now}},
+        projection=JOB_PROJECTION
+    )
+    if job and job["started_at"] is None:
+        await db.carbon_jobs.update_one({"id": job_id}, {"$set": {"started_at": now}})
+    return job
+
+
+async def run_recompute_job(db, job_id: str):
+    """Process a job chunk by chunk from its checkpoint; stops early when the job is superseded"""
+    job = await _claim(db, job_id)
+    if not job:
+        return
+
+    try:
+        factors_doc = await db.emission_factors.find_one({"version": job["factor_version"]}, {"_id": 0})
+        if not factors_doc:
+            raise ValueError(f"Emission factor version {job['factor_version']} not found")
+
+        logger.info(f"🔄 Carbon job {job_id}: applying factors v{factors_doc['version']} from client {job['last_client_id']}")
+        client_ids = sorted(await db.consumptions.distinct("client_id"))
+        if job["last_client_id"] is not None:
+            client_ids = [client_id for client_id in client_ids if client_id > job["last_client_id"]]
+
+        for start in range(0, len(client_ids), FOOTPRINT_CHUNK_SIZE):
+            chunk = client_ids[start:start + FOOTPRINT_CHUNK_SIZE]
+            await recompute_footprints(db, chunk, factors_doc=factors_doc)
+            # Checkpoint and heartbeat in one write; no match means the job was superseded meanwhile
+            checkpoint = await db.carbon_jobs.find_one_and_update(
+                {"id": job_id, "status": "running"},
+                {
+                    "$set": {"last_client_id": chunk[-1], "updated_at": datetime.utcnow()},
+                    "$inc": {"processed_clients": len(chunk)}
+                },
+                projection=JOB_PROJECTION
+            )
+            if not checkpoint:
+                logger.info(f"⏹️ Carbon job {job_id} was superseded, stopping")
+                return
+
+        now = datetime.utcnow()
+        await db.carbon_jobs.update_one(
+            {"id": job_id, "status": "running"},
+            {"$set": {"status": "completed", "finished_at": now, "updated_at": now}}
+        )
+        logger.info(f"✅ Carbon job {job_id} completed")
+    except Exception as e:
+        logger.error(f"❌ Carbon job {job_id} failed: {e}")
+        now = datetime.utcnow()
+        await db.carbon_jobs.update_one(
+            {"id": job_id, "status": "running"},
+            {"$set": {"status": "failed", "error": str(e), "finished_at": now, "updated_at": now}}
+        )
+
+
+async def resume_recompute_jobs(db):
+    """
+    Continue the unfinished job left behind by a restart, if any. A job still marked running
+    is taken over once its heartbeat goes stale, unless another worker keeps it alive.
+    """
+    while True:
+        job = await db.carbon_jobs.find_one({"status": {"$in": ACTIVE_STATUSES}}, JOB_PROJECTION, sort=[("created_at", -1)])
+        if not job:
+            return
+        if job["status"] == "pending" or job["updated_at"] < datetime.utcnow() - JOB_STALE_AFTER:
+            await run_recompute_job(db, job["id"])
+            return
+        wait = job["updated_at"] + JOB_STALE_AFTER - datetime.utcnow()
+        await asyncio.sleep(max(wait.total_seconds(), 1))
@@ -0,0 +1,209 @@
+"""
+Vectorized consumption analytics.
+
+A ConsumptionSeries holds the monthly consumption of any number of clients as
+one (clients × years × 12 × fields) array, so totals, per-accommodation ratios
+and year-over-year changes are single NumPy operations whether it holds one
+hotel or the whole portfolio. Fields follow CONSUMPTION_FIELDS: the metrics
+first, accommodation_count last; adding a metric there is all it takes.
+
+Energy is normalized to kWh-equivalent with a vector of per-unit calorific
+values (electricity 1, water 0 by default), so the mixed units become one
+comparable total.
+"""
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from .analytics import ACCOMMODATION_FIELD, CONSUMPTION_FIELDS, CONSUMPTION_METRICS, MONTH_NAMES
+
+METRIC_COUNT = len(CONSUMPTION_METRICS)
+ACCOMMODATION_INDEX = CONSUMPTION_FIELDS.index(ACCOMMODATION_FIELD)
+
+# kWh per unit of each metric; natural gas (m³) and coal (kg) are normally overridden from configuration
+DEFAULT_ENERGY_FACTORS = {"electricity": 1.0, "water": 0.0, "natural_gas": 10.64, "coal": 6.98}
+
+
+def safe_divide(numerator, denominator) -> np.ndarray:
+    """Element-wise division that yields 0 wherever the denominator is 0"""
+    numerator, denominator = np.broadcast_arrays(np.asarray(numerator, dtype=float), np.asarray(denominator, dtype=float))
+    result = np.zeros(numerator.shape, dtype=float)
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+    return result
+
+
+def per_unit(values, count) -> np.ndarray:
+    """values / count, 0 wherever the count is not positive (no guests, or a bad negative count)"""
+    count = np.asarray(count, dtype=float)
+    return safe_divide(values, np.where(count > 0, count, 0))
+
+
+def percent_change(current, previous) -> np.ndarray:
+    """Percentage change from previous to current, 0 where previous is 0"""
+    previous = np.asarray(previous, dtype=float)
+    return safe_divide(100 * (np.asarray(current, dtype=float) - previous), previous)
+
+
+def energy_vector(energy_factors: dict) -> np.ndarray:
+    """kWh per unit in CONSUMPTION_METRICS order; metrics without a factor contribute nothing"""
+    return np.array([energy_factors.get(metric, 0.0) for metric in CONSUMPTION_METRICS], dtype=float)
+
+
+class ConsumptionSeries:
+    def __init__(self, client_ids: List[str], years: List[int], values: np.ndarray, present: np.ndarray):
+        self.client_ids = client_ids
+        self.years = years
+        self.values = values    # (clients, years, 12, fields), 0 where no row exists
+        self.present = present  # (clients, years, 12), True where a row exists
+        self._client_index = {client_id: i for i, client_id in enumerate(client_ids)}
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict], years: Sequence[int], client_ids: Optional[Sequence[str]] = None):
+        """Build from consumption rows; rows outside `years` (or `client_ids`, when given) are ignored"""
+        rows = list(rows)
+        if client_ids is None:
+            client_ids = sorted({row["client_id"] for row in rows})
+        client_ids, years = list(client_ids), list(years)
+        client_index = {client_id: i for i, client_id in enumerate(client_ids)}
+        year_index = {year: i for i, year in enumerate(years)}
+
+        rows = [row for row in rows if row["client_id"] in client_index and row["year"] in year_index and 1 <= row["month"] <= 12]
+        values = np.zeros((len(client_ids), len(years), 12, len(CONSUMPTION_FIELDS)), dtype=float)
+        present = np.zeros(values.shape[:3], dtype=bool)
+        if rows:
+            c = np.fromiter((client_index[row["client_id"]] for row in rows), dtype=int, count=len(rows))
+            y = np.fromiter((year_index[row["year"]] for row in rows), dtype=int, count=len(rows))
+            m = np.fromiter((row["month"] - 1 for row in rows), dtype=int, count=len(rows))
+            values[c, y, m] = [[row.get(field) or 0 for field in CONSUMPTION_FIELDS] for row in rows]
+            present[c, y, m] = True
+        return cls(client_ids, years, values, present)
+
+    def client_index(self, client_id: str) -> int:
+        return self._client_index[client_id]
+
+    def year_index(self, year: int) -> int:
+        return self.years.index(year)
+
+    @property
+    def metrics(self) -> np.ndarray:
+        """(clients, years, 12, metrics)"""
+        return self.values[..., :METRIC_COUNT]
+
+    @property
+    def accommodation(self) -> np.ndarray:
+        """(clients, years, 12)"""
+        return self.values[..., ACCOMMODATION_INDEX]
+
+    def per_person(self) -> np.ndarray:
+        """Monthly metrics per accommodation, (clients, years, 12, metrics)"""
+        return per_unit(self.metrics, self.accommodation[..., None])
+
+    def totals(self) -> np.ndarray:
+        """Yearly totals of every field, (clients, years, fields)"""
+        return self.values.sum(axis=2)
+
+    def yearly_per_person(self) -> np.ndarray:
+        """Yearly metric totals per accommodation, (clients, years, metrics)"""
+        totals = self.totals()
+        return per_unit(totals[..., :METRIC_COUNT], totals[..., ACCOMMODATION_INDEX, None])
+
+    def energy_kwh(self, energy_factors: dict) -> np.ndarray:
+        """Monthly energy in kWh-equivalent, (clients, years, 12)"""
+        return self.metrics @ energy_vector(energy_factors)
+
+
+SERIES_PROJECTION = {"_id": 0, "client_id": 1, "year": 1, "month": 1, **{field: 1 for field in CONSUMPTION_FIELDS}}
+
+
+def _field_dict(values, fields=CONSUMPTION_FIELDS) -> dict:
+    """Map a vector over `fields` to a dict, keeping accommodation_count integral"""
+    return {field: int(value) if field == ACCOMMODATION_FIELD else value
+            for field, value in zip(fields, values.tolist())}
+
+
+def _field_columns(values: np.ndarray, fields=CONSUMPTION_FIELDS) -> dict:
+    """Map a (rows, fields) matrix to one list per field, keeping accommodation_count integral"""
+    return {field: column.astype(int).tolist() if field == ACCOMMODATION_FIELD else column.tolist()
+            for field, column in zip(fields, values.T)}
+
+
+def serialize_analytics(series: ConsumptionSeries, client_id: str, year: int, energy_factors: Optional[dict] = None,
+                        columnar: bool = False) -> dict:
+    """
+    The /consumptions/analytics response for `year` vs `year - 1`; the series must hold both years.
+    columnar=True replaces monthly_comparison with one 12-value list per field under "monthly".
+    """
+    energy_factors = energy_factors or DEFAULT_ENERGY_FACTORS
+    c = series.client_index(client_id)
+    current, previous = series.year_index(year), series.year_index(year - 1)
+
+    values = series.values[c]
+    per_person = series.per_person()[c]
+    totals = series.totals()[c]
+    yearly_per_person = series.yearly_per_person()[c]
+    # Delta and percent of `year` against `year - 1`
+    delta = totals[current] - totals[previous]
+    percent = percent_change(totals[current], totals[previous])
+
+    energy = series.energy_kwh(energy_factors)[c]                          # (years, 12)
+    energy_per_person = per_unit(energy, series.accommodation[c])
+    yearly_energy = energy.sum(axis=1)                                      # (years,)
+    yearly_energy_per_person = per_unit(yearly_energy, totals[:, ACCOMMODATION_INDEX])
+
+    if columnar:
+        monthly = {
+            "monthly": {
+                "month": list(range(1, 13)),
+                "month_name": MONTH_NAMES[1:],
+                "current_year": _field_columns(values[current]),
+                "previous_year": _field_columns(values[previous]),
+                "current_year_per_person": _field_columns(per_person[current], CONSUMPTION_METRICS),
+                "previous_year_per_person": _field_columns(per_person[previous], CONSUMPTION_METRICS),
+                "current_year_energy_kwh": energy[current].tolist(),
+                "previous_year_energy_kwh": energy[previous].tolist(),
+                "current_year_energy_per_person_kwh": energy_per_person[current].tolist(),
+                "previous_year_energy_per_person_kwh": energy_per_person[previous].tolist()
+            }
+        }
+    else:
+        monthly = {
+            "monthly_comparison": [
+                {
+                    "month": month + 1,
+                    "month_name": MONTH_NAMES[month + 1],
+                    "current_year": _field_dict(values[current, month]),
+                    "previous_year": _field_dict(values[previous, month]),
+                    "current_year_per_person": _field_dict(per_person[current, month], CONSUMPTION_METRICS),
+                    "previous_year_per_person": _field_dict(per_person[previous, month], CONSUMPTION_METRICS),
+                    "current_year_energy_kwh": float(energy[current, month]),
+                    "previous_year_energy_kwh": float(energy[previous, month]),
+                    "current_year_energy_per_person_kwh": float(energy_per_person[current, month]),
+                    "previous_year_energy_per_person_kwh": float(energy_per_person[previous, month])
+                }
+                for month in range(12)
+            ]
+        }
+
+    return {
+        "year": year,
+        **({"format": "columnar"} if columnar else {}),
+        **monthly,
+        "yearly_totals": {
+            "current_year": _field_dict(totals[current]),
+            "previous_year": _field_dict(totals[previous])
+        },
+        "yearly_per_person": {
+            "current_year": _field_dict(yearly_per_person[current], CONSUMPTION_METRICS),
+            "previous_year": _field_dict(yearly_per_person[previous], CONSUMPTION_METRICS)
+        },
+        "yearly_change": {
+            "delta": _field_dict(delta),
+            "percent": dict(zip(CONSUMPTION_FIELDS, percent.tolist()))
+        },
+        "yearly_energy": {
+            "current_year": {"energy_kwh": float(yearly_energy[current]), "per_person_kwh": float(yearly_energy_per_person[current])},
+            "previous_year": {"energy_kwh": float(yearly_energy[previous]), "per_person_kwh": float(yearly_energy_per_person[previous])},
+            "percent": float(percent_change(yearly_energy[current], yearly_energy[previous]))
+        },
+        "energy_factors": energy_factors
+    }
@@ -0,0 +1,183 @@
+"""
+Repair consumption rows that block the unique (client_id, year, month) index.
+
+Older versions wrote client_id: null when a client user edited a month, and
+concurrent creates could store the same month twice. Before the index is
+required, rows without a client are assigned where the owner is known (an
+explicit --assign, or the only client in the database), and each duplicated
+month keeps its most recently written row. Rows that cannot stay are moved to
+consumption_quarantine with the reason, never deleted. Runs on startup while
+the index is missing; run by hand to preview, or to assign orphaned rows
+(also ones already quarantined, which are then restored):
+
+    python -m services.consumption_repair                  # report only
+    python -m services.consumption_repair --apply [--assign CONSUMPTION_ID=CLIENT_ID ...]
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from pymongo import ReplaceOne
+from pymongo.errors import DuplicateKeyError
+
+from .carbon import recompute_footprints
+from .rollups import refresh_rollups
+
+logger = logging.getLogger(__name__)
+
+MISSING_CLIENT = "missing_client_id"
+DUPLICATE_MONTH = "duplicate_month"
+ROW_FIELDS = {"_id": 1, "id": 1, "client_id": 1, "year": 1, "month": 1, "created_at": 1, "updated_at": 1}
+
+
+def _written_at(row: dict) -> datetime:
+    return row.get("updated_at") or row.get("created_at") or datetime.min
+
+
+async def _quarantine(db, rows: list, reason: str, kept: Optional[Dict] = None):
+    """Move full rows to consumption_quarantine (idempotent by _id), then drop them from consumptions"""
+    if not rows:
+        return
+    ids = [row["_id"] for row in rows]
+    now = datetime.utcnow()
+    docs = await db.consumptions.find({"_id": {"$in": ids}}).to_list(None)
+    await db.consumption_quarantine.bulk_write([
+        ReplaceOne({"_id": doc["_id"]}, {
+            **doc,
+            "quarantine_reason": reason,
+            "kept_id": (kept or {}).get(doc["_id"]),
+            "quarantined_at": now
+        }, upsert=True)
+        for doc in docs
+    ], ordered=False)
+    await db.consumptions.delete_many({"_id": {"$in": ids}})
+
+
+async def repair_consumptions(db, apply: bool = False, assignments: Optional[Dict[str, str]] = None) -> dict:
+    """
+    Resolve null client_ids and duplicate months. With apply=False only the report is built.
+    assignments maps consumption id to client id for orphaned rows whose owner is known.
+    """
+    report = {"assigned": [], "restored": [], "duplicates": [], "quarantined": []}
+    touched = set()   # (client_id, year) whose rollups and footprints change
+
+    # 1. Rows without a client: assign where the owner is known
+    orphans = await db.consumptions.find({"client_id": None}, ROW_FIELDS).to_list(None)
+    client_ids = [client["id"] for client in await db.clients.find({}, {"_id": 0, "id": 1}).to_list(None)]
+    assignments = {row_id: client_id for row_id, client_id in (assignments or {}).items() if client_id in client_ids}
+    only_client = client_ids[0] if len(client_ids) == 1 else None
+
+    unassigned = []
+    for row in orphans:
+        client_id = assignments.get(row.get("id")) or only_client
+        if not client_id:
+            unassigned.append(row)
+            continue
+        report["assigned"].append({"id": row.get("id"), "client_id": client_id, "year": row["year"], "month": row["month"]})
+        touched.add((client_id, row["year"]))
+        if apply:
+            await db.consumptions.update_one({"_id": row["_id"]}, {"$set": {"client_id": client_id}})
+
+    # Orphans quarantined earlier (e.g. on startup) go back once their owner is given
+    restorable = await db.consumption_quarantine.find(
+        {"quarantine_reason": MISSING_CLIENT, "id": {"$in": list(assignments)}}
+    ).to_list(None)
+    for doc in restorable:
+        client_id = assignments[doc["id"]]
+        row = {key: value for key, value in doc.items() if key not in ("quarantine_reason", "kept_id", "quarantined_at")}
+        report["restored"].append({"id": doc["id"], "client_id": client_id, "year": doc["year"], "month": doc["month"]})
+        touched.add((client_id, doc["year"]))
+        if apply:
+            try:
+                await db.consumptions.insert_one({**row, "client_id": client_id})
+            except DuplicateKeyError:
+                # The month was entered again meanwhile; the quarantined copy stays where it is
+                report["restored"][-1]["conflict"] = True
+                continue
+            await db.consumption_quarantine.delete_one({"_id": doc["_id"]})
+
+    # 2. Orphans nobody claimed cannot take part in the index
+    report["quarantined"] += [{"id": row.get("id"), "reason": MISSING_CLIENT} for row in unassigned]
+    if apply:
+        await _quarantine(db, unassigned, MISSING_CLIENT)
+
+    # 3. Duplicate months: the most recently written row wins (after the assignments above when applied)
+    groups = await db.consumptions.aggregate([
+        {"$match": {"client_id": {"$ne": None}}},
+        {"$group": {
+            "_id": {"client_id": "$client_id", "year": "$year", "month": "$month"},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True).to_list(None)
+    duplicated = {
+        row["_id"]: row for row in
+        await db.consumptions.find({"_id": {"$in": [_id for group in groups for _id in group["ids"]]}}, ROW_FIELDS).to_list(None)
+    }
+
+    for group in groups:
+        rows = sorted((duplicated[_id] for _id in group["ids"]), key=_written_at, reverse=True)
+        kept, dropped = rows[0], rows[1:]
+        key = group["_id"]
+        report["duplicates"].append({**key, "kept": kept.get("id"), "dropped": [row.get("id") for row in dropped]})
+        report["quarantined"] += [{"id": row.get("id"), "reason": DUPLICATE_MONTH} for row in dropped]
+        touched.add((key["client_id"], key["year"]))
+        if apply:
+            await _quarantine(db, dropped, DUPLICATE_MONTH, {row["_id"]: kept.get("id") for row in dropped})
+
+    if apply and touched:
+        for client_id in {client_id for client_id, _ in touched}:
+            years = {year for c, year in touched if c == client_id}
+            await refresh_rollups(db, [client_id], years)
+            await recompute_footprints(db, [client_id], years)
+
+    if report["assigned"] or report["restored"] or report["quarantined"]:
+        verb = "Repaired" if apply else "Would repair"
+        logger.warning(
+            f"🔧 {verb} consumptions: {len(report['assigned']) + len(report['restored'])} row(s) assigned to a client, "
+            f"{len(report['duplicates'])} duplicated month(s), {len(report['quarantined'])} row(s) moved to consumption_quarantine"
+        )
+    return report
+
+
+async def _main(apply: bool, assignments: Dict[str, str]):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent.parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    report = await repair_consumptions(db, apply, assignments)
+    print(f"Assigned ({len(report['assigned'])}):")
+    for row in report["assigned"]:
+        print(f"  {row['id']} -> {row['client_id']} ({row['year']}-{row['month']:02d})")
+    print(f"Restored from quarantine ({len(report['restored'])}):")
+    for row in report["restored"]:
+        conflict = " [month already exists, left in quarantine]" if row.get("conflict") else ""
+        print(f"  {row['id']} -> {row['client_id']} ({row['year']}-{row['month']:02d}){conflict}")
+    print(f"Duplicated months ({len(report['duplicates'])}):")
+    for group in report["duplicates"]:
+        print(f"  {group['client_id']} {group['year']}-{group['month']:02d}: keep {group['kept']}, drop {', '.join(map(str, group['dropped']))}")
+    print(f"Quarantined ({len(report['quarantined'])}):")
+    for row in report["quarantined"]:
+        print(f"  {row['id']} [{row['reason']}]")
+    if not apply:
+        print("Report only; run with --apply to make these changes")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Repair consumption rows that block the unique month index")
+    parser.add_argument("--apply", action="store_true", help="write the changes (default: report only)")
+    parser.add_argument("--assign", action="append", default=[], metavar="CONSUMPTION_ID=CLIENT_ID",
+                        help="owner of a row saved without client_id (repeatable)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args.apply, dict(item.split("=", 1) for item in args.assign)))
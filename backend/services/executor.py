@@ -0,0 +1,78 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from .metrics import register_metrics_hook
+
+
+class BoundedExecutor:
+    """
+    Fixed-size thread pool for blocking calls made from async code, so they never
+    run on the event loop. Calls beyond max_workers wait in the pool's queue; the
+    queue depth and wait times are reported through the metrics hook under the name.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        register_metrics_hook(f"executor.{name}", self.stats)
+
+    @property
+    def queue_depth(self) -> int:
+        """Calls submitted but not yet picked up by a worker"""
+        return self.submitted - self.completed - self.failed - self.running
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on the pool and await its result"""
+        with self._lock:
+            self.submitted += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        call = functools.partial(self._call, time.monotonic(), fn, args, kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self._pool, call)
+
+    def _call(self, queued_at: float, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        wait = time.monotonic() - queued_at
+        with self._lock:
+            self.running += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self.running -= 1
+                self.failed += 1
+            raise
+        with self._lock:
+            self.running -= 1
+            self.completed += 1
+        return result
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+    def stats(self) -> dict:
+        started = self.completed + self.failed + self.running
+        return {
+            "max_workers": self.max_workers,
+            "running": self.running,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_wait_ms": round(1000 * self.total_wait / started, 2) if started else 0.0,
+            "max_wait_ms": round(1000 * self.max_wait, 2)
+        }
@@ -0,0 +1,38 @@
+import json
+import zlib
+from datetime import date, datetime
+from typing import AsyncIterator
+
+# Rows are grouped into chunks of roughly this size before being written to the response
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+async def ndjson_stream(cursor) -> AsyncIterator[bytes]:
+    """Encode rows from a Motor cursor as newline-delimited JSON, one chunk at a time"""
+    buffer = []
+    buffered = 0
+    async for row in cursor:
+        line = (json.dumps(row, default=_json_default, ensure_ascii=False) + "\n").encode()
+        buffer.append(line)
+        buffered += len(line)
+        if buffered >= EXPORT_CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Gzip an async byte stream incrementally"""
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
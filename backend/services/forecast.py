@@ -0,0 +1,182 @@
+"""
+Seasonal consumption forecasts.
+
+The monthly series of one client or of the whole portfolio is flattened to
+one row per (client, field). Every row is fitted in a single vectorized run of
+additive Holt-Winters (period 12), with the smoothing parameters picked per
+row from a small grid by one-step-ahead error. Rows with less than two years
+of history fall back to a seasonal naive forecast: the last observed value of
+the same calendar month. Each client's forecast starts after its own latest
+reported month and is never negative.
+"""
+from itertools import product
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .analytics import ACCOMMODATION_FIELD, CONSUMPTION_FIELDS, MAX_CONSUMPTION_YEAR, MIN_CONSUMPTION_YEAR, MONTH_NAMES
+from .consumption_engine import ConsumptionSeries
+
+SEASON = 12
+MAX_HORIZON = 24
+MIN_HOLT_WINTERS_MONTHS = 2 * SEASON
+FORECAST_HISTORY_MONTHS = 10 * SEASON  # most recent months of each client that are fitted
+# (alpha, beta, gamma) candidates: level, trend and seasonal smoothing
+PARAMETER_GRID = np.array(list(product([0.1, 0.3, 0.5, 0.8], [0.0, 0.05, 0.2], [0.05, 0.2, 0.5])))
+
+
+def _seasonal_naive(values: np.ndarray, present: np.ndarray, horizon: int, start: np.ndarray) -> np.ndarray:
+    """Last observed value of each calendar month, or the row's mean where a month was never observed"""
+    rows, steps = values.shape
+    last = np.full((rows, SEASON), np.nan)
+    for t in range(steps):
+        last[:, t % SEASON] = np.where(present[:, t], values[:, t], last[:, t % SEASON])
+    counts = present.sum(axis=1)
+    mean = np.divide(np.where(present, values, 0).sum(axis=1), counts, out=np.zeros(rows), where=counts > 0)
+    last = np.where(np.isnan(last), mean[:, None], last)
+    return np.take_along_axis(last, (start[:, None] + np.arange(horizon)) % SEASON, axis=1)
+
+
+def _holt_winters(values: np.ndarray, present: np.ndarray, horizon: int, start: np.ndarray) -> tuple:
+    """
+    Additive Holt-Winters for every row and every grid candidate at once. Each row is initialized
+    from its own first observed season and fitted up to its own `start` (one past its last observed
+    month); missing months in between are filled with the model's one-step forecast. Returns
+    (forecast, parameters) of the candidate with the lowest one-step error.
+    """
+    rows, steps = values.shape
+    alpha, beta, gamma = (PARAMETER_GRID[:, i, None] for i in range(3))   # (candidates, 1)
+    candidates = len(PARAMETER_GRID)
+    row_index = np.arange(rows)
+
+    # Initial state from the first twelve months after each row's first observation
+    first = present.argmax(axis=1)
+    window = np.minimum(first[:, None] + np.arange(SEASON), steps - 1)      # (rows, 12)
+    window_present = present[row_index[:, None], window]
+    window_values = np.where(window_present, values[row_index[:, None], window], 0)
+    counts = window_present.sum(axis=1)
+    level0 = np.divide(window_values.sum(axis=1), counts, out=np.zeros(rows), where=counts > 0)
+    seasonal0 = np.zeros((rows, SEASON))
+    seasonal0[row_index[:, None], window % SEASON] = np.where(window_present, window_values - level0[:, None], 0)
+
+    level = np.broadcast_to(level0, (candidates, rows)).copy()
+    trend = np.zeros((candidates, rows))
+    seasonal = np.broadcast_to(seasonal0, (candidates, rows, SEASON)).copy()
+
+    sse = np.zeros((candidates, rows))
+    for t in range(steps):
+        # Past the initial season and not yet past the row's own last observation
+        active = (t >= first + SEASON) & (t < start)                       # (rows,)
+        if not active.any():
+            continue
+        m = t % SEASON
+        predicted = level + trend + seasonal[:, :, m]
+        observed = np.where(present[:, t], values[:, t], predicted)
+        sse += np.where(active & present[:, t], (observed - predicted) ** 2, 0)
+
+        new_level = alpha * (observed - seasonal[:, :, m]) + (1 - alpha) * (level + trend)
+        new_trend = beta * (new_level - level) + (1 - beta) * trend
+        seasonal[:, :, m] = np.where(active, gamma * (observed - new_level) + (1 - gamma) * seasonal[:, :, m], seasonal[:, :, m])
+        level = np.where(active, new_level, level)
+        trend = np.where(active, new_trend, trend)
+
+    best = sse.argmin(axis=0)                                              # (rows,)
+    k = np.arange(1, horizon + 1)
+    months = (start[:, None] + np.arange(horizon)) % SEASON                # (rows, horizon)
+    forecast = (level[best, row_index][:, None] + k * trend[best, row_index][:, None]
+                + np.take_along_axis(seasonal[best, row_index], months, axis=1))
+    return forecast, PARAMETER_GRID[best]
+
+
+def forecast_years(years: Iterable[int]) -> List[int]:
+    """Contiguous year axis over the valid years present (typos outside the accepted range are ignored)"""
+    valid = [year for year in years if isinstance(year, int) and MIN_CONSUMPTION_YEAR <= year <= MAX_CONSUMPTION_YEAR]
+    return list(range(min(valid), max(valid) + 1)) if valid else []
+
+
+def forecast_series(series: ConsumptionSeries, horizon: int = MAX_HORIZON) -> dict:
+    """
+    Forecast every client and field of the series for `horizon` months after that client's own latest
+    reported month, from at most its last FORECAST_HISTORY_MONTHS months. A client's forecast depends
+    only on its own rows, so it is the same whether fitted alone or with the whole portfolio.
+    """
+    clients = len(series.client_ids)
+    fields = len(CONSUMPTION_FIELDS)
+    flat_present = series.present.reshape(clients, -1)          # (clients, years * 12)
+    total_steps = flat_present.shape[1]
+
+    # One past each client's latest reported month (0 = no data), and its history window
+    step_index = np.arange(total_steps)
+    end = np.where(flat_present.any(axis=1), total_steps - flat_present[:, ::-1].argmax(axis=1), 0)
+    flat_present = flat_present & (step_index >= (end - FORECAST_HISTORY_MONTHS)[:, None])
+
+    # Drop the leading steps that no client uses; offsets keep their calendar month (a multiple of 12)
+    used = np.nonzero(flat_present.any(axis=0))[0]
+    offset = int(used[0]) // SEASON * SEASON if len(used) else 0
+    steps = int(end.max()) - offset if len(used) else 0
+    start = np.maximum(end - offset, 0)
+
+    # One row per (client, field): (clients * fields, steps)
+    values = series.values.reshape(clients, -1, fields)[:, offset:offset + steps].transpose(0, 2, 1).reshape(clients * fields, steps)
+    present = np.repeat(flat_present[:, None, offset:offset + steps], fields, axis=1).reshape(clients * fields, steps)
+    row_start = np.repeat(start, fields)
+
+    forecast = _seasonal_naive(values, present, horizon, row_start)
+    parameters = np.full((clients * fields, 3), np.nan)
+    months_reported = flat_present.sum(axis=1)
+    use_holt_winters = np.repeat(months_reported >= MIN_HOLT_WINTERS_MONTHS, fields)
+    if use_holt_winters.any():
+        fitted, fitted_parameters = _holt_winters(
+            values[use_holt_winters], present[use_holt_winters], horizon, row_start[use_holt_winters]
+        )
+        forecast[use_holt_winters] = fitted
+        parameters[use_holt_winters] = fitted_parameters
+
+    first_year = series.years[0] if series.years else None
+    origins = [
+        {"year": first_year + (int(e) - 1) // SEASON, "month": (int(e) - 1) % SEASON + 1} if e else None
+        for e in end
+    ]
+    return {
+        "client_ids": series.client_ids,
+        "first_year": first_year,
+        "origins": origins,
+        "end": end,
+        "months_reported": months_reported,
+        "method": np.where(months_reported >= MIN_HOLT_WINTERS_MONTHS, "holt_winters", "seasonal_naive"),
+        "forecast": np.clip(forecast, 0, None).reshape(clients, fields, horizon),
+        "parameters": parameters.reshape(clients, fields, 3)
+    }
+
+
+def latest_origin(result: dict) -> Optional[dict]:
+    """The most recent of the per-client origins, e.g. for a portfolio-wide header"""
+    origins = [origin for origin in result["origins"] if origin]
+    return max(origins, key=lambda origin: (origin["year"], origin["month"])) if origins else None
+
+
+def serialize_forecast(result: dict, client_index: int, horizon: int) -> dict:
+    """One client's forecast in the API shape, truncated to `horizon` months"""
+    c = client_index
+    months: List[Dict] = []
+    for step in range(horizon):
+        absolute = int(result["end"][c]) + step
+        month = absolute % SEASON + 1
+        values = {
+            field: int(round(value)) if field == ACCOMMODATION_FIELD else value
+            for field, value in zip(CONSUMPTION_FIELDS, result["forecast"][c, :, step].tolist())
+        }
+        months.append({"year": result["first_year"] + absolute // SEASON, "month": month, "month_name": MONTH_NAMES[month], **values})
+
+    method = str(result["method"][c])
+    return {
+        "client_id": result["client_ids"][c],
+        "origin": result["origins"][c],
+        "method": method,
+        "months_reported": int(result["months_reported"][c]),
+        "parameters": {
+            field: dict(zip(("alpha", "beta", "gamma"), result["parameters"][c, f].tolist()))
+            for f, field in enumerate(CONSUMPTION_FIELDS)
+        } if method == "holt_winters" else None,
+        "months": months
+    }
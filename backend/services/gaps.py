@@ -0,0 +1,71 @@
+"""
+Missing consumption data report.
+
+One aggregation matches only the consumption rows inside the period and
+groups them on the server into the months each client reported;
+clients are read separately so those without any rows are listed too.
+Presence becomes one boolean (clients × months) matrix, and each
+client's row is returned as a compact bitmap string: one character per
+month, "1" reported and "0" missing.
+"""
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+MAX_GAP_MONTHS = 60
+
+
+def month_index(year: int, month: int) -> int:
+    return year * 12 + month - 1
+
+
+def month_key(index: int) -> str:
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+def parse_month(value: str) -> int:
+    """'YYYY-MM' to a month index; raises ValueError on anything else"""
+    year, month = value.split("-")
+    if len(year) != 4 or not 1 <= int(month) <= 12:
+        raise ValueError(f"Invalid month: {value}")
+    return month_index(int(year), int(month))
+
+
+def gap_pipeline(start: int, end: int) -> list:
+    """Per client_id, the month indexes reported between start and end inclusive"""
+    index = {"$add": [{"$multiply": ["$year", 12]}, "$month", -1]}
+    return [
+        # The year range can use the year_month_id index; the month bounds are exact
+        {"$match": {
+            "year": {"$gte": start // 12, "$lte": end // 12},
+            "$expr": {"$and": [{"$gte": [index, start]}, {"$lte": [index, end]}]}
+        }},
+        {"$group": {"_id": "$client_id", "reported": {"$addToSet": index}}}
+    ]
+
+
+def build_gap_report(clients: List[dict], reported: Dict[str, List[int]], start: int, end: int) -> Tuple[np.ndarray, List[dict]]:
+    """Presence matrix and per-client bitmaps, clients with the most missing months first"""
+    months = end - start + 1
+    present = np.zeros((len(clients), months), dtype=bool)
+    client_months = [reported.get(client["id"], []) for client in clients]
+    rows = np.repeat(np.arange(len(clients)), [len(indexes) for indexes in client_months])
+    offsets = np.fromiter((index for indexes in client_months for index in indexes), dtype=int, count=len(rows)) - start
+    present[rows, offsets] = True
+
+    missing = months - present.sum(axis=1)
+    bitmaps = np.where(present, "1", "0")
+    order = np.argsort(-missing, kind="stable")
+
+    report = [
+        {
+            "client_id": clients[i]["id"],
+            "name": clients[i].get("name"),
+            "hotel_name": clients[i].get("hotel_name"),
+            "bitmap": "".join(bitmaps[i]),
+            "missing_count": int(missing[i]),
+            "latest_missing": bool(not present[i, -1])
+        }
+        for i in order.tolist()
+    ]
+    return present, report
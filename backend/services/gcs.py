@@ -1,12 +1,42 @@
+from google.auth.credentials import AnonymousCredentials
 from google.cloud import storage
 from google.oauth2 import service_account
+import io
 import os
 import uuid
 from datetime import datetime, timedelta
 import logging
+from typing import BinaryIO, Optional
+
+from .executor import BoundedExecutor
 
 logger = logging.getLogger(__name__)
 
+# Part size of resumable uploads; also the most upload data held in memory at once. GCS needs a multiple of 256KB
+GCS_UPLOAD_CHUNK_SIZE = int(os.environ.get('GCS_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)) // (256 * 1024) * (256 * 1024) or 256 * 1024
+# Threads for the blocking SDK calls; storage calls beyond this wait in the pool's queue instead of on the event loop
+GCS_IO_THREADS = int(os.environ.get('GCS_IO_THREADS', 8))
+# "sdk": google-cloud-storage on gcs_executor; "httpx": native async client (services/gcs_async.py)
+GCS_BACKEND = os.environ.get('GCS_BACKEND', 'sdk')
+
+CONTENT_TYPE_MAP = {
+    'pdf': 'application/pdf',
+    'doc': 'application/msword',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'xls': 'application/vnd.ms-excel',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'gif': 'image/gif',
+    'txt': 'text/plain',
+    'zip': 'application/zip',
+    'rar': 'application/x-rar-compressed',
+    '7z': 'application/x-7z-compressed',
+    'tar': 'application/x-tar',
+    'gz': 'application/gzip'
+}
+
 class GoogleCloudStorage:
     def __init__(self):
         # Hardcoded values for debugging
@@ -26,6 +56,9 @@ class GoogleCloudStorage:
         if env_creds:
             self.credentials_path = env_creds
         
+        # Signed URLs need a service-account key; a keyless emulator serves plain object URLs instead
+        self.can_sign = False
+
         # Initialize client
         try:
             logger.info(f"🔍 GCS Initialization:")
@@ -39,7 +72,12 @@ class GoogleCloudStorage:
                     self.credentials_path
                 )
                 self.client = storage.Client(credentials=credentials, project=self.project_id)
+                self.can_sign = True
                 logger.info("✅ GCS client initialized successfully")
+            elif os.getenv("STORAGE_EMULATOR_HOST"):
+                # Local emulator (e.g. tools/fake_gcs_server.py); the SDK sends requests there unauthenticated
+                self.client = storage.Client(credentials=AnonymousCredentials(), project=self.project_id)
+                logger.info(f"✅ GCS client using emulator at {os.getenv('STORAGE_EMULATOR_HOST')}")
             else:
                 # For development without credentials, use mock mode
                 logger.warning("❌ GCS credentials not found, using mock mode")
@@ -55,83 +93,107 @@ class GoogleCloudStorage:
             self.client = None
             self.bucket = None
 
+    @staticmethod
+    def _blob_name(filename: str) -> str:
+        file_extension = filename.split('.')[-1].lower() if '.' in filename else ''
+        unique_filename = f"{uuid.uuid4()}.{file_extension}" if file_extension else str(uuid.uuid4())
+        return f"documents/{datetime.now().strftime('%Y/%m')}/{unique_filename}"
+
+    @staticmethod
+    def _content_type(filename: str) -> str:
+        file_extension = filename.split('.')[-1].lower() if '.' in filename else ''
+        return CONTENT_TYPE_MAP.get(file_extension, 'application/octet-stream')
+
+    @staticmethod
+    def _stream_size(fileobj: BinaryIO) -> int:
+        """Bytes left in a seekable stream, without reading it"""
+        position = fileobj.tell()
+        size = fileobj.seek(0, io.SEEK_END) - position
+        fileobj.seek(position)
+        return size
+
+    def _mock_result(self, filename: str, file_size: int, error: str = None) -> dict:
+        mock_url = f"https://storage.googleapis.com/{self.bucket_name or 'mock-bucket'}/{filename}"
+        result = {
+            "url": mock_url,
+            "file_path": f"/documents/{filename}",
+            "file_size": file_size,
+            "mock": True
+        }
+        if error:
+            result["error"] = error
+        return result
+
+    def _upload_blob(self, fileobj: BinaryIO, blob_name: str, content_type: str, size: int) -> str:
+        """Blocking upload and publish; runs on gcs_executor. Returns the file URL"""
+        blob = self.bucket.blob(blob_name, chunk_size=GCS_UPLOAD_CHUNK_SIZE)
+        blob.upload_from_file(fileobj, size=size, content_type=content_type)
+
+        # Make blob publicly readable since bucket is public
+        try:
+            blob.make_public()
+            logger.info(f"File made public: {blob.public_url}")
+            return blob.public_url
+        except Exception as e:
+            logger.warning(f"Could not make file public, using signed URL: {e}")
+            # Fallback to signed URL
+            return blob.generate_signed_url(
+                expiration=datetime.utcnow() + timedelta(hours=24*7),  # 7 days
+                method='GET'
+            )
+
+    def _existing_blob_signed_url(self, blob_name: str, expiration_hours: int) -> str:
+        """Blocking existence check and signing; runs on gcs_executor"""
+        blob = self.bucket.blob(blob_name)
+
+        # Check if file exists before generating signed URL
+        if not blob.exists():
+            logger.error(f"File does not exist in GCS: {blob_name}")
+            raise Exception(f"File not found in storage: {blob_name}")
+
+        if not self.can_sign:
+            return blob.public_url
+        return blob.generate_signed_url(
+            expiration=datetime.utcnow() + timedelta(hours=expiration_hours),
+            method='GET'
+        )
+
     async def upload_file(self, file_content: bytes, filename: str, content_type: str = None) -> dict:
         """
         Upload file to Google Cloud Storage
         Returns: dict with url, file_path, and file_size
         """
+        return await self.upload_stream(io.BytesIO(file_content), filename, content_type, size=len(file_content))
+
+    async def upload_stream(self, fileobj: BinaryIO, filename: str, content_type: str = None, size: int = None) -> dict:
+        """
+        Upload a seekable file object (e.g. UploadFile.file) from its current position without reading it
+        into memory: files above GCS_UPLOAD_CHUNK_SIZE go up as a resumable upload, one part at a time
+        Returns: dict with url, file_path, and file_size
+        """
+        if size is None:
+            size = self._stream_size(fileobj)
         try:
             if not self.bucket:
                 # Mock mode for development
-                mock_url = f"https://storage.googleapis.com/{self.bucket_name or 'mock-bucket'}/{filename}"
-                return {
-                    "url": mock_url,
-                    "file_path": f"/documents/{filename}",
-                    "file_size": len(file_content),
-                    "mock": True
-                }
-            
-            # Generate unique filename
-            file_extension = filename.split('.')[-1].lower() if '.' in filename else ''
-            unique_filename = f"{uuid.uuid4()}.{file_extension}" if file_extension else str(uuid.uuid4())
-            blob_name = f"documents/{datetime.now().strftime('%Y/%m')}/{unique_filename}"
-            
-            # Determine content type if not provided
-            if not content_type:
-                content_type_map = {
-                    'pdf': 'application/pdf',
-                    'doc': 'application/msword',
-                    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                    'xls': 'application/vnd.ms-excel',
-                    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                    'png': 'image/png',
-                    'jpg': 'image/jpeg',
-                    'jpeg': 'image/jpeg',
-                    'gif': 'image/gif',
-                    'txt': 'text/plain',
-                    'zip': 'application/zip',
-                    'rar': 'application/x-rar-compressed',
-                    '7z': 'application/x-7z-compressed',
-                    'tar': 'application/x-tar',
-                    'gz': 'application/gzip'
-                }
-                content_type = content_type_map.get(file_extension, 'application/octet-stream')
-            
-            # Upload to GCS
-            blob = self.bucket.blob(blob_name)
-            blob.upload_from_string(file_content, content_type=content_type)
-            
-            # Make blob publicly readable since bucket is public
-            try:
-                blob.make_public()
-                logger.info(f"File made public: {blob.public_url}")
-                file_url = blob.public_url
-            except Exception as e:
-                logger.warning(f"Could not make file public, using signed URL: {e}")
-                # Fallback to signed URL
-                file_url = blob.generate_signed_url(
-                    expiration=datetime.utcnow() + timedelta(hours=24*7),  # 7 days
-                    method='GET'
-                )
-            
+                return self._mock_result(filename, size)
+
+            blob_name = self._blob_name(filename)
+            file_url = await gcs_executor.run(
+                self._upload_blob, fileobj, blob_name, content_type or self._content_type(filename), size
+            )
+
             return {
                 "url": file_url,
                 "file_path": blob_name,
-                "file_size": len(file_content),
+                "file_size": size,
                 "mock": False
             }
-            
+
         except Exception as e:
             logger.error(f"Failed to upload file to GCS: {e}")
             # Fallback to mock
-            mock_url = f"https://storage.googleapis.com/{self.bucket_name or 'mock-bucket'}/{filename}"
-            return {
-                "url": mock_url,
-                "file_path": f"/documents/{filename}",
-                "file_size": len(file_content),
-                "mock": True,
-                "error": str(e)
-            }
+            return self._mock_result(filename, size, error=str(e))
 
     async def delete_file(self, file_path: str) -> bool:
         """Delete file from Google Cloud Storage"""
@@ -140,8 +202,7 @@ class GoogleCloudStorage:
                 logger.info(f"Mock delete: {file_path}")
                 return True
                 
-            blob = self.bucket.blob(file_path)
-            blob.delete()
+            await gcs_executor.run(self.bucket.blob(file_path).delete)
             return True
             
         except Exception as e:
@@ -157,23 +218,43 @@ class GoogleCloudStorage:
             if not self.bucket:
                 return f"https://storage.googleapis.com/{self.bucket_name or 'mock-bucket'}/{clean_path}"
                 
-            blob = self.bucket.blob(clean_path)
-            
-            # Check if file exists before generating signed URL
-            if not blob.exists():
-                logger.error(f"File does not exist in GCS: {clean_path}")
-                raise Exception(f"File not found in storage: {clean_path}")
-            
-            url = blob.generate_signed_url(
-                expiration=datetime.utcnow() + timedelta(hours=expiration_hours),
-                method='GET'
-            )
-            return url
-            
+            return await gcs_executor.run(self._existing_blob_signed_url, clean_path, expiration_hours)
+
         except Exception as e:
             logger.error(f"Failed to generate signed URL: {e}")
             clean_path = file_path.lstrip('/')
             return f"https://storage.googleapis.com/{self.bucket_name or 'mock-bucket'}/{clean_path}"
 
-# Global instance
-gcs_service = GoogleCloudStorage()
\ No newline at end of file
+    async def get_metadata(self, file_path: str) -> Optional[dict]:
+        """Object metadata, or None when the object does not exist (always in mock mode)"""
+        if not self.bucket:
+            return None
+        blob = await gcs_executor.run(self.bucket.get_blob, file_path.lstrip('/'))
+        if not blob:
+            return None
+        return {
+            "name": blob.name,
+            "bucket": blob.bucket.name,
+            "size": blob.size,
+            "content_type": blob.content_type,
+            "md5_hash": blob.md5_hash,
+            "generation": blob.generation,
+            "created": blob.time_created.isoformat() if blob.time_created else None,
+            "updated": blob.updated.isoformat() if blob.updated else None
+        }
+
+    async def close(self):
+        """Release backend resources; the SDK backend holds none beyond gcs_executor"""
+
+
+def create_gcs_service(backend: str = GCS_BACKEND) -> GoogleCloudStorage:
+    if backend == "httpx":
+        from .gcs_async import AsyncGoogleCloudStorage
+        return AsyncGoogleCloudStorage()
+    if backend != "sdk":
+        logger.warning(f"Unknown GCS_BACKEND {backend!r}, using the SDK backend")
+    return GoogleCloudStorage()
+
+# Global instances
+gcs_executor = BoundedExecutor("gcs", GCS_IO_THREADS)
+gcs_service = create_gcs_service()
@@ -0,0 +1,319 @@
+"""
+Native async Google Cloud Storage backend.
+
+Talks to the GCS JSON API through one pooled httpx.AsyncClient instead of
+running the synchronous SDK on a thread pool. Uploads are resumable: the
+stream is sent in GCS_UPLOAD_CHUNK_SIZE parts, each read from the file in
+small blocks as it is sent, and the server-reported offset decides where
+each part starts. Access tokens come from the service-account
+key (a signed JWT exchanged at its token_uri) and are reused until shortly
+before they expire. V4 signed URLs are computed locally with the same key.
+With STORAGE_EMULATOR_HOST set, requests go to the emulator unauthenticated.
+Selected with GCS_BACKEND=httpx.
+"""
+import asyncio
+import binascii
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import BinaryIO, Optional
+from urllib.parse import quote, urlparse
+
+import httpx
+import jwt
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+
+from .gcs import GCS_UPLOAD_CHUNK_SIZE, GoogleCloudStorage
+
+logger = logging.getLogger(__name__)
+
+GCS_API_ENDPOINT = "https://storage.googleapis.com"
+GCS_SCOPE = "https://www.googleapis.com/auth/devstorage.read_write"
+GCS_HTTP_MAX_CONNECTIONS = int(os.environ.get('GCS_HTTP_MAX_CONNECTIONS', 20))
+GCS_HTTP_TIMEOUT = float(os.environ.get('GCS_HTTP_TIMEOUT', 60))
+MAX_SIGNED_URL_SECONDS = 7 * 24 * 3600
+TOKEN_REFRESH_MARGIN = 300  # seconds before expiry a token is replaced
+READ_BLOCK_SIZE = 256 * 1024
+MAX_STALLED_PARTS = 5       # consecutive 308s without progress before a resumable upload gives up
+STALL_BACKOFF_SECONDS = 0.5  # doubled after every stalled part
+
+
+def quote_object_name(name: str) -> str:
+    """Object name as a single JSON API path segment"""
+    return quote(name, safe="")
+
+
+class AsyncGoogleCloudStorage(GoogleCloudStorage):
+    """Same interface and mock fallback as GoogleCloudStorage, over async HTTP"""
+
+    def __init__(self):
+        # Bucket, project and credentials path come from the same env/defaults as the SDK backend
+        self.bucket_name = os.getenv("GCS_BUCKET_NAME") or "rota-crm-documents"
+        self.project_id = os.getenv("GCS_PROJECT_ID") or "rota-crm-storage"
+        self.credentials_path = os.getenv("GCS_CREDENTIALS_PATH") or "/app/backend/gcs-credentials.json"
+        self.emulator_host = os.getenv("STORAGE_EMULATOR_HOST")
+        self.api_endpoint = (self.emulator_host or GCS_API_ENDPOINT).rstrip("/")
+        self.service_account = None
+        self._signing_key = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._token = None
+        self._token_expires_at = 0.0
+        self._token_lock = asyncio.Lock()
+
+        try:
+            if self.credentials_path and os.path.exists(self.credentials_path):
+                with open(self.credentials_path) as f:
+                    self.service_account = json.load(f)
+                self._signing_key = serialization.load_pem_private_key(
+                    self.service_account["private_key"].encode(), password=None
+                )
+                logger.info(f"✅ Async GCS backend initialized for {self.service_account['client_email']}")
+            elif self.emulator_host:
+                logger.info(f"✅ Async GCS backend using emulator at {self.emulator_host}")
+            else:
+                logger.warning("❌ GCS credentials not found, using mock mode")
+        except Exception as e:
+            logger.error(f"Failed to initialize async Google Cloud Storage: {e}")
+            self.service_account = None
+            self._signing_key = None
+
+        # Mirrors the SDK backend: a falsy bucket means mock mode
+        self.bucket = self.bucket_name if (self.service_account or self.emulator_host) else None
+        self.can_sign = self._signing_key is not None
+
+    # HTTP plumbing
+
+    def _client(self) -> httpx.AsyncClient:
+        # Created on first use so it binds to the running event loop
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.api_endpoint,
+                timeout=httpx.Timeout(GCS_HTTP_TIMEOUT, connect=10),
+                limits=httpx.Limits(max_connections=GCS_HTTP_MAX_CONNECTIONS,
+                                    max_keepalive_connections=GCS_HTTP_MAX_CONNECTIONS)
+            )
+        return self._http
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _access_token(self) -> str:
+        """OAuth access token from a service-account JWT, cached until shortly before it expires"""
+        async with self._token_lock:
+            if self._token and time.time() < self._token_expires_at - TOKEN_REFRESH_MARGIN:
+                return self._token
+            now = int(time.time())
+            token_uri = self.service_account.get("token_uri", "https://oauth2.googleapis.com/token")
+            assertion = jwt.encode(
+                {"iss": self.service_account["client_email"], "scope": GCS_SCOPE, "aud": token_uri,
+                 "iat": now, "exp": now + 3600},
+                self.service_account["private_key"],
+                algorithm="RS256",
+                headers={"kid": self.service_account.get("private_key_id")}
+            )
+            response = await self._client().post(token_uri, data={
+                "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
+                "assertion": assertion
+            })
+            response.raise_for_status()
+            payload = response.json()
+            self._token = payload["access_token"]
+            self._token_expires_at = now + payload.get("expires_in", 3600)
+            return self._token
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        headers = kwargs.pop("headers", {})
+        if self.service_account and not self.emulator_host:
+            headers["Authorization"] = f"Bearer {await self._access_token()}"
+        return await self._client().request(method, url, headers=headers, **kwargs)
+
+    @staticmethod
+    async def _read_blocks(fileobj: BinaryIO, length: int):
+        """
+        Request body of `length` bytes read from the stream a block at a time, so no whole part is held.
+        Reads run in a worker thread; a disk or spooled upload file must not block the event loop.
+        """
+        remaining = length
+        while remaining > 0:
+            block = await asyncio.to_thread(fileobj.read, min(READ_BLOCK_SIZE, remaining))
+            if not block:
+                raise Exception("Upload stream ended early")
+            remaining -= len(block)
+            yield block
+
+    def _object_url(self, blob_name: str) -> str:
+        return f"/storage/v1/b/{self.bucket_name}/o/{quote_object_name(blob_name)}"
+
+    def _public_url(self, blob_name: str) -> str:
+        return f"{self.api_endpoint}/{self.bucket_name}/{quote(blob_name, safe='/~')}"
+
+    # Operations
+
+    async def _resumable_upload(self, fileobj: BinaryIO, blob_name: str, content_type: str, size: int) -> dict:
+        """Send the stream in GCS_UPLOAD_CHUNK_SIZE parts to one upload session; returns the object metadata"""
+        session = await self._request(
+            "POST", f"/upload/storage/v1/b/{self.bucket_name}/o",
+            params={"uploadType": "resumable"},
+            json={"name": blob_name, "contentType": content_type},
+            headers={"X-Upload-Content-Type": content_type, "X-Upload-Content-Length": str(size)}
+        )
+        session.raise_for_status()
+        session_url = session.headers["Location"]
+
+        origin = fileobj.tell()
+        offset = 0
+        stalled = 0
+        while True:
+            fileobj.seek(origin + offset)
+            length = min(GCS_UPLOAD_CHUNK_SIZE, size - offset)
+            content_range = f"bytes {offset}-{offset + length - 1}/{size}" if length else f"bytes */{size}"
+            response = await self._request(
+                "PUT", session_url, content=self._read_blocks(fileobj, length),
+                headers={"Content-Range": content_range, "Content-Length": str(length)}
+            )
+            if response.status_code in (200, 201):
+                return response.json()
+            if response.status_code != 308:
+                response.raise_for_status()
+                raise Exception(f"Unexpected resumable upload response: {response.status_code}")
+            # 308: the Range header says how much was persisted; anything after it is sent again
+            committed = response.headers.get("Range")
+            persisted = int(committed.rsplit("-", 1)[1]) + 1 if committed else 0
+            stalled = stalled + 1 if persisted <= offset else 0
+            if stalled > MAX_STALLED_PARTS:
+                raise Exception(f"Resumable upload made no progress after {MAX_STALLED_PARTS} retries at byte {offset} of {size}")
+            if stalled:
+                await asyncio.sleep(STALL_BACKOFF_SECONDS * 2 ** (stalled - 1))
+            offset = persisted
+
+    async def _make_public(self, blob_name: str):
+        response = await self._request("PATCH", self._object_url(blob_name), params={"predefinedAcl": "publicRead"}, json={})
+        response.raise_for_status()
+
+    async def upload_stream(self, fileobj: BinaryIO, filename: str, content_type: str = None, size: int = None) -> dict:
+        """
+        Upload a seekable file object from its current position as a resumable upload
+        Returns: dict with url, file_path, and file_size
+        """
+        if size is None:
+            size = self._stream_size(fileobj)
+        try:
+            if not self.bucket:
+                # Mock mode for development
+                return self._mock_result(filename, size)
+
+            blob_name = self._blob_name(filename)
+            await self._resumable_upload(fileobj, blob_name, content_type or self._content_type(filename), size)
+
+            # Make blob publicly readable since bucket is public
+            try:
+                await self._make_public(blob_name)
+                file_url = self._public_url(blob_name)
+                logger.info(f"File made public: {file_url}")
+            except Exception as e:
+                logger.warning(f"Could not make file public, using signed URL: {e}")
+                # Fallback to signed URL
+                file_url = self.generate_signed_url(blob_name, timedelta(hours=24*7))  # 7 days
+
+            return {
+                "url": file_url,
+                "file_path": blob_name,
+                "file_size": size,
+                "mock": False
+            }
+
+        except Exception as e:
+            logger.error(f"Failed to upload file to GCS: {e}")
+            # Fallback to mock
+            return self._mock_result(filename, size, error=str(e))
+
+    async def get_metadata(self, file_path: str) -> Optional[dict]:
+        """Object metadata, or None when the object does not exist (always in mock mode)"""
+        if not self.bucket:
+            return None
+        response = await self._request("GET", self._object_url(file_path.lstrip('/')))
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        resource = response.json()
+        return {
+            "name": resource["name"],
+            "bucket": resource["bucket"],
+            "size": int(resource["size"]),
+            "content_type": resource.get("contentType"),
+            "md5_hash": resource.get("md5Hash"),
+            "generation": int(resource["generation"]) if resource.get("generation") else None,
+            "created": resource.get("timeCreated"),
+            "updated": resource.get("updated")
+        }
+
+    async def delete_file(self, file_path: str) -> bool:
+        """Delete file from Google Cloud Storage"""
+        try:
+            if not self.bucket:
+                logger.info(f"Mock delete: {file_path}")
+                return True
+
+            response = await self._request("DELETE", self._object_url(file_path))
+            response.raise_for_status()
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to delete file from GCS: {e}")
+            return False
+
+    def generate_signed_url(self, blob_name: str, expiration: timedelta, method: str = "GET",
+                            now: datetime = None) -> str:
+        """V4 signed URL computed locally with the service-account key; a plain URL on a keyless emulator"""
+        if not self._signing_key:
+            if self.emulator_host:
+                return self._public_url(blob_name)
+            raise Exception("Signed URLs need a service-account private key")
+
+        now = now or datetime.utcnow()
+        request_timestamp = now.strftime("%Y%m%dT%H%M%SZ")
+        datestamp = now.strftime("%Y%m%d")
+        scope = f"{datestamp}/auto/storage/goog4_request"
+        host = urlparse(self.api_endpoint).netloc
+        path = f"/{self.bucket_name}/{quote(blob_name, safe='/~')}"
+        query = {
+            "X-Goog-Algorithm": "GOOG4-RSA-SHA256",
+            "X-Goog-Credential": f"{self.service_account['client_email']}/{scope}",
+            "X-Goog-Date": request_timestamp,
+            "X-Goog-Expires": str(min(int(expiration.total_seconds()), MAX_SIGNED_URL_SECONDS)),
+            "X-Goog-SignedHeaders": "host"
+        }
+        canonical_query = "&".join(f"{quote(key, safe='')}={quote(value, safe='')}" for key, value in sorted(query.items()))
+        canonical_request = "\n".join([method, path, canonical_query, f"host:{host}", "", "host", "UNSIGNED-PAYLOAD"])
+        string_to_sign = "\n".join([
+            "GOOG4-RSA-SHA256", request_timestamp, scope, hashlib.sha256(canonical_request.encode()).hexdigest()
+        ])
+        signature = self._signing_key.sign(string_to_sign.encode(), padding.PKCS1v15(), hashes.SHA256())
+        return f"{self.api_endpoint}{path}?{canonical_query}&X-Goog-Signature={binascii.hexlify(signature).decode()}"
+
+    async def get_signed_url(self, file_path: str, expiration_hours: int = 1) -> str:
+        """Generate signed URL for private file access"""
+        try:
+            # Clean up file path - remove leading slash if present
+            clean_path = file_path.lstrip('/')
+
+            if not self.bucket:
+                return f"https://storage.googleapis.com/{self.bucket_name or 'mock-bucket'}/{clean_path}"
+
+            # Check if file exists before generating signed URL
+            if await self.get_metadata(clean_path) is None:
+                logger.error(f"File does not exist in GCS: {clean_path}")
+                raise Exception(f"File not found in storage: {clean_path}")
+
+            return self.generate_signed_url(clean_path, timedelta(hours=expiration_hours))
+
+        except Exception as e:
+            logger.error(f"Failed to generate signed URL: {e}")
+            clean_path = file_path.lstrip('/')
+            return f"https://storage.googleapis.com/{self.bucket_name or 'mock-bucket'}/{clean_path}"
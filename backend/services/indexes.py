@@ -0,0 +1,216 @@
+"""
+Index declarations for every collection the API queries.
+
+Created idempotently in the background on startup. Run as a module to see
+which declared indexes are missing and which existing ones are unused:
+
+    python -m services.indexes            # report only
+    python -m services.indexes --create   # report, then create missing indexes
+"""
+import argparse
+import asyncio
+import logging
+import os
+from pathlib import Path
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+logger = logging.getLogger(__name__)
+
+
+def _index(keys, name, **options) -> IndexModel:
+    return IndexModel(keys, name=name, background=True, **options)
+
+
+INDEXES = {
+    "users": [
+        _index([("clerk_user_id", ASCENDING)], "clerk_user_id_unique", unique=True),
+    ],
+    "clients": [
+        _index([("id", ASCENDING)], "id_unique", unique=True),
+        _index([("created_at", ASCENDING), ("id", ASCENDING)], "created_at_id"),
+    ],
+    "documents": [
+        _index([("id", ASCENDING)], "id_unique", unique=True),
+        _index([("client_id", ASCENDING), ("document_type", ASCENDING)], "client_id_document_type"),
+        _index([("created_at", ASCENDING), ("id", ASCENDING)], "created_at_id"),
+        _index([("client_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], "client_id_created_at_id"),
+    ],
+    "trainings": [
+        _index([("id", ASCENDING)], "id_unique", unique=True),
+        _index([("client_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], "client_id_created_at_id"),
+    ],
+    "consumptions": [
+        _index([("id", ASCENDING)], "id_unique", unique=True),
+        # One consumption record per client per month
+        _index(
+            [("client_id", ASCENDING), ("year", ASCENDING), ("month", ASCENDING)],
+            "client_year_month_unique",
+            unique=True
+        ),
+        # Unfiltered admin listing, newest first
+        _index([("year", DESCENDING), ("month", DESCENDING), ("id", DESCENDING)], "year_month_id"),
+    ],
+    "consumption_rollups": [
+        _index([("client_id", ASCENDING), ("year", ASCENDING)], "client_id_year_unique", unique=True),
+        _index([("year", ASCENDING)], "year"),
+    ],
+    "emission_factors": [
+        _index([("version", DESCENDING)], "version_unique", unique=True),
+    ],
+    "carbon_footprints": [
+        _index(
+            [("client_id", ASCENDING), ("year", ASCENDING), ("month", ASCENDING)],
+            "client_year_month_unique",
+            unique=True
+        ),
+        _index([("year", ASCENDING)], "year"),
+    ],
+    "carbon_jobs": [
+        _index([("id", ASCENDING)], "id_unique", unique=True),
+        _index([("status", ASCENDING), ("created_at", DESCENDING)], "status_created_at"),
+        _index([("created_at", DESCENDING)], "created_at"),
+    ],
+    "consumption_anomalies": [
+        _index([("id", ASCENDING)], "id_unique", unique=True),
+        _index([("year", DESCENDING), ("month", DESCENDING), ("id", DESCENDING)], "year_month_id"),
+        _index(
+            [("client_id", ASCENDING), ("year", DESCENDING), ("month", DESCENDING), ("id", DESCENDING)],
+            "client_id_year_month_id"
+        ),
+        _index([("detected_at", ASCENDING)], "detected_at"),
+    ],
+    "upload_chunks": [
+        _index([("upload_id", ASCENDING), ("chunk_index", ASCENDING)], "upload_id_chunk_index"),
+    ],
+}
+
+
+def _key_spec(keys) -> tuple:
+    return tuple((field, direction) for field, direction in keys.items())
+
+
+async def ensure_indexes(db):
+    """Create every declared index; existing identical indexes are left untouched"""
+    for collection_name, models in INDEXES.items():
+        for model in models:
+            name = model.document["name"]
+            try:
+                await db[collection_name].create_indexes([model])
+            except Exception as e:
+                # e.g. duplicate data blocking a unique index - keep going with the rest
+                logger.error(f"❌ Failed to create index {collection_name}.{name}: {e}")
+    logger.info("✅ Index bootstrap finished")
+
+
+# Indexes that correctness depends on, not just speed: writes rely on them to reject duplicates
+REQUIRED_INDEXES = {
+    "consumptions": ["client_year_month_unique"],
+    # Rollup refreshes rely on it to drop writes that lost the ticket race
+    "consumption_rollups": ["client_id_year_unique"],
+}
+
+
+async def missing_required_indexes(db) -> list:
+    """(collection name, IndexModel) of every REQUIRED_INDEXES entry without an equivalent unique index"""
+    missing = []
+    for collection_name, names in REQUIRED_INDEXES.items():
+        collection = db[collection_name]
+        for model in INDEXES[collection_name]:
+            if model.document["name"] not in names:
+                continue
+            spec = _key_spec(model.document["key"])
+            existing = [index async for index in collection.list_indexes() if _key_spec(index["key"]) == spec]
+            if not any(index.get("unique") for index in existing):
+                missing.append((collection_name, model))
+    return missing
+
+
+async def require_indexes(db):
+    """Create the REQUIRED_INDEXES now and raise if any of them cannot be built (e.g. existing duplicate rows)"""
+    for collection_name, model in await missing_required_indexes(db):
+        try:
+            await db[collection_name].create_indexes([model])
+        except Exception as e:
+            raise RuntimeError(
+                f"Required index {collection_name}.{model.document['name']} could not be created: {e}. "
+                f"Run python -m services.consumption_repair to see the rows that block it."
+            ) from e
+    logger.info("✅ Required indexes present")
+
+
+async def index_report(db) -> dict:
+    """Declared indexes missing from the database and existing indexes that are not used"""
+    report = {"missing": [], "unused": []}
+
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        existing = {}
+        async for index in collection.list_indexes():
+            existing[_key_spec(index["key"])] = index["name"]
+
+        declared = set()
+        for model in models:
+            spec = _key_spec(model.document["key"])
+            declared.add(spec)
+            if spec not in existing:
+                report["missing"].append({"collection": collection_name, "name": model.document["name"], "key": list(spec)})
+
+        try:
+            usage = {stat["name"]: stat["accesses"]["ops"] async for stat in collection.aggregate([{"$indexStats": {}}])}
+        except Exception as e:
+            logger.warning(f"Could not read $indexStats for {collection_name}: {e}")
+            usage = {}
+
+        for spec, name in existing.items():
+            if name == "_id_":
+                continue
+            ops = usage.get(name)
+            if spec not in declared or ops == 0:
+                report["unused"].append({
+                    "collection": collection_name,
+                    "name": name,
+                    "key": list(spec),
+                    "declared": spec in declared,
+                    "ops": ops
+                })
+
+    return report
+
+
+async def _main(create: bool):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent.parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    report = await index_report(db)
+
+    print("Missing indexes:")
+    if not report["missing"]:
+        print("  (none)")
+    for index in report["missing"]:
+        print(f"  {index['collection']}.{index['name']} {index['key']}")
+
+    print("Unused indexes (undeclared, or zero ops since the last restart):")
+    if not report["unused"]:
+        print("  (none)")
+    for index in report["unused"]:
+        reason = f"ops={index['ops']}" if index["declared"] else "undeclared"
+        print(f"  {index['collection']}.{index['name']} {index['key']} [{reason}]")
+
+    if create and report["missing"]:
+        await ensure_indexes(db)
+        print(f"Created {len(report['missing'])} missing index(es)")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report missing and unused MongoDB indexes")
+    parser.add_argument("--create", action="store_true", help="create missing indexes after reporting")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args.create))
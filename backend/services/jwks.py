@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+import httpx
+import jwt
+
+logger = logging.getLogger(__name__)
+
+
+class JWKSKeyStore:
+    """
+    Clerk signing keys cached by kid.
+    Keys are loaded at startup and refreshed in the background; an unknown kid
+    triggers a refetch that is shared by every request waiting on it.
+    """
+
+    def __init__(
+        self,
+        jwks_url: str,
+        refresh_interval: float = 3600,
+        min_refetch_interval: float = 30,
+        timeout: float = 5.0
+    ):
+        self.jwks_url = jwks_url
+        self.refresh_interval = refresh_interval
+        self.min_refetch_interval = min_refetch_interval
+        self.timeout = timeout
+
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._fetched_at: float = 0.0
+        self._inflight: Optional[asyncio.Future] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._http: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        """Load the key set and start the background refresh loop"""
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=self.timeout)
+        try:
+            await self.refresh()
+            logger.info(f"✅ Loaded {len(self._keys)} JWKS signing key(s)")
+        except Exception as e:
+            # Keep starting up; the first request with a token will retry the fetch
+            logger.error(f"❌ Initial JWKS fetch failed: {e}")
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        if self._http:
+            await self._http.aclose()
+            self._http = None
+
+    async def refresh(self):
+        """Fetch the key set, joining a fetch that is already in flight"""
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.ensure_future(self._fetch())
+        # Shield so a cancelled request does not cancel the fetch other requests wait on
+        await asyncio.shield(self._inflight)
+
+    async def get_signing_key(self, token: str) -> jwt.PyJWK:
+        """Return the signing key for the token's kid, refetching only for unknown kids"""
+        kid = jwt.get_unverified_header(token).get("kid")
+
+        key = self._keys.get(kid)
+        if key is None and (not self._keys or time.monotonic() - self._fetched_at >= self.min_refetch_interval):
+            logger.info(f"🔄 Unknown signing key {kid}, refetching JWKS")
+            await self.refresh()
+            key = self._keys.get(kid)
+
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unable to find a signing key that matches: {kid}")
+        return key
+
+    async def _fetch(self):
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=self.timeout)
+
+        response = await self._http.get(self.jwks_url)
+        response.raise_for_status()
+        jwk_set = jwt.PyJWKSet.from_dict(response.json())
+
+        # Swap the whole dict so readers never see a half-built key set
+        self._keys = {key.key_id: key for key in jwk_set.keys}
+        self._fetched_at = time.monotonic()
+
+    async def _refresh_loop(self):
+        # Refresh ahead of the interval so the cached set never goes stale
+        delay = self.refresh_interval * 0.8
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.refresh()
+                delay = self.refresh_interval * 0.8
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep serving the cached keys and retry sooner
+                logger.warning(f"⚠️ Background JWKS refresh failed, keeping cached keys: {e}")
+                delay = self.min_refetch_interval
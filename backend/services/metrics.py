@@ -0,0 +1,24 @@
+import logging
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# name -> callable returning a JSON-serializable snapshot
+_metrics_hooks: Dict[str, Callable[[], dict]] = {}
+
+
+def register_metrics_hook(name: str, hook: Callable[[], dict]):
+    """Register a callable whose snapshot is reported under `name`"""
+    _metrics_hooks[name] = hook
+
+
+def collect_metrics() -> dict:
+    """Snapshot of every registered hook; a failing hook reports its error instead"""
+    snapshot = {}
+    for name, hook in _metrics_hooks.items():
+        try:
+            snapshot[name] = hook()
+        except Exception as e:
+            logger.error(f"Metrics hook {name} failed: {e}")
+            snapshot[name] = {"error": str(e)}
+    return snapshot
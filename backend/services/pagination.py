@@ -0,0 +1,58 @@
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from pymongo import ASCENDING
+
+
+def encode_cursor(values: list) -> str:
+    """Opaque cursor holding the sort-key values of the last returned row"""
+    payload = [{"$dt": value.isoformat()} if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """Raises ValueError for anything encode_cursor did not produce"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(payload, list):
+        raise ValueError("Invalid cursor")
+    return [datetime.fromisoformat(value["$dt"]) if isinstance(value, dict) and "$dt" in value else value
+            for value in payload]
+
+
+def keyset_filter(sort: List[Tuple[str, int]], values: list) -> dict:
+    """Match rows strictly after `values` in `sort` order"""
+    if len(values) != len(sort):
+        raise ValueError("Cursor does not match the sort order")
+
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {prev_field: values[j] for j, (prev_field, _) in enumerate(sort[:i])}
+        clause[field] = {"$gt" if direction == ASCENDING else "$lt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+async def paginate(collection, query: dict, sort: List[Tuple[str, int]], limit: int,
+                   cursor: Optional[str] = None, projection: Optional[dict] = None) -> Tuple[list, Optional[str]]:
+    """
+    One page of `collection` in `sort` order, plus the cursor of the next page (None on the last page).
+    Reads at most limit + 1 rows, so memory does not depend on the collection size.
+    """
+    if cursor:
+        query = {"$and": [query, keyset_filter(sort, decode_cursor(cursor))]}
+
+    rows = []
+    async for row in collection.find(query, projection).sort(sort).limit(limit + 1):
+        rows.append(row)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1].get(field) for field, _ in sort])
+    return rows, next_cursor
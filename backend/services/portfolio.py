@@ -0,0 +1,117 @@
+"""
+Portfolio analytics: every client's yearly totals, per-guest intensity, YoY
+change and percentile rank among peers, from one aggregation over the
+consumption rollups and one vectorized pass of the engine.
+"""
+from typing import Optional
+
+import numpy as np
+
+from .analytics import CONSUMPTION_FIELDS, CONSUMPTION_METRICS
+from .consumption_engine import ACCOMMODATION_INDEX, percent_change
+from .rollups import series_from_rollups
+
+# Valid sort keys: "<measure>.<field>", e.g. per_guest.electricity
+PORTFOLIO_SORT_KEYS = (
+    [f"total.{field}" for field in CONSUMPTION_FIELDS]
+    + [f"yoy_percent.{field}" for field in CONSUMPTION_FIELDS]
+    + [f"per_guest.{metric}" for metric in CONSUMPTION_METRICS]
+    + [f"percentile_rank.{metric}" for metric in CONSUMPTION_METRICS]
+)
+
+
+def portfolio_pipeline(year: int) -> list:
+    """Rollups of `year` and `year - 1` for every client, joined with the client's names; deleted clients drop out"""
+    return [
+        {"$match": {"year": {"$in": [year - 1, year]}}},
+        {"$lookup": {"from": "clients", "localField": "client_id", "foreignField": "id", "as": "client"}},
+        {"$match": {"client": {"$ne": []}}},
+        {"$project": {
+            "_id": 0,
+            "client_id": 1,
+            "year": 1,
+            "months": 1,
+            "present": 1,
+            "name": {"$arrayElemAt": ["$client.name", 0]},
+            "hotel_name": {"$arrayElemAt": ["$client.hotel_name", 0]}
+        }}
+    ]
+
+
+def percentile_rank(values: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """
+    Per-column percentile rank (0-100) of each row among the valid rows: the share of peers
+    below it, counting ties as half. Invalid rows get NaN.
+    """
+    ranks = np.full(values.shape, np.nan)
+    peers = values[valid]
+    if len(peers) == 0:
+        return ranks
+    ordered = np.sort(peers, axis=0)
+    for k in range(values.shape[1]):
+        below = np.searchsorted(ordered[:, k], peers[:, k], side="left")
+        not_above = np.searchsorted(ordered[:, k], peers[:, k], side="right")
+        ranks[valid, k] = 100 * (below + 0.5 * (not_above - below)) / len(peers)
+    return ranks
+
+
+def compute_portfolio(rollups: list, year: int) -> dict:
+    """Portfolio measures for every client with a rollup in `year` or `year - 1`"""
+    names = {}
+    for rollup in rollups:
+        names.setdefault(rollup["client_id"], {"name": rollup.get("name"), "hotel_name": rollup.get("hotel_name")})
+    client_ids = sorted(names)
+    series = series_from_rollups(rollups, [year - 1, year], client_ids)
+
+    totals = series.totals()                     # (clients, 2, fields)
+    per_guest = series.yearly_per_person()[:, 1]  # (clients, metrics)
+    yoy_percent = percent_change(totals[:, 1], totals[:, 0])
+    # Intensity is only comparable between hotels that reported guests this year
+    has_guests = totals[:, 1, ACCOMMODATION_INDEX] > 0
+
+    return {
+        "client_ids": client_ids,
+        "names": [names[client_id] for client_id in client_ids],
+        "months_reported": series.present[:, 1].sum(axis=1),
+        "has_guests": has_guests,
+        "total": totals[:, 1],
+        "per_guest": per_guest,
+        "yoy_percent": yoy_percent,
+        "percentile_rank": percentile_rank(per_guest, has_guests)
+    }
+
+
+def serialize_portfolio(portfolio: dict, year: int, sort_by: str, order: str, top_k: Optional[int]) -> dict:
+    """Sort by one of PORTFOLIO_SORT_KEYS, keep the first top_k and build the response"""
+    measure, field = sort_by.split(".", 1)
+    fields = CONSUMPTION_FIELDS if measure in ("total", "yoy_percent") else CONSUMPTION_METRICS
+    column = portfolio[measure][:, fields.index(field)]
+    if measure == "per_guest":
+        column = np.where(portfolio["has_guests"], column, np.nan)
+
+    # NaN (no guests, not ranked) always sorts last
+    keys = np.where(np.isnan(column), np.inf, column if order == "asc" else -column)
+    selected = np.argsort(keys, kind="stable")[:top_k]
+
+    clients = []
+    for i in selected.tolist():
+        ranks = portfolio["percentile_rank"][i]
+        clients.append({
+            "client_id": portfolio["client_ids"][i],
+            "name": portfolio["names"][i].get("name"),
+            "hotel_name": portfolio["names"][i].get("hotel_name"),
+            "months_reported": int(portfolio["months_reported"][i]),
+            "totals": dict(zip(CONSUMPTION_FIELDS, portfolio["total"][i].tolist())),
+            "per_guest": dict(zip(CONSUMPTION_METRICS, portfolio["per_guest"][i].tolist())),
+            "yoy_percent": dict(zip(CONSUMPTION_FIELDS, portfolio["yoy_percent"][i].tolist())),
+            "percentile_rank": {metric: None if np.isnan(rank) else rank
+                                for metric, rank in zip(CONSUMPTION_METRICS, ranks.tolist())}
+        })
+
+    return {
+        "year": year,
+        "client_count": len(portfolio["client_ids"]),
+        "sort_by": sort_by,
+        "order": order,
+        "clients": clients
+    }
@@ -0,0 +1,313 @@
+"""
+Materialized per-client yearly consumption rollups.
+
+One consumption_rollups document per (client_id, year) holds the twelve
+monthly values of every field, the yearly totals, per-accommodation ratios
+and the change against the previous year. Consumption writes refresh only the
+affected client-years; analytics read these small documents instead of the
+raw monthly rows. Every refresh takes a ticket from a shared sequence before
+it reads, and a rollup is only replaced by one computed from a later ticket,
+so concurrent refreshes landing out of order never leave a stale snapshot.
+The first start against existing data builds them client chunk by client
+chunk, recording progress in scheduled_runs so a restart resumes where it
+stopped. Rebuild or verify everything from scratch with:
+
+    python -m services.rollups rebuild [--verify]
+    python -m services.rollups verify
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+from pymongo import ReplaceOne, ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from .analytics import CONSUMPTION_FIELDS, CONSUMPTION_METRICS, MAX_CONSUMPTION_YEAR, MIN_CONSUMPTION_YEAR
+from .consumption_engine import SERIES_PROJECTION, ConsumptionSeries, percent_change
+
+logger = logging.getLogger(__name__)
+
+REBUILD_CHUNK_SIZE = 200  # clients per rebuild/verify batch
+SERIES_FIELDS = {"_id": 0, "client_id": 1, "year": 1, "months": 1, "present": 1}
+DUPLICATE_KEY = 11000
+BOOTSTRAP_RUN = "rollup_bootstrap"  # scheduled_runs document tracking the first build
+
+
+def build_rollup_docs(series: ConsumptionSeries, years: Iterable[int]) -> List[dict]:
+    """Rollup documents for every client of `series` and each of `years` (year - 1 must be in the series for YoY)"""
+    totals = series.totals()
+    per_person = series.yearly_per_person()
+    now = datetime.utcnow()
+
+    docs = []
+    for year in years:
+        y = series.year_index(year)
+        if year - 1 in series.years:
+            previous_totals = totals[:, series.year_index(year - 1)]
+        else:
+            previous_totals = np.zeros_like(totals[:, y])
+        delta = totals[:, y] - previous_totals
+        percent = percent_change(totals[:, y], previous_totals)
+
+        for c, client_id in enumerate(series.client_ids):
+            docs.append({
+                "client_id": client_id,
+                "year": year,
+                "months": dict(zip(CONSUMPTION_FIELDS, series.values[c, y].T.tolist())),
+                "present": series.present[c, y].tolist(),
+                "row_count": int(series.present[c, y].sum()),
+                "totals": dict(zip(CONSUMPTION_FIELDS, totals[c, y].tolist())),
+                "per_person": dict(zip(CONSUMPTION_METRICS, per_person[c, y].tolist())),
+                "yoy": {
+                    "delta": dict(zip(CONSUMPTION_FIELDS, delta[c].tolist())),
+                    "percent": dict(zip(CONSUMPTION_FIELDS, percent[c].tolist()))
+                },
+                "updated_at": now
+            })
+    return docs
+
+
+def series_from_rollups(rollups: Iterable[dict], years: Sequence[int], client_ids: Sequence[str]) -> ConsumptionSeries:
+    """Rebuild the monthly series from rollup documents, for the vectorized engine"""
+    client_ids, years = list(client_ids), list(years)
+    client_index = {client_id: i for i, client_id in enumerate(client_ids)}
+    year_index = {year: i for i, year in enumerate(years)}
+
+    values = np.zeros((len(client_ids), len(years), 12, len(CONSUMPTION_FIELDS)), dtype=float)
+    present = np.zeros(values.shape[:3], dtype=bool)
+    for rollup in rollups:
+        c, y = client_index.get(rollup["client_id"]), year_index.get(rollup["year"])
+        if c is None or y is None:
+            continue
+        values[c, y] = np.array([rollup["months"].get(field, [0] * 12) for field in CONSUMPTION_FIELDS]).T
+        present[c, y] = rollup["present"]
+    return ConsumptionSeries(client_ids, years, values, present)
+
+
+async def _next_ticket(db) -> int:
+    """Increasing number taken before a refresh reads the raw rows; later tickets saw newer data"""
+    sequence = await db.sequences.find_one_and_update(
+        {"_id": "consumption_rollups"},
+        {"$inc": {"value": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return sequence["value"]
+
+
+async def _write_rollups(db, docs: List[dict], ticket: int):
+    """Replace each rollup unless one computed from a later ticket is already stored"""
+    if not docs:
+        return
+    operations = [
+        ReplaceOne(
+            {"client_id": doc["client_id"], "year": doc["year"], "ticket": {"$not": {"$gte": ticket}}},
+            {**doc, "ticket": ticket},
+            upsert=True
+        )
+        for doc in docs
+    ]
+    try:
+        await db.consumption_rollups.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # A newer rollup makes the filter miss and the upsert collide with the unique (client_id, year) index
+        errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY]
+        if errors:
+            raise
+
+
+def _with_previous_years(years: Iterable[int]) -> List[int]:
+    """The years plus each one's previous year (for YoY), without filling the gaps between them"""
+    return sorted({year for y in years for year in (y - 1, y)})
+
+
+async def refresh_rollups(db, client_ids: Iterable[str], years: Iterable[int]):
+    """Recompute the rollups of the given client-years, and of year + 1 whose YoY depends on them"""
+    client_ids = sorted(set(client_ids))
+    target_years = sorted({year for y in years for year in (y, y + 1)})
+    if not client_ids or not target_years:
+        return
+
+    ticket = await _next_ticket(db)
+    series_years = _with_previous_years(target_years)
+    rows = await db.consumptions.find(
+        {"client_id": {"$in": client_ids}, "year": {"$in": series_years}},
+        SERIES_PROJECTION
+    ).to_list(None)
+    series = ConsumptionSeries.from_rows(rows, series_years, client_ids)
+    await _write_rollups(db, build_rollup_docs(series, target_years), ticket)
+
+
+async def load_rollup_series(db, client_ids: Sequence[str], years: Sequence[int]) -> ConsumptionSeries:
+    """
+    Series for the given clients and years read from the rollups with one query.
+    Client-years of existing clients that were never rolled up are materialized from the raw rows first,
+    for accepted years only.
+    """
+    query = {"client_id": {"$in": list(client_ids)}, "year": {"$in": list(years)}}
+    rollups = await db.consumption_rollups.find(query, SERIES_FIELDS).to_list(None)
+
+    found = {(rollup["client_id"], rollup["year"]) for rollup in rollups}
+    missing = [
+        (client_id, year) for client_id in client_ids for year in years
+        if (client_id, year) not in found and MIN_CONSUMPTION_YEAR <= year <= MAX_CONSUMPTION_YEAR
+    ]
+    if missing:
+        # Only for clients that exist; an unknown client_id just reads as no data
+        existing = {
+            client["id"] for client in
+            await db.clients.find({"id": {"$in": list({client_id for client_id, _ in missing})}}, {"_id": 0, "id": 1}).to_list(None)
+        }
+        missing = [(client_id, year) for client_id, year in missing if client_id in existing]
+    if missing:
+        await refresh_rollups(db, {client_id for client_id, _ in missing}, {year for _, year in missing})
+        rollups = await db.consumption_rollups.find(query, SERIES_FIELDS).to_list(None)
+
+    return series_from_rollups(rollups, years, client_ids)
+
+
+async def _client_chunks(db, after: Optional[str] = None):
+    """Client ids with consumption rows in sorted chunks, optionally only those sorting after `after`"""
+    client_ids = sorted(client_id for client_id in await db.consumptions.distinct("client_id")
+                        if client_id is not None and (after is None or client_id > after))
+    for start in range(0, len(client_ids), REBUILD_CHUNK_SIZE):
+        yield client_ids[start:start + REBUILD_CHUNK_SIZE]
+
+
+async def _recompute_chunk(db, client_ids: List[str]) -> List[dict]:
+    rows = await db.consumptions.find({"client_id": {"$in": client_ids}}, SERIES_PROJECTION).to_list(None)
+    if not rows:
+        return []
+    # Only the years that actually have rows, so one stray year does not span a dense range
+    years = sorted({row["year"] for row in rows})
+    series = ConsumptionSeries.from_rows(rows, _with_previous_years(years), client_ids)
+    # Only the client-years that actually have rows
+    return [doc for doc in build_rollup_docs(series, years) if doc["row_count"]]
+
+
+async def rebuild_rollups(db) -> int:
+    """Regenerate every rollup from the raw consumption rows; returns the number of rollups written"""
+    started = datetime.utcnow()
+    written = 0
+    async for client_ids in _client_chunks(db):
+        ticket = await _next_ticket(db)
+        docs = await _recompute_chunk(db, client_ids)
+        await _write_rollups(db, docs, ticket)
+        written += len(docs)
+    # Anything not rewritten belongs to client-years that no longer have data
+    await db.consumption_rollups.delete_many({"updated_at": {"$lt": started}})
+    await _mark_bootstrap(db, {"completed_at": datetime.utcnow()})
+    logger.info(f"✅ Rebuilt {written} consumption rollups")
+    return written
+
+
+async def drop_duplicate_rollups(db) -> int:
+    """Keep one rollup per (client_id, year), the one from the latest ticket, so the unique index can be built"""
+    groups = await db.consumption_rollups.aggregate([
+        {"$group": {"_id": {"client_id": "$client_id", "year": "$year"}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True).to_list(None)
+    dropped = []
+    for group in groups:
+        rollups = await db.consumption_rollups.find({"_id": {"$in": group["ids"]}}, {"_id": 1, "ticket": 1}).to_list(None)
+        rollups.sort(key=lambda rollup: rollup.get("ticket") or 0, reverse=True)
+        dropped += [rollup["_id"] for rollup in rollups[1:]]
+    if dropped:
+        await db.consumption_rollups.delete_many({"_id": {"$in": dropped}})
+        logger.warning(f"🔧 Dropped {len(dropped)} duplicate consumption rollup(s)")
+    return len(dropped)
+
+
+def _rollup_matches(stored: dict, expected: dict) -> bool:
+    for key in ("months", "totals", "per_person"):
+        for field, value in expected[key].items():
+            if not np.allclose(stored.get(key, {}).get(field, np.nan), value):
+                return False
+    for key in ("delta", "percent"):
+        for field, value in expected["yoy"][key].items():
+            if not np.allclose(stored.get("yoy", {}).get(key, {}).get(field, np.nan), value):
+                return False
+    return stored.get("present") == expected["present"]
+
+
+async def verify_rollups(db) -> dict:
+    """Compare stored rollups against a fresh computation from the raw rows"""
+    report = {"checked": 0, "missing": [], "mismatched": []}
+    async for client_ids in _client_chunks(db):
+        expected = await _recompute_chunk(db, client_ids)
+        stored = {
+            (doc["client_id"], doc["year"]): doc
+            async for doc in db.consumption_rollups.find({"client_id": {"$in": client_ids}}, {"_id": 0})
+        }
+        for doc in expected:
+            key = (doc["client_id"], doc["year"])
+            report["checked"] += 1
+            if key not in stored:
+                report["missing"].append(key)
+            elif not _rollup_matches(stored[key], doc):
+                report["mismatched"].append(key)
+    return report
+
+
+async def _mark_bootstrap(db, fields: dict):
+    await db.scheduled_runs.update_one({"_id": BOOTSTRAP_RUN}, {"$set": fields}, upsert=True)
+
+
+async def ensure_rollups(db):
+    """
+    Build the rollups in the background until the first build has completed once, resuming after the
+    last finished client chunk. Writes keep them current from then on.
+    """
+    state = await db.scheduled_runs.find_one({"_id": BOOTSTRAP_RUN}) or {}
+    if state.get("completed_at"):
+        return
+    after = state.get("last_client_id")
+    logger.info(f"🔄 Building consumption rollups{f' after client {after}' if after else ''}")
+
+    written = 0
+    async for client_ids in _client_chunks(db, after):
+        ticket = await _next_ticket(db)
+        docs = await _recompute_chunk(db, client_ids)
+        await _write_rollups(db, docs, ticket)
+        written += len(docs)
+        await _mark_bootstrap(db, {"last_client_id": client_ids[-1], "updated_at": datetime.utcnow()})
+    await _mark_bootstrap(db, {"completed_at": datetime.utcnow()})
+    logger.info(f"✅ Consumption rollup bootstrap finished ({written} rollups)")
+
+
+async def _main(command: str, verify: bool):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent.parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    if command == "rebuild":
+        written = await rebuild_rollups(db)
+        print(f"Rebuilt {written} rollup(s)")
+
+    if command == "verify" or verify:
+        report = await verify_rollups(db)
+        print(f"Checked {report['checked']} rollup(s): "
+              f"{len(report['missing'])} missing, {len(report['mismatched'])} mismatched")
+        for client_id, year in report["missing"]:
+            print(f"  missing     {client_id} {year}")
+        for client_id, year in report["mismatched"]:
+            print(f"  mismatched  {client_id} {year}")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild or verify consumption rollups")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    parser.add_argument("--verify", action="store_true", help="verify after rebuilding")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args.command, args.verify))
@@ -0,0 +1,146 @@
+"""
+Multi-year consumption trends.
+
+Built from a ConsumptionSeries covering the requested years plus the year
+before, so the first period also has a year-over-year change. Months are
+grouped into quarters or seasons with one matrix product. Rolling 12-month
+windows come from cumulative sums, so each window is a single subtraction.
+"""
+from typing import List
+
+import numpy as np
+
+from .analytics import CONSUMPTION_FIELDS, CONSUMPTION_METRICS, MONTH_NAMES
+from .consumption_engine import ACCOMMODATION_INDEX, METRIC_COUNT, ConsumptionSeries, energy_vector, per_unit, percent_change
+
+SEASON_NAMES = ["Kış", "İlkbahar", "Yaz", "Sonbahar"]
+
+# Period index (0-based) of each calendar month; seasons stay within the calendar year (December is winter)
+PERIOD_OF_MONTH = {
+    "month": list(range(12)),
+    "quarter": [month // 3 for month in range(12)],
+    "season": [0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 0],
+    "year": [0] * 12
+}
+GRANULARITIES = list(PERIOD_OF_MONTH)
+
+
+def period_matrix(granularity: str) -> np.ndarray:
+    """(12, periods) one-hot matrix mapping months to periods"""
+    periods = PERIOD_OF_MONTH[granularity]
+    matrix = np.zeros((12, max(periods) + 1))
+    matrix[np.arange(12), periods] = 1
+    return matrix
+
+
+def period_label(granularity: str, year: int, period: int) -> str:
+    if granularity == "month":
+        return f"{MONTH_NAMES[period + 1]} {year}"
+    if granularity == "quarter":
+        return f"{year} Q{period + 1}"
+    if granularity == "season":
+        return f"{SEASON_NAMES[period]} {year}"
+    return str(year)
+
+
+def _measures(totals: np.ndarray, energy: np.ndarray) -> dict:
+    """Per-guest metrics and energy for (..., fields) totals"""
+    guests = totals[..., ACCOMMODATION_INDEX]
+    return {
+        "per_person": per_unit(totals[..., :METRIC_COUNT], guests[..., None]),
+        "energy_per_person_kwh": per_unit(energy, guests)
+    }
+
+
+def _columns(labels: dict, totals: np.ndarray, energy: np.ndarray, reported: np.ndarray) -> dict:
+    """Columns for a flat list of periods: labels, then one list per measure (a dict of lists per field)"""
+    measures = _measures(totals, energy)
+    return {
+        **labels,
+        "months_reported": reported.astype(int).tolist(),
+        "totals": dict(zip(CONSUMPTION_FIELDS, totals.T.tolist())),
+        "per_person": dict(zip(CONSUMPTION_METRICS, measures["per_person"].T.tolist())),
+        "energy_kwh": energy.tolist(),
+        "energy_per_person_kwh": measures["energy_per_person_kwh"].tolist()
+    }
+
+
+def _rows(columns: dict) -> List[dict]:
+    """Transpose columns into one dict per period"""
+    count = len(columns["label"])
+    return [
+        {key: {field: values[i] for field, values in column.items()} if isinstance(column, dict) else column[i]
+         for key, column in columns.items()}
+        for i in range(count)
+    ]
+
+
+def serialize_trends(series: ConsumptionSeries, client_id: str, years: List[int], granularity: str,
+                     rolling: bool, energy_factors: dict, columnar: bool = False) -> dict:
+    """
+    Totals, per-guest intensity and YoY change per period for `years`; the series must also hold
+    years[0] - 1. columnar=True returns each period list as one list per measure instead of one dict per period.
+    """
+    c = series.client_index(client_id)
+    values = series.values[c]                                   # (years, 12, fields)
+    present = series.present[c]                                 # (years, 12)
+    energy = values[..., :METRIC_COUNT] @ energy_vector(energy_factors)   # (years, 12)
+
+    matrix = period_matrix(granularity)
+    period_count = matrix.shape[1]
+    period_totals = np.einsum("ymf,mp->ypf", values, matrix)    # (years, periods, fields)
+    period_energy = energy @ matrix                             # (years, periods)
+    period_reported = present @ matrix                          # months with data per period
+    # Same period of the previous year; the series starts one year early for this
+    yoy_percent = percent_change(period_totals[1:], period_totals[:-1])
+
+    first = series.year_index(years[0])
+    selected = slice(first, first + len(years))
+    periods = _columns(
+        {
+            "year": np.repeat(years, period_count).tolist(),
+            "period": np.tile(np.arange(1, period_count + 1), len(years)).tolist(),
+            "label": [period_label(granularity, year, p) for year in years for p in range(period_count)]
+        },
+        period_totals[selected].reshape(-1, len(CONSUMPTION_FIELDS)),
+        period_energy[selected].reshape(-1),
+        period_reported[selected].reshape(-1)
+    )
+    periods["yoy_percent"] = dict(zip(CONSUMPTION_FIELDS, yoy_percent[first - 1:first - 1 + len(years)].reshape(-1, len(CONSUMPTION_FIELDS)).T.tolist()))
+
+    result = {
+        "client_id": client_id,
+        "start_year": years[0],
+        "end_year": years[-1],
+        "granularity": granularity,
+        **({"format": "columnar"} if columnar else {}),
+        "periods": periods if columnar else _rows(periods)
+    }
+    if rolling:
+        windows = _rolling_windows(series.years, values, present, energy, first, len(years))
+        result["rolling_12_months"] = windows if columnar else _rows(windows)
+    return result
+
+
+def _rolling_windows(series_years: List[int], values: np.ndarray, present: np.ndarray, energy: np.ndarray,
+                     first: int, count: int) -> dict:
+    """Trailing 12-month sums ending at every month of the requested years, from cumulative sums"""
+    fields = values.shape[-1]
+    # Leading zero row so the window ending at month t is cumulative[t + 1] - cumulative[t - 11]
+    cumulative = np.vstack([np.zeros(fields), np.cumsum(values.reshape(-1, fields), axis=0)])
+    cumulative_energy = np.concatenate([[0], np.cumsum(energy.reshape(-1))])
+    cumulative_reported = np.concatenate([[0], np.cumsum(present.reshape(-1))])
+
+    ends = np.arange(first * 12, (first + count) * 12)          # month index of each window's last month
+    starts = np.maximum(ends - 11, 0)
+    labels = {
+        "year": [series_years[end // 12] for end in ends.tolist()],
+        "month": (ends % 12 + 1).tolist(),
+        "label": [f"{MONTH_NAMES[end % 12 + 1]} {series_years[end // 12]}" for end in ends.tolist()]
+    }
+    return _columns(
+        labels,
+        cumulative[ends + 1] - cumulative[starts],
+        cumulative_energy[ends + 1] - cumulative_energy[starts],
+        cumulative_reported[ends + 1] - cumulative_reported[starts]
+    )
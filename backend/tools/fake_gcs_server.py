@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Minimal local stand-in for Google Cloud Storage.
+
+Implements the slice of the JSON API the backend uses: bucket create/get,
+multipart and resumable uploads, object metadata, media download, ACL patch
+and delete, plus plain XML-style GET /<bucket>/<object> (what signed URLs
+resolve to; signatures are not checked). Object data is streamed to disk so
+the server's own memory stays flat. Point the SDK at it with
+STORAGE_EMULATOR_HOST:
+
+    python tools/fake_gcs_server.py --port 4443 --data-dir /tmp/fake-gcs
+    STORAGE_EMULATOR_HOST=http://127.0.0.1:4443 uvicorn server:app
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+COPY_BUFFER = 1024 * 1024
+
+
+class FakeStorage:
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.lock = threading.Lock()
+        self.buckets = {}     # name -> metadata
+        self.objects = {}     # (bucket, name) -> metadata
+        self.sessions = {}    # upload_id -> {"bucket", "name", "content_type", "path", "received"}
+        os.makedirs(data_dir, exist_ok=True)
+
+    def object_path(self, bucket: str, name: str) -> str:
+        return os.path.join(self.data_dir, hashlib.sha256(f"{bucket}/{name}".encode()).hexdigest())
+
+    def create_bucket(self, name: str) -> dict:
+        with self.lock:
+            return self.buckets.setdefault(name, {"kind": "storage#bucket", "id": name, "name": name})
+
+    def store_object(self, bucket: str, name: str, content_type: str, source_path: str) -> dict:
+        path = self.object_path(bucket, name)
+        os.replace(source_path, path)
+        now = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+        metadata = {
+            "kind": "storage#object",
+            "id": f"{bucket}/{name}",
+            "bucket": bucket,
+            "name": name,
+            "contentType": content_type or "application/octet-stream",
+            "size": str(os.path.getsize(path)),
+            "generation": str(int(datetime.now().timestamp() * 1e6)),
+            "timeCreated": now,
+            "updated": now,
+            "selfLink": f"/storage/v1/b/{bucket}/o/{quote(name, safe='')}",
+            "mediaLink": f"/download/storage/v1/b/{bucket}/o/{quote(name, safe='')}?alt=media"
+        }
+        with self.lock:
+            self.objects[(bucket, name)] = metadata
+        return metadata
+
+
+def make_handler(storage: FakeStorage):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        # Helpers
+        def send_json(self, status: int, body: dict, headers: dict = None):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def send_empty(self, status: int, headers: dict = None):
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+
+        def not_found(self):
+            self.send_json(404, {"error": {"code": 404, "message": "Not Found"}})
+
+        def body_length(self) -> int:
+            return int(self.headers.get("Content-Length") or 0)
+
+        def read_body(self) -> bytes:
+            return self.rfile.read(self.body_length())
+
+        def copy_body_to(self, target, length: int):
+            remaining = length
+            while remaining > 0:
+                block = self.rfile.read(min(COPY_BUFFER, remaining))
+                if not block:
+                    break
+                target.write(block)
+                remaining -= len(block)
+
+        def route(self):
+            url = urlparse(self.path)
+            return url.path, {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        def object_metadata(self, bucket: str, name: str):
+            with storage.lock:
+                return storage.objects.get((bucket, name))
+
+        def send_media(self, bucket: str, name: str):
+            metadata = self.object_metadata(bucket, name)
+            if not metadata:
+                return self.not_found()
+            self.send_response(200)
+            self.send_header("Content-Type", metadata["contentType"])
+            self.send_header("Content-Length", metadata["size"])
+            self.end_headers()
+            with open(storage.object_path(bucket, name), "rb") as source:
+                try:
+                    shutil.copyfileobj(source, self.wfile, COPY_BUFFER)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client stopped reading early
+
+        # Verbs
+        def do_GET(self):
+            path, query = self.route()
+            match = re.fullmatch(r"/storage/v1/b/([^/]+)/o/([^/]+)/acl", path)
+            if match:
+                metadata = self.object_metadata(match.group(1), unquote(match.group(2)))
+                return self.send_json(200, {"items": metadata.get("acl", [])}) if metadata else self.not_found()
+
+            match = re.fullmatch(r"/(?:download/)?storage/v1/b/([^/]+)/o/([^/]+)", path)
+            if match:
+                bucket, name = match.group(1), unquote(match.group(2))
+                if query.get("alt") == "media":
+                    return self.send_media(bucket, name)
+                metadata = self.object_metadata(bucket, name)
+                return self.send_json(200, metadata) if metadata else self.not_found()
+
+            match = re.fullmatch(r"/storage/v1/b/([^/]+)", path)
+            if match:
+                with storage.lock:
+                    bucket = storage.buckets.get(match.group(1))
+                return self.send_json(200, bucket) if bucket else self.not_found()
+
+            # XML API style object URL, e.g. a signed URL
+            match = re.fullmatch(r"/([^/]+)/(.+)", path)
+            if match:
+                return self.send_media(match.group(1), unquote(match.group(2)))
+            self.not_found()
+
+        def do_POST(self):
+            path, query = self.route()
+            if path == "/storage/v1/b":
+                return self.send_json(200, storage.create_bucket(json.loads(self.read_body())["name"]))
+
+            match = re.fullmatch(r"/upload/storage/v1/b/([^/]+)/o", path)
+            if not match:
+                return self.not_found()
+            bucket = match.group(1)
+
+            if query.get("uploadType") == "resumable":
+                metadata = json.loads(self.read_body() or b"{}")
+                upload_id = uuid.uuid4().hex
+                fd, temp_path = tempfile.mkstemp(dir=storage.data_dir)
+                os.close(fd)
+                storage.sessions[upload_id] = {
+                    "bucket": bucket,
+                    "name": metadata.get("name") or query.get("name"),
+                    "content_type": self.headers.get("X-Upload-Content-Type") or metadata.get("contentType"),
+                    "path": temp_path,
+                    "received": 0
+                }
+                location = f"http://{self.headers['Host']}/upload/storage/v1/b/{bucket}/o?uploadType=resumable&upload_id={upload_id}"
+                return self.send_empty(200, {"Location": location})
+
+            if query.get("uploadType") == "multipart":
+                # multipart/related: a JSON metadata part, then the media part
+                boundary = re.search(r'boundary="?([^";]+)"?', self.headers["Content-Type"]).group(1).encode()
+                parts = self.read_body().split(b"--" + boundary)
+                metadata_part, media_part = parts[1], parts[2]
+                metadata = json.loads(metadata_part.split(b"\r\n\r\n", 1)[1].strip())
+                media_headers, media = media_part.split(b"\r\n\r\n", 1)
+                content_type = re.search(rb"content-type:\s*([^\r\n]+)", media_headers, re.I)
+                fd, temp_path = tempfile.mkstemp(dir=storage.data_dir)
+                with os.fdopen(fd, "wb") as target:
+                    target.write(media[:-2] if media.endswith(b"\r\n") else media)
+                return self.send_json(200, storage.store_object(
+                    bucket, metadata["name"], content_type.group(1).decode() if content_type else None, temp_path
+                ))
+
+            # uploadType=media
+            fd, temp_path = tempfile.mkstemp(dir=storage.data_dir)
+            with os.fdopen(fd, "wb") as target:
+                self.copy_body_to(target, self.body_length())
+            self.send_json(200, storage.store_object(bucket, query["name"], self.headers.get("Content-Type"), temp_path))
+
+        def do_PUT(self):
+            path, query = self.route()
+            session = storage.sessions.get(query.get("upload_id", ""))
+            if not session:
+                return self.not_found()
+
+            length = self.body_length()
+            with open(session["path"], "ab") as target:
+                self.copy_body_to(target, length)
+            session["received"] += length
+
+            # "bytes 0-262143/*" while streaming, "bytes 262144-300000/300001" (or "bytes */N") at the end
+            content_range = self.headers.get("Content-Range", "")
+            total = content_range.rsplit("/", 1)[-1] if "/" in content_range else "*"
+            if total != "*" and session["received"] >= int(total):
+                del storage.sessions[query["upload_id"]]
+                return self.send_json(200, storage.store_object(
+                    session["bucket"], session["name"], session["content_type"], session["path"]
+                ))
+            headers = {"Range": f"bytes=0-{session['received'] - 1}"} if session["received"] else {}
+            self.send_empty(308, headers)
+
+        def do_PATCH(self):
+            path, _ = self.route()
+            match = re.fullmatch(r"/storage/v1/b/([^/]+)/o/([^/]+)", path)
+            metadata = self.object_metadata(match.group(1), unquote(match.group(2))) if match else None
+            if not metadata:
+                return self.not_found()
+            metadata.update(json.loads(self.read_body() or b"{}"))
+            self.send_json(200, metadata)
+
+        def do_DELETE(self):
+            path, _ = self.route()
+            match = re.fullmatch(r"/storage/v1/b/([^/]+)/o/([^/]+)", path)
+            if not match:
+                return self.not_found()
+            bucket, name = match.group(1), unquote(match.group(2))
+            with storage.lock:
+                metadata = storage.objects.pop((bucket, name), None)
+            if not metadata:
+                return self.not_found()
+            os.remove(storage.object_path(bucket, name))
+            self.send_empty(204)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start_fake_gcs(port: int = 0, data_dir: str = None, buckets=()):
+    """Run the server on a background thread; returns (server, storage). Port 0 picks a free port"""
+    storage = FakeStorage(data_dir or tempfile.mkdtemp(prefix="fake-gcs-"))
+    for bucket in buckets:
+        storage.create_bucket(bucket)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(storage))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Google Cloud Storage server")
+    parser.add_argument("--port", type=int, default=4443)
+    parser.add_argument("--data-dir", default=None, help="where object data is kept (default: a new temp dir)")
+    parser.add_argument("--bucket", action="append", default=[], help="bucket to create at startup (repeatable)")
+    args = parser.parse_args()
+
+    server, storage = start_fake_gcs(args.port, args.data_dir, args.bucket)
+    print(f"Fake GCS listening on http://127.0.0.1:{server.server_address[1]} (data in {storage.data_dir})", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
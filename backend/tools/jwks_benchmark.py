@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Offline auth latency benchmark.
+
+Starts a local stand-in for Clerk's JWKS endpoint (with optional artificial
+latency), points the API at it and reports p50/p99 latency of verify_token.
+
+    python tools/jwks_benchmark.py --requests 2000 --concurrency 50 --jwks-delay-ms 300
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+KID = "bench-key-1"
+
+
+def start_jwks_server(public_key, delay_ms: int):
+    """Serve a one-key JWKS document on a random local port"""
+    jwk = json.loads(RSAAlgorithm.to_jwk(public_key))
+    jwk.update({"kid": KID, "alg": "RS256", "use": "sig"})
+    body = json.dumps({"keys": [jwk]}).encode()
+    hits = {"count": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits["count"] += 1
+            time.sleep(delay_ms / 1000)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, hits
+
+
+def mint_tokens(private_key, count: int, unique: bool):
+    """Clerk-shaped session tokens; unique tokens defeat any verified-token cache"""
+    now = int(time.time())
+    tokens = []
+    for i in range(count if unique else 1):
+        payload = {
+            "sub": f"user_bench_{i % 50}",
+            "iat": now,
+            "exp": now + 3600,
+            "sid": str(uuid.uuid4()),
+        }
+        tokens.append(jwt.encode(payload, private_key, algorithm="RS256", headers={"kid": KID}))
+    return tokens if unique else tokens * count
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_benchmark(args, tokens, jwks_hits):
+    # Imported late so the API picks up the stand-in JWKS URL
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import server
+    from fastapi.security import HTTPAuthorizationCredentials
+
+    await server.jwks_key_store.start()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one(token):
+        async with semaphore:
+            started = time.perf_counter()
+            await server.verify_token(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(token) for token in tokens))
+    elapsed = time.perf_counter() - started
+    await server.jwks_key_store.stop()
+
+    print(f"requests:      {len(latencies)}")
+    print(f"concurrency:   {args.concurrency}")
+    print(f"jwks delay:    {args.jwks_delay_ms} ms")
+    print(f"jwks fetches:  {jwks_hits['count']}")
+    print(f"throughput:    {len(latencies) / elapsed:.0f} req/s")
+    print(f"p50:           {statistics.median(latencies):.3f} ms")
+    print(f"p99:           {percentile(latencies, 99):.3f} ms")
+    print(f"max:           {max(latencies):.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark verify_token against a local JWKS stand-in")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--jwks-delay-ms", type=int, default=200)
+    parser.add_argument("--same-token", action="store_true", help="reuse one token for every request")
+    args = parser.parse_args()
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwks_server, jwks_hits = start_jwks_server(private_key.public_key(), args.jwks_delay_ms)
+
+    os.environ["CLERK_JWKS_URL"] = f"http://127.0.0.1:{jwks_server.server_port}/.well-known/jwks.json"
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "jwks_benchmark")
+
+    tokens = mint_tokens(private_key, args.requests, unique=not args.same_token)
+    try:
+        asyncio.run(run_benchmark(args, tokens, jwks_hits))
+    finally:
+        jwks_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Test for the resumable carbon footprint recomputation jobs.
+
+Runs services.carbon_jobs against a throwaway database on MONGO_URL (default
+mongodb://localhost:27017) with a small chunk size and checks that:
+- a job stopped mid-run is continued by resume_recompute_jobs from its
+  checkpoint, ending with the right processed_clients and every footprint on
+  the job's factor version
+- a running job with a live heartbeat is left alone and taken over once the
+  heartbeat goes stale
+- a new job supersedes a running one, which stops at its next checkpoint
+The database is dropped afterwards.
+
+    python carbon_jobs_test.py [--db rota_crm_carbon_jobs_test]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+from services import carbon_jobs  # noqa: E402
+
+CLIENT_COUNT = 7
+CHUNK_SIZE = 2
+ELECTRICITY = 100.0
+
+
+class ChunkGate:
+    """Stands in for recompute_footprints; records each chunk and can hold the job before chunk `pause_at`"""
+
+    def __init__(self, real, pause_at=None):
+        self.real = real
+        self.pause_at = pause_at
+        self.chunks = []
+        self.paused = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def __call__(self, db, client_ids, years=None, factors_doc=None):
+        if len(self.chunks) == self.pause_at:
+            self.paused.set()
+            await self.release.wait()
+        self.chunks.append(list(client_ids))
+        await self.real(db, client_ids, years, factors_doc=factors_doc)
+
+    @property
+    def clients(self):
+        return [client_id for chunk in self.chunks for client_id in chunk]
+
+
+class CarbonJobsTester:
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.loop = asyncio.new_event_loop()
+        self.mongo = None
+        self.db = None
+        self.client_ids = [f"carbon-job-client-{i}" for i in range(CLIENT_COUNT)]
+        self.real_recompute = carbon_jobs.recompute_footprints
+
+    async def setup(self):
+        self.mongo = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+        await self.mongo.drop_database(self.db_name)
+        self.db = self.mongo[self.db_name]
+        await self.db.consumptions.insert_many([
+            {"id": f"{client_id}-{month}", "client_id": client_id, "year": 2024, "month": month,
+             "electricity": ELECTRICITY, "water": 0.0, "natural_gas": 0.0, "coal": 0.0, "accommodation_count": 10}
+            for client_id in self.client_ids for month in (1, 2, 3)
+        ])
+        carbon_jobs.FOOTPRINT_CHUNK_SIZE = CHUNK_SIZE
+        print(f"✅ Test database {self.db_name} ready with {CLIENT_COUNT} clients, chunks of {CHUNK_SIZE}")
+
+    async def new_job(self, electricity_factor):
+        factors = await carbon_jobs.create_factor_version(self.db, {"electricity": electricity_factor}, note="carbon_jobs_test")
+        return factors, await carbon_jobs.create_recompute_job(self.db, factors["version"], "carbon_jobs_test")
+
+    async def job(self, job_id):
+        return await self.db.carbon_jobs.find_one({"id": job_id}, {"_id": 0})
+
+    async def check_footprints(self, factors):
+        footprints = await self.db.carbon_footprints.find({}, {"_id": 0}).to_list(None)
+        assert len(footprints) == CLIENT_COUNT * 3, f"{len(footprints)} footprints, expected {CLIENT_COUNT * 3}"
+        stale = [f for f in footprints if f["factor_version"] != factors["version"]]
+        assert not stale, f"{len(stale)} footprints not on factor version {factors['version']}"
+        expected = ELECTRICITY * factors["factors"]["electricity"]
+        assert all(f["total_co2e_kg"] == expected for f in footprints), f"Footprints differ from {expected} kg"
+
+    async def check_resume_after_interruption(self):
+        factors, job = await self.new_job(0.5)
+        gate = ChunkGate(self.real_recompute, pause_at=2)
+        carbon_jobs.recompute_footprints = gate
+        task = asyncio.create_task(carbon_jobs.run_recompute_job(self.db, job["id"]))
+        await gate.paused.wait()
+        task.cancel()   # the process goes away between two chunks
+        await asyncio.gather(task, return_exceptions=True)
+
+        stopped = await self.job(job["id"])
+        assert stopped["status"] == "running", f"Interrupted job is {stopped['status']}"
+        assert stopped["processed_clients"] == 2 * CHUNK_SIZE, f"processed_clients {stopped['processed_clients']} at the interruption"
+        assert stopped["last_client_id"] == self.client_ids[2 * CHUNK_SIZE - 1], f"Checkpoint at {stopped['last_client_id']}"
+
+        # After a restart the heartbeat of the dead worker is old
+        await self.db.carbon_jobs.update_one(
+            {"id": job["id"]}, {"$set": {"updated_at": datetime.utcnow() - carbon_jobs.JOB_STALE_AFTER - timedelta(seconds=1)}}
+        )
+        gate = ChunkGate(self.real_recompute)
+        carbon_jobs.recompute_footprints = gate
+        await carbon_jobs.resume_recompute_jobs(self.db)
+
+        finished = await self.job(job["id"])
+        assert finished["status"] == "completed", f"Resumed job is {finished['status']}: {finished['error']}"
+        assert finished["processed_clients"] == finished["total_clients"] == CLIENT_COUNT, \
+            f"processed_clients {finished['processed_clients']} of {finished['total_clients']}"
+        assert gate.clients == self.client_ids[2 * CHUNK_SIZE:], f"Resume recomputed {gate.clients}"
+        await self.check_footprints(factors)
+        print("✅ An interrupted job resumes from its checkpoint and completes every client once")
+
+    async def check_stale_heartbeat_takeover(self):
+        carbon_jobs.JOB_STALE_AFTER = timedelta(seconds=1)
+        factors, job = await self.new_job(0.8)
+        # Another worker holds the job and has just sent a heartbeat
+        await self.db.carbon_jobs.update_one(
+            {"id": job["id"]}, {"$set": {"status": "running", "started_at": datetime.utcnow(), "updated_at": datetime.utcnow()}}
+        )
+        gate = ChunkGate(self.real_recompute)
+        carbon_jobs.recompute_footprints = gate
+
+        await carbon_jobs.run_recompute_job(self.db, job["id"])
+        assert not gate.chunks, "A job with a live heartbeat was claimed"
+
+        started = time.monotonic()
+        await carbon_jobs.resume_recompute_jobs(self.db)
+        waited = time.monotonic() - started
+        finished = await self.job(job["id"])
+        assert waited >= 0.9, f"Job taken over after {waited:.1f}s, before its heartbeat went stale"
+        assert finished["status"] == "completed" and finished["processed_clients"] == CLIENT_COUNT, finished
+        await self.check_footprints(factors)
+        print(f"✅ A live job is left alone; once its heartbeat is stale it is taken over ({waited:.1f}s)")
+
+    async def check_supersede(self):
+        old_factors, old_job = await self.new_job(1.5)
+        gate = ChunkGate(self.real_recompute, pause_at=1)
+        carbon_jobs.recompute_footprints = gate
+        task = asyncio.create_task(carbon_jobs.run_recompute_job(self.db, old_job["id"]))
+        await gate.paused.wait()
+
+        factors, job = await self.new_job(2.0)
+        gate.release.set()
+        await task
+
+        superseded = await self.job(old_job["id"])
+        assert superseded["status"] == "superseded", f"Old job is {superseded['status']}"
+        assert len(gate.chunks) == 2, f"Superseded job went on for {len(gate.chunks)} chunks"
+        assert superseded["processed_clients"] == CHUNK_SIZE, f"Superseded job checkpointed {superseded['processed_clients']} clients"
+
+        await carbon_jobs.run_recompute_job(self.db, job["id"])
+        finished = await self.job(job["id"])
+        assert finished["status"] == "completed" and finished["processed_clients"] == CLIENT_COUNT, finished
+        await self.check_footprints(factors)
+        print("✅ A new job supersedes the running one, which stops at its next checkpoint")
+
+    async def run(self):
+        await self.setup()
+        await self.check_resume_after_interruption()
+        await self.check_stale_heartbeat_takeover()
+        await self.check_supersede()
+
+    def run_all_tests(self):
+        try:
+            self.loop.run_until_complete(self.run())
+            print("\n=== TEST SUMMARY ===\n✅ Carbon jobs: Success")
+            return True
+        except AssertionError as e:
+            print(f"❌ {e}\n\n=== TEST SUMMARY ===\n❌ Carbon jobs: Failed")
+            return False
+        finally:
+            carbon_jobs.recompute_footprints = self.real_recompute
+            if self.mongo:
+                self.loop.run_until_complete(self.mongo.drop_database(self.db_name))
+                self.mongo.close()
+            self.loop.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check resume, takeover and supersede of carbon recomputation jobs")
+    parser.add_argument("--db", default="rota_crm_carbon_jobs_test", help="throwaway database, dropped afterwards")
+    args = parser.parse_args()
+    sys.exit(0 if CarbonJobsTester(args.db).run_all_tests() else 1)
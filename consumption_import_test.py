@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Test for the bulk consumption import (POST /api/consumptions/import).
+
+Runs the FastAPI app in-process against a throwaway database on MONGO_URL
+(default mongodb://localhost:27017) with the declared indexes, as an admin,
+and checks the per-row created/updated/error results and the summary counts
+for a batch that partly fails (unknown client, duplicates within the batch,
+invalid rows), a re-import that updates, and a CSV body with empty cells.
+The database is dropped afterwards.
+
+    python consumption_import_test.py [--db rota_crm_import_test]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+
+FIELDS = ["electricity", "water", "natural_gas", "coal", "accommodation_count"]
+
+
+def test_client(name):
+    return {
+        "id": str(uuid.uuid4()),
+        "name": name,
+        "hotel_name": f"{name} Hotel",
+        "contact_person": "Test Kişi",
+        "email": "test@example.com",
+        "phone": "+90 242 000 0000",
+        "address": "Antalya, Türkiye",
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
+    }
+
+
+def row(client_id, month, electricity=1000.0, **overrides):
+    return {"client_id": client_id, "year": 2024, "month": month, "electricity": electricity,
+            "water": 50.0, "natural_gas": 20.0, "coal": 0.0, "accommodation_count": 300, **overrides}
+
+
+class ConsumptionImportTester:
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.loop = asyncio.new_event_loop()
+        self.server = None
+        self.http = None
+        self.clients = [test_client("Import A"), test_client("Import B")]
+
+    def setup(self):
+        os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+        os.environ["DB_NAME"] = self.db_name
+        sys.path.insert(0, str(BACKEND_DIR))
+        import httpx
+        import server
+        from services.indexes import ensure_indexes
+
+        self.server = server
+        admin = server.User(clerk_user_id="import_test_admin", email="admin@example.com", name="Import Test", role=server.UserRole.ADMIN)
+        server.app.dependency_overrides[server.get_current_user] = lambda: admin
+        self.http = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test")
+
+        self.loop.run_until_complete(server.db.client.drop_database(self.db_name))
+        self.loop.run_until_complete(ensure_indexes(server.db))
+        self.loop.run_until_complete(server.db.clients.insert_many([dict(client) for client in self.clients]))
+        print(f"✅ Test database {self.db_name} ready with {len(self.clients)} clients")
+
+    def post(self, content, content_type="application/json"):
+        response = self.loop.run_until_complete(
+            self.http.post("/api/consumptions/import", content=content, headers={"Content-Type": content_type})
+        )
+        assert response.status_code == 200, f"Import returned {response.status_code}: {response.text}"
+        return response.json()
+
+    def post_json(self, rows):
+        return self.post(json.dumps(rows))
+
+    def stored(self, client_id, month):
+        return self.loop.run_until_complete(
+            self.server.db.consumptions.find_one({"client_id": client_id, "year": 2024, "month": month})
+        )
+
+    def count(self, query=None):
+        return self.loop.run_until_complete(self.server.db.consumptions.count_documents(query or {}))
+
+    def check_partial_failure(self):
+        a, b = self.clients[0]["id"], self.clients[1]["id"]
+        rows = [
+            row(a, 1),                                   # 0 created
+            row(b, 1),                                   # 1 created
+            row(a, 1, electricity=9999.0),               # 2 duplicate of row 0 in this batch
+            row(str(uuid.uuid4()), 1),                   # 3 unknown client
+            row(a, 13),                                  # 4 month out of range
+            row(a, 2, accommodation_count=-5),           # 5 negative accommodation
+            row(a, 3, electricity="lots"),               # 6 not a number
+            "not an object",                             # 7 not a row at all
+            row(a, 4),                                   # 8 created after the failures
+        ]
+        result = self.post_json(rows)
+        statuses = [entry["status"] for entry in result["results"]]
+        assert statuses == ["created", "created", "error", "error", "error", "error", "error", "error", "created"], f"Statuses: {statuses}"
+        assert [entry["row"] for entry in result["results"]] == list(range(len(rows))), "Results must follow the input order"
+        assert "Duplicate" in result["results"][2]["error"], result["results"][2]
+        assert result["results"][3]["error"] == "Client not found", result["results"][3]
+        assert all(result["results"][i].get("error") for i in range(2, 8)), "Every failed row needs an error message"
+        assert result["summary"] == {"total": 9, "created": 3, "updated": 0, "error": 6}, f"Summary: {result['summary']}"
+
+        assert self.count() == 3, f"{self.count()} rows stored, expected 3"
+        assert self.stored(a, 1)["electricity"] == 1000.0, "The first of two duplicate rows must be the one written"
+        assert self.stored(a, 2) is None and self.stored(a, 3) is None, "Invalid rows must not be written"
+        print("✅ Partial failure: valid rows written, each failed row reported with its error")
+
+    def check_reimport_updates(self):
+        a = self.clients[0]["id"]
+        result = self.post_json([row(a, 1, electricity=1500.0), row(a, 5)])
+        assert [entry["status"] for entry in result["results"]] == ["updated", "created"], result["results"]
+        assert result["summary"] == {"total": 2, "created": 1, "updated": 1, "error": 0}, f"Summary: {result['summary']}"
+        assert self.stored(a, 1)["electricity"] == 1500.0, "Re-imported month was not updated"
+        assert self.count({"client_id": a, "year": 2024, "month": 1}) == 1, "Re-import must not duplicate the month"
+        print("✅ Re-import updates existing months in place")
+
+    def check_csv_empty_cells(self):
+        b = self.clients[1]["id"]
+        csv_body = "\n".join([
+            "client_id,year,month," + ",".join(FIELDS),
+            f"{b},2024,6,2000,,15,,400",          # empty water and coal
+            f"{b},2024,7,,,,,",                   # every measure empty
+            f"{b},2024,,100,1,1,1,1",             # month missing
+        ]).encode()
+        result = self.post(csv_body, "text/csv")
+        assert [entry["status"] for entry in result["results"]] == ["created", "created", "error"], result["results"]
+        assert result["summary"] == {"total": 3, "created": 2, "updated": 0, "error": 1}, f"Summary: {result['summary']}"
+        june, july = self.stored(b, 6), self.stored(b, 7)
+        assert (june["electricity"], june["water"], june["coal"], june["accommodation_count"]) == (2000.0, 0.0, 0.0, 400), june
+        assert all(july[field] == 0 for field in FIELDS), july
+        print("✅ CSV empty cells fall back to 0, a missing month is reported")
+
+    def check_rollups(self):
+        a = self.clients[0]["id"]
+        rollup = self.loop.run_until_complete(self.server.db.consumption_rollups.find_one({"client_id": a, "year": 2024}))
+        assert rollup and rollup["totals"]["electricity"] == 1500.0 + 1000.0 + 1000.0, f"Rollup not refreshed: {rollup and rollup['totals']}"
+        print("✅ Rollups reflect the imported months")
+
+    def run_all_tests(self):
+        try:
+            self.setup()
+            self.check_partial_failure()
+            self.check_reimport_updates()
+            self.check_csv_empty_cells()
+            self.check_rollups()
+            print("\n=== TEST SUMMARY ===\n✅ Consumption import: Success")
+            return True
+        except AssertionError as e:
+            print(f"❌ {e}\n\n=== TEST SUMMARY ===\n❌ Consumption import: Failed")
+            return False
+        finally:
+            if self.server:
+                self.loop.run_until_complete(self.http.aclose())
+                self.loop.run_until_complete(self.server.db.client.drop_database(self.db_name))
+            self.loop.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check per-row results and summaries of the bulk consumption import")
+    parser.add_argument("--db", default="rota_crm_import_test", help="throwaway database, dropped afterwards")
+    args = parser.parse_args()
+    sys.exit(0 if ConsumptionImportTester(args.db).run_all_tests() else 1)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Acceptance test for streamed document uploads.
+
+Starts backend/tools/fake_gcs_server.py on a free port, points the storage
+service at it through STORAGE_EMULATOR_HOST and uploads files of growing size
+with upload_stream of the chosen backend (GCS_BACKEND: sdk or httpx). The traced peak of Python allocations
+during each upload must stay within a few upload parts and must not grow with
+the file size. Every object is downloaded again and compared by SHA-256,
+then read back through metadata and a signed URL (the plain object URL on
+the keyless emulator, which has no key to sign with) and deleted.
+
+    python gcs_streaming_upload_test.py [--backend sdk|httpx] [--sizes-mb 16 64 256]
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+BUCKET = "rota-crm-streaming-test"
+MB = 1024 * 1024
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def write_random_file(path: str, size: int) -> str:
+    """Write `size` pseudo-random bytes in 1MB blocks; returns the SHA-256"""
+    digest = hashlib.sha256()
+    block = os.urandom(MB)
+    with open(path, "wb") as f:
+        for i in range(0, size, MB):
+            part = (block[i // MB % 256:] + block[:i // MB % 256])[:min(MB, size - i)]
+            digest.update(part)
+            f.write(part)
+    return digest.hexdigest()
+
+
+class StreamingUploadTester:
+    def __init__(self, backend, sizes_mb):
+        self.backend = backend
+        self.sizes_mb = sizes_mb
+        self.loop = asyncio.new_event_loop()
+        self.work_dir = tempfile.mkdtemp(prefix="gcs-streaming-")
+        self.port = free_port()
+        self.server = None
+        self.gcs = None
+        self.results = []
+
+    def start_fake_gcs(self):
+        self.server = subprocess.Popen(
+            [sys.executable, str(BACKEND_DIR / "tools" / "fake_gcs_server.py"),
+             "--port", str(self.port), "--data-dir", os.path.join(self.work_dir, "objects"), "--bucket", BUCKET],
+            stdout=subprocess.DEVNULL
+        )
+        for _ in range(50):
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{self.port}/storage/v1/b/{BUCKET}")
+                print(f"✅ Fake GCS running on port {self.port}")
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError("Fake GCS server did not start")
+
+    def init_service(self):
+        os.environ["STORAGE_EMULATOR_HOST"] = f"http://127.0.0.1:{self.port}"
+        os.environ["GCS_BUCKET_NAME"] = BUCKET
+        os.environ["GCS_BACKEND"] = self.backend
+        os.environ["GCS_CREDENTIALS_PATH"] = os.path.join(self.work_dir, "no-credentials.json")
+        sys.path.insert(0, str(BACKEND_DIR))
+        from services import gcs
+        self.gcs = gcs
+        self.service = gcs.gcs_service
+        print(f"✅ {type(self.service).__name__} ready, upload part size {gcs.GCS_UPLOAD_CHUNK_SIZE // MB}MB")
+
+    def download_sha256(self, blob_name: str) -> str:
+        digest = hashlib.sha256()
+        url = f"http://127.0.0.1:{self.port}/download/storage/v1/b/{BUCKET}/o/{urllib.request.quote(blob_name, safe='')}?alt=media"
+        with urllib.request.urlopen(url) as response:
+            for block in iter(lambda: response.read(MB), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def upload(self, size_mb: int):
+        path = os.path.join(self.work_dir, f"upload_{size_mb}mb.pdf")
+        expected = write_random_file(path, size_mb * MB)
+
+        tracemalloc.start()
+        started = time.time()
+        with open(path, "rb") as f:
+            result = self.loop.run_until_complete(self.service.upload_stream(f, filename=os.path.basename(path)))
+        seconds = time.time() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        os.remove(path)
+
+        if result.get("mock"):
+            raise AssertionError(f"Upload fell back to mock mode: {result.get('error')}")
+        assert result["file_size"] == size_mb * MB, f"file_size {result['file_size']} != {size_mb * MB}"
+        assert self.download_sha256(result["file_path"]) == expected, "Stored object differs from the uploaded file"
+
+        self.results.append({"size_mb": size_mb, "peak_mb": peak / MB, "seconds": seconds, "file_path": result["file_path"]})
+        print(f"✅ {size_mb:>5}MB uploaded in {seconds:.1f}s, peak traced memory {peak / MB:.1f}MB")
+
+    def check_memory(self):
+        part_mb = self.gcs.GCS_UPLOAD_CHUNK_SIZE / MB
+        limit_mb = 3 * part_mb + 8
+        peaks = [result["peak_mb"] for result in self.results]
+        assert max(peaks) <= limit_mb, f"Peak {max(peaks):.1f}MB exceeds {limit_mb:.0f}MB for {part_mb:.0f}MB parts"
+        # Files up to one part go up in a single request; from there on the largest file may not
+        # need noticeably more memory than the smallest one
+        resumable = [result["peak_mb"] for result in self.results if result["size_mb"] >= part_mb]
+        if len(resumable) > 1:
+            assert resumable[-1] <= resumable[0] + part_mb, f"Peak grew with file size: {resumable}"
+        print(f"✅ Peak memory bounded (≤ {limit_mb:.0f}MB) and flat across {self.sizes_mb} MB uploads")
+
+    def check_lifecycle(self):
+        blob_name, size = self.results[-1]["file_path"], self.results[-1]["size_mb"] * MB
+        metadata = self.loop.run_until_complete(self.service.get_metadata(blob_name))
+        assert metadata and int(metadata["size"]) == size, f"Unexpected metadata: {metadata}"
+
+        signed_url = self.loop.run_until_complete(self.service.get_signed_url(blob_name))
+        if self.service.can_sign:
+            assert "X-Goog-Signature=" in signed_url, f"URL is not signed: {signed_url}"
+        else:
+            # The fake server runs without a service-account key, so there is nothing to sign with
+            assert "X-Goog-Signature=" not in signed_url, f"Keyless backend produced a signature: {signed_url}"
+            print("⏭️  Signature check skipped on the keyless emulator; the plain object URL is checked instead")
+        with urllib.request.urlopen(signed_url.replace("https://storage.googleapis.com", f"http://127.0.0.1:{self.port}")) as response:
+            assert len(response.read(MB)) == min(size, MB), "Signed URL did not serve the object"
+
+        assert self.loop.run_until_complete(self.service.delete_file(blob_name)), "Delete failed"
+        assert self.loop.run_until_complete(self.service.get_metadata(blob_name)) is None, "Object still exists after delete"
+        print("✅ Metadata, object URL and delete work")
+
+    def run_all_tests(self):
+        try:
+            self.start_fake_gcs()
+            self.init_service()
+            for size_mb in self.sizes_mb:
+                self.upload(size_mb)
+            self.check_memory()
+            self.check_lifecycle()
+            print("\n=== TEST SUMMARY ===\n✅ Streaming upload: Success")
+            return True
+        except AssertionError as e:
+            print(f"❌ {e}\n\n=== TEST SUMMARY ===\n❌ Streaming upload: Failed")
+            return False
+        finally:
+            self.loop.run_until_complete(self.service.close()) if self.gcs else None
+            self.loop.close()
+            if self.server:
+                self.server.terminate()
+                self.server.wait()
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that GCS uploads stream with bounded memory")
+    parser.add_argument("--backend", choices=["sdk", "httpx"], default="sdk")
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[16, 64, 256])
+    args = parser.parse_args()
+    tester = StreamingUploadTester(args.backend, sorted(args.sizes_mb))
+    sys.exit(0 if tester.run_all_tests() else 1)